@@ -1,5 +1,8 @@
 # build_reference_stats.py
-import pandas as pd, numpy as np, pickle, os
+import pandas as pd, numpy as np, pickle, os, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from smartloan_agent.covariance_drift import accumulate_frame
 
 TRAIN = "X_train_1.csv"
 OUT   = "monitor/reference_stats.pkl"
@@ -8,9 +11,10 @@ NUM_FEATURES = [
     "log_loan_amnt","log_annual_inc","credit_history_length"
 ]
 N_BINS = 20  # 夠簡單、穩定
+N_QUANTILES = 101  # reference quantile grid for KS / Wasserstein drift (W1 uses 1%..99% only)
 
 df = pd.read_csv(TRAIN)
-ref = {"features": {}}
+ref = {"features": {}, "columns": list(df.columns)}  # column list = DQ schema reference
 
 for col in NUM_FEATURES:
     if col not in df.columns: continue
@@ -30,10 +34,14 @@ for col in NUM_FEATURES:
         "p25": float(s.quantile(0.25)), "p50": float(s.quantile(0.50)),
         "p75": float(s.quantile(0.75)), "p95": float(s.quantile(0.95)),
         "p99": float(s.quantile(0.99)),
+        "quantiles": s.quantile(np.linspace(0, 1, N_QUANTILES)).tolist(),
         "bins": bins.tolist(),
         "counts": counts.tolist(),
     }
 
+# mean vector + covariance for joint (correlation / Mahalanobis) drift
+ref["joint"] = accumulate_frame(df, [c for c in NUM_FEATURES if c in df.columns]).to_dict()
+
 os.makedirs("monitor", exist_ok=True)
 with open(OUT, "wb") as f:
     pickle.dump(ref, f)
@@ -7,11 +7,16 @@
 # Output:
 #   reports/compliance_report_YYYYMMDD_HHMM.md
 
-import os, json, yaml, argparse
+import os, sys, json, yaml, argparse
 import pandas as pd
 from datetime import datetime
 from jinja2 import Environment, FileSystemLoader
 
+# Add repo root to path to import the shared helpers in smartloan_agent
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from smartloan_agent.compliance_rules import score_context, dq_context, anomaly_context
+
 # ---------- tiny helpers ----------
 def f2(x):
     """Safe float: return None for NaN/invalid."""
@@ -29,7 +34,12 @@ def read_latest_row(csv_path):
 def read_thresholds(yaml_path):
     with open(yaml_path, "r", encoding="utf-8") as f:
         c = yaml.safe_load(f) or {}
+    cal = c.get("calibration") or {}
     return {
+        "score_psi_warn":  cal.get("score_psi_warn", 0.10),
+        "score_psi_alert": cal.get("score_psi_alert", 0.25),
+        "hl_pvalue":       cal.get("hl_pvalue_alert", 0.05),
+        "calib_gap":       cal.get("calib_gap_alert", 0.05),
         "psi_warn":  c.get("psi_threshold_warn", 0.10),
         "psi_alert": c.get("psi_threshold_alert", 0.20),
         "auc_drop":  c.get("auc_drop_alert", 0.05),
@@ -44,6 +54,10 @@ def build_flags(m, th):
         "missing_rate_alert": (f2(m.get("max_missing_rate")) is not None and f2(m.get("max_missing_rate")) > th["miss_rate"]),
         "psi_alert":          (f2(m.get("psi_max_value"))   is not None and f2(m.get("psi_max_value"))   > th["psi_alert"]),
         "psi_warn":           (f2(m.get("psi_max_value"))   is not None and th["psi_warn"] < f2(m.get("psi_max_value")) <= th["psi_alert"]),
+        "score_psi_alert":    (f2(m.get("score_psi"))       is not None and f2(m.get("score_psi"))       > th["score_psi_alert"]),
+        "score_psi_warn":     (f2(m.get("score_psi"))       is not None and th["score_psi_warn"] < f2(m.get("score_psi")) <= th["score_psi_alert"]),
+        "calib_alert":        ((f2(m.get("hl_pvalue"))      is not None and f2(m.get("hl_pvalue"))       < th["hl_pvalue"])
+                               or (f2(m.get("calib_gap"))   is not None and abs(f2(m.get("calib_gap")))  > th["calib_gap"])),
     }
 
 
@@ -68,6 +82,11 @@ def make_summary(m, flg, th):
         s.append(f"Moderate drift on '{feat}' (PSI={psi}); continue to observe trend.")
     else:
         s.append("No material drift detected across monitored features.")
+    # Score & calibration
+    if flg["score_psi_alert"]:
+        s.append(f"The PD score distribution has shifted materially (score PSI={m.get('score_psi')}).")
+    if flg["calib_alert"]:
+        s.append(f"Predicted PDs no longer match observed default rates (HL p={m.get('hl_pvalue')}).")
     # Missing data
     if flg["missing_rate_alert"]:
         s.append(f"Missing data exceeds the threshold on '{m.get('max_missing_feature','N/A')}' (rate={m.get('max_missing_rate')}); please review the ETL mapping.")
@@ -79,7 +98,7 @@ def make_summary(m, flg, th):
         s.append(f"Fairness checks across {groups} meet the commonly used 80% rule; no evidence of direct discrimination under the Equality Act 2010.")
     else:
         s.append(f"Potential disparity observed across {groups}; please review for indirect discrimination risk.")
-    return " ".join(s[:6])  # keep it short
+    return " ".join(s[:8])  # keep it short
 
 def make_actions(flg, m):
     items = ["Continue daily monitoring."]
@@ -87,6 +106,8 @@ def make_actions(flg, m):
         items.append(f"Track PSI on '{m.get('psi_max_feature','key feature')}' for 7–14 days and review sensitivity/SHAP if drift persists.")
     if flg["auc_drop_alert"] or flg["ks_drop_alert"]:
         items.append("Review model calibration and prepare a targeted retraining set.")
+    if flg["calib_alert"]:
+        items.append("Review observed vs expected default rates by decile; consider PD recalibration for IFRS 9.")
     if flg["missing_rate_alert"]:
         items.append("Investigate upstream ETL or schema changes causing missing data.")
     if str(m.get("pass_80_rule", True)).lower() not in {"true","1","yes"}:
@@ -144,7 +165,6 @@ def main():
         "psi_max_value":    m.get("psi_max_value","N/A"), 
         # Drift & DQ
         "top_drift": json.loads(m.get("top_drift_json","[]") or "[]"),
-        "dq_notes":  m.get("dq_notes","No unusual ETL/schema issues observed."),
         # Fairness & governance
         "fairness_groups": m.get("fairness_groups","income_group, addr_state"),
         "pass_80_rule":    m.get("pass_80_rule", True),
@@ -159,6 +179,10 @@ def main():
         "next_review": m.get("next_review","Quarterly model committee (scheduled)"),
         # Actions
         "actions": actions,
+        # Score stability & calibration
+        **score_context(m, th, flg),
+        **dq_context(m),
+        **anomaly_context(m),
     }
 
     render(args.template, context, args.out_dir)
@@ -5,9 +5,25 @@ import numpy as np
 import pandas as pd
 import yaml
 from datetime import datetime
-from sklearn.metrics import roc_auc_score
 import csv
 
+# Add repo root to path to import the shared engines in smartloan_agent
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from smartloan_agent.drift_engine import feature_drift_table, summarize_drift
+from smartloan_agent.drift_metrics import drift_metric_config
+from smartloan_agent.dq_engine import dq_report, load_dq_config
+from smartloan_agent.missingness_engine import missingness_profile, load_missingness_config
+from smartloan_agent.covariance_drift import covariance_drift, load_covariance_config
+from smartloan_agent.anomaly_engine import anomaly_stage, load_anomaly_config
+from smartloan_agent.reference_engine import reference_drift, load_reference_config
+from smartloan_agent.perf_engine import model_metrics, load_score_reference
+from smartloan_agent.attribution_drift import attribution_drift, load_attribution_config
+from smartloan_agent.segment_drift import segment_drift, load_segment_config
+from smartloan_agent.explanation_store import store_batch_explanations, load_store_config
+from smartloan_agent.scoring_engine import ScoringEngine, score_batch, load_scoring_config
+from smartloan_agent.label_engine import snapshot_batch, load_label_config
+
 print("[DEBUG] Python:", sys.executable)
 print("[DEBUG] CWD:", os.getcwd())
 
@@ -17,6 +33,10 @@ DEFAULT_BATCH = "monitor/X_new.csv"
 FEAT_OUT = "monitor/metrics_log.csv"
 BATCH_OUT = "monitor/batch_metrics_log.csv"
 PERF_PATH = "monitor/perf_latest.csv"
+ATTR_OUT = "monitor/attribution_log.csv"
+MODEL_OUT = "monitor/model_metrics_log.csv"
+SEG_OUT = "monitor/segment_drift_log.csv"
+REFS_OUT = "monitor/reference_psi_log.csv"
 
 def load_yaml(path):
     with open(path, "r", encoding="utf-8") as f:
@@ -30,9 +50,23 @@ def safe_float(x):
     except Exception:
         return None
 
-def write_append_one_row(out_csv, row_dict):
+def write_append_rows(out_csv, rows):
+    """
+    Append rows to a CSV log. If the rows bring new columns, the file is
+    rewritten once with the widened header (old rows get empty cells).
+    """
     os.makedirs(os.path.dirname(out_csv), exist_ok=True)
-    df_row = pd.DataFrame([row_dict])
+    df_row = pd.DataFrame(rows)
+
+    if os.path.exists(out_csv):
+        old_cols = list(pd.read_csv(out_csv, nrows=0, encoding="utf-8-sig").columns)
+        new_cols = [c for c in df_row.columns if c not in old_cols]
+        if new_cols:
+            old = pd.read_csv(out_csv, encoding="utf-8-sig", dtype=str, keep_default_na=False)
+            df_row = pd.concat([old, df_row], ignore_index=True)[old_cols + new_cols]
+            os.remove(out_csv)
+        else:
+            df_row = df_row.reindex(columns=old_cols)
 
     mode = "a" if os.path.exists(out_csv) else "w"
     header = not os.path.exists(out_csv)
@@ -47,62 +81,27 @@ def write_append_one_row(out_csv, row_dict):
         lineterminator="\n"
     )
 
-def calculate_psi(series, bins, expected_counts):
-    s = pd.to_numeric(series, errors="coerce").replace([np.inf, -np.inf], np.nan).dropna()
-    if s.empty or bins is None or expected_counts is None:
-        return np.nan
-    bins = np.asarray(bins, dtype=float)
-    exp = np.asarray(expected_counts, dtype=float)
-    if exp.size != bins.size - 1:
-        return np.nan
-    new_counts, _ = np.histogram(s.values, bins=bins)
-    new_pct = new_counts / max(new_counts.sum(), 1)
-    exp_pct = exp / max(exp.sum(), 1)
-    new_pct = np.where(new_pct == 0, 1e-8, new_pct)
-    exp_pct = np.where(exp_pct == 0, 1e-8, exp_pct)
-    return float(np.sum((new_pct - exp_pct) * np.log(new_pct / exp_pct)))
-
-def compute_auc_ks(df, y_col="label", p_col="score"):
+def write_append_one_row(out_csv, row_dict):
+    write_append_rows(out_csv, [row_dict])
+
+def model_specs(cfg):
     """
-    Compute AUC and KS from DataFrame with labels and predictions.
-    Returns (auc, ks) or (None, None) if computation fails.
+    Models monitored in this run. `monitored_models:` lists one entry per
+    score column / model version (the first one is the champion); without it
+    the single labels.p_col + model_version setup is used.
     """
-    try:
-        if y_col not in df.columns or p_col not in df.columns:
-            print(f"[WARN] Missing columns: y_col='{y_col}' or p_col='{p_col}'")
-            return None, None
-        
-        # Convert to numeric and drop missing
-        y = pd.to_numeric(df[y_col], errors="coerce")
-        p = pd.to_numeric(df[p_col], errors="coerce")
-        mask = (~y.isna()) & (~p.isna())
-        y, p = y[mask].values, p[mask].values
-        
-        if len(y) < 5:
-            print(f"[WARN] Insufficient valid rows: {len(y)}")
-            return None, None
-        
-        if len(np.unique(y)) < 2:
-            print(f"[WARN] Need at least 2 classes, found: {np.unique(y)}")
-            return None, None
-        
-        # Compute AUC
-        auc = float(roc_auc_score(y, p))
-        
-        # Compute KS
-        tmp = pd.DataFrame({"y": y, "p": p}).sort_values("p")
-        denom_good = max(1, (1 - tmp["y"]).sum())
-        denom_bad = max(1, tmp["y"].sum())
-        tmp["cum_good"] = (1 - tmp["y"]).cumsum() / denom_good
-        tmp["cum_bad"] = tmp["y"].cumsum() / denom_bad
-        ks = float(np.max(np.abs(tmp["cum_bad"] - tmp["cum_good"])))
-        
-        print(f"[OK] Computed AUC={auc:.4f}, KS={ks:.4f}")
-        return auc, ks
-    
-    except Exception as e:
-        print(f"[ERROR] AUC/KS computation failed: {e}")
-        return None, None
+    labels_cfg = cfg.get("labels") or {}
+    default = {
+        "model_version": cfg.get("model_version", "v1.0"),
+        "p_col": labels_cfg.get("p_col", "score"),
+    }
+    specs = []
+    for m in cfg.get("monitored_models") or [default]:
+        spec = {**default, **m}
+        spec["model_version"] = str(spec["model_version"])
+        spec["baseline"] = m.get("baseline") or cfg.get("baseline") or {}
+        specs.append(spec)
+    return specs
 
 def main(batch_csv):
     print(f"[DEBUG] exists({REF_PATH}) =", pathlib.Path(REF_PATH).exists())
@@ -114,6 +113,10 @@ def main(batch_csv):
     with open(REF_PATH, "rb") as f:
         ref = pickle.load(f)
     
+    # === SCORING (optional: write `score` with the pinned model first) ===
+    if load_scoring_config(CFG_PATH).get("enabled"):
+        score_batch(batch_csv, cfg_path=CFG_PATH)
+
     df_new = pd.read_csv(batch_csv).replace([np.inf, -np.inf], np.nan)
 
     ref_stats = ref["features"] if (isinstance(ref, dict) and "features" in ref) else ref
@@ -125,101 +128,221 @@ def main(batch_csv):
         return
 
     # === FEATURE-LEVEL PSI & DRIFT ===
-    rows = []
-    for col in common:
-        base = ref_stats.get(col, {})
-        base_mean = base.get("mean", np.nan)
-
-        s = pd.to_numeric(df_new[col], errors="coerce")
-        miss_rate = float(pd.isna(s).mean())
-        mean_diff = float(s.mean() - base_mean) if pd.notna(base_mean) else np.nan
-
-        bins, counts = base.get("bins"), base.get("counts")
-        t = str(base.get("type", "")).lower()
-        is_num = (t in ("numeric", "numerical")) or (bins is not None and counts is not None)
-
-        psi = calculate_psi(s, bins, counts) if is_num else np.nan
-        rows.append({
-            "feature": col,
-            "psi": psi,
-            "missing_rate_new": miss_rate,
-            "mean_diff": mean_diff
-        })
+    bin_counts = {}
+    feat_df = feature_drift_table(df_new, ref_stats, drift_metric_config(cfg), bin_counts)
+    batch_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    # === DATA QUALITY (column checks came with the drift pass) ===
+    dq = {"dq_notes": cfg.get("dq_notes", "No unusual ETL/schema issues observed.")}
+    dq_cfg = load_dq_config(CFG_PATH)
+    if dq_cfg.get("enabled", True):
+        try:
+            dq = dq_report(feat_df, df_new, dq_cfg, ref.get("columns") if isinstance(ref, dict) else None)
+            print(f"[OK] data quality: {dq['dq_status']} — {dq['dq_notes']}")
+        except Exception as e:
+            print(f"[WARN] data-quality checks failed: {e}")
+
+    # === MISSINGNESS PATTERNS (bit-packed null masks, co-missingness) ===
+    miss_summary = {}
+    miss_cfg = load_missingness_config(CFG_PATH)
+    if miss_cfg.get("enabled", True):
+        try:
+            miss_summary = missingness_profile(df_new, miss_cfg)
+            print(f"[OK] missingness: {miss_summary['miss_pattern_count']} pattern(s), "
+                  f"{miss_summary['miss_complete_rate']:.1%} complete rows, "
+                  f"pattern PSI={miss_summary['miss_pattern_psi']}")
+        except Exception as e:
+            print(f"[WARN] missingness profile failed: {e}")
+
+    # === JOINT DRIFT (correlation matrix, Mahalanobis mean shift) ===
+    joint_summary = {}
+    cov_cfg = load_covariance_config(CFG_PATH)
+    if cov_cfg.get("enabled", True):
+        try:
+            joint_summary = covariance_drift(df_new, ref, cov_cfg)
+            if joint_summary:
+                print(f"[OK] joint drift: {joint_summary['joint_level']} "
+                      f"(corr Frobenius={joint_summary['corr_frobenius']:.4f}, "
+                      f"Mahalanobis d={joint_summary['mahalanobis_d']:.4f})")
+        except Exception as e:
+            print(f"[WARN] joint drift failed: {e}")
+            joint_summary = {}
+
+    # === ROW-LEVEL ANOMALIES (persisted model, chunks on a process pool) ===
+    anomaly_summary = {}
+    an_cfg = load_anomaly_config(CFG_PATH)
+    if an_cfg.get("enabled", True):
+        try:
+            anomaly_summary = anomaly_stage(df_new, an_cfg)
+            if anomaly_summary:
+                print(f"[OK] anomalies: {anomaly_summary['anomaly_count']} rows "
+                      f"({anomaly_summary['anomaly_rate']:.2%}, {anomaly_summary['anomaly_level']})")
+        except Exception as e:
+            print(f"[WARN] anomaly stage failed: {e}")
+            anomaly_summary = {}
+
+    # === MULTI-REFERENCE PSI (training / trailing windows / pinned, same bins) ===
+    refs_summary = {}
+    refs_cfg = load_reference_config(CFG_PATH)
+    if refs_cfg.get("enabled", True):
+        try:
+            refs_table, refs_summary = reference_drift(batch_time, bin_counts, ref_stats, refs_cfg, CFG_PATH)
+            if not refs_table.empty:
+                write_append_rows(REFS_OUT, refs_table.assign(batch_time=batch_time).to_dict("records"))
+                print(f"[OK] reference PSI → {REFS_OUT} ({', '.join(refs_table['reference'].unique())}; "
+                      f"pattern: {refs_summary['drift_pattern']})")
+        except Exception as e:
+            print(f"[WARN] multi-reference drift failed: {e}")
+            refs_summary = {}
+
+    # === ATTRIBUTION DRIFT (mean |SHAP| share vs reference) ===
+    attr_summary = {}
+    attr_cfg = load_attribution_config(CFG_PATH)
+    if attr_cfg.get("enabled", True):
+        try:
+            attr_table, attr_summary = attribution_drift(df_new, attr_cfg, CFG_PATH)
+        except Exception as e:
+            print(f"[WARN] attribution drift failed: {e}")
+            attr_table, attr_summary = None, None
+        if attr_table is not None:
+            feat_df = feat_df.merge(
+                attr_table[["feature", "share_ref", "share_new", "share_diff"]].rename(columns={
+                    "share_ref": "attr_share_ref",
+                    "share_new": "attr_share_new",
+                    "share_diff": "attr_share_diff",
+                }),
+                on="feature", how="left"
+            )
+            write_append_rows(ATTR_OUT, attr_table.assign(batch_time=batch_time).to_dict("records"))
+            print(f"[OK] attribution drift → {ATTR_OUT} (TVD={attr_summary['attr_drift_tvd']})")
+        attr_summary = attr_summary or {}
+
+    # === SEGMENT DRIFT (feature PSI within one-hot / fairness segments) ===
+    seg_summary = {}
+    seg_cfg = load_segment_config(CFG_PATH)
+    if seg_cfg.get("enabled", True):
+        try:
+            seg_table, seg_summary = segment_drift(df_new, ref_stats, seg_cfg)
+        except Exception as e:
+            print(f"[WARN] segment drift failed: {e}")
+            seg_table, seg_summary = None, None
+        if seg_table is not None and not seg_table.empty:
+            write_append_rows(SEG_OUT, seg_table.assign(batch_time=batch_time).to_dict("records"))
+            print(f"[OK] segment drift → {SEG_OUT} ({len(seg_table)} feature-segment pairs, "
+                  f"max PSI={seg_summary['seg_psi_max_value']:.4f} on "
+                  f"'{seg_summary['seg_psi_max_feature']}' @ {seg_summary['seg_psi_max_segment']})")
+        seg_summary = seg_summary or {}
+
+    # === PER-APPLICANT EXPLANATIONS (optional, full batch) ===
+    store_cfg = load_store_config(CFG_PATH)
+    if store_cfg.get("enabled"):
+        try:
+            path = store_batch_explanations(df_new, batch_time, store_cfg, CFG_PATH)
+            if path:
+                print(f"[OK] explanation store → {path}")
+        except Exception as e:
+            print(f"[WARN] explanation store failed: {e}")
 
-    feat_df = pd.DataFrame(rows).sort_values("feature").reset_index(drop=True)
     os.makedirs(os.path.dirname(FEAT_OUT), exist_ok=True)
     feat_df.to_csv(FEAT_OUT, index=False, encoding="utf-8-sig")
     print(f"[OK] feature-level → {FEAT_OUT} ({len(feat_df)} rows)")
 
     # === BATCH SUMMARY METRICS ===
-    feat_df["psi_num"] = pd.to_numeric(feat_df["psi"], errors="coerce")
-    feat_df["miss_num"] = pd.to_numeric(feat_df["missing_rate_new"], errors="coerce")
-
-    psi_max_value = psi_max_feature = None
-    if feat_df["psi_num"].notna().any():
-        r = feat_df.loc[feat_df["psi_num"].idxmax()]
-        psi_max_value, psi_max_feature = float(r["psi_num"]), r["feature"]
-
-    max_missing_rate = max_missing_feature = None
-    if feat_df["miss_num"].notna().any():
-        r2 = feat_df.loc[feat_df["miss_num"].idxmax()]
-        max_missing_rate, max_missing_feature = float(r2["miss_num"]), r2["feature"]
-
-    top3 = (feat_df.dropna(subset=["psi_num"])
-                   .sort_values("psi_num", ascending=False)
-                   .head(3)[["feature", "psi_num"]]
-                   .rename(columns={"psi_num": "psi"}))
-    
-    top_drift_json = json.dumps(
-        [{"feature": a, "psi": float(b), "ref": "ref-dist"} for a, b in top3.values],
-        ensure_ascii=False
-    )
+    drift = summarize_drift(feat_df, top_n=3)
+    psi_max_value, psi_max_feature = drift["psi_max_value"], drift["psi_max_feature"]
+    max_missing_rate, max_missing_feature = drift["max_missing_rate"], drift["max_missing_feature"]
+    top_drift_json = drift["top_drift_json"]
 
-    # === COMPUTE AUC/KS FROM BATCH DATA ===
+    # === PER-MODEL AUC/KS, SCORE PSI & CALIBRATION (shared data pass) ===
     labels_cfg = cfg.get("labels") or {}
     y_col = labels_cfg.get("y_col", "label")
-    p_col = labels_cfg.get("p_col", "score")
-    
-    print(f"[INFO] Computing AUC/KS using y_col='{y_col}', p_col='{p_col}'")
-    auc, ks = compute_auc_ks(df_new, y_col=y_col, p_col=p_col)
-    
-    # Get baseline for drop calculation
-    baseline = cfg.get("baseline") or {}
-    base_auc = safe_float(baseline.get("roc_auc"))
-    base_ks = safe_float(baseline.get("ks"))
-    
-    auc_drop = None
-    if auc is not None and base_auc is not None:
-        auc_drop = max(0.0, base_auc - auc)
-    
-    ks_drop = None
-    if ks is not None and base_ks is not None:
-        ks_drop = max(0.0, base_ks - ks)
+
+    calib_cfg = cfg.get("calibration") or {}
+    model_rows, scorer = [], None
+    for i, spec in enumerate(model_specs(cfg)):
+        p_col = spec["p_col"]
+        if p_col not in df_new.columns and spec.get("model"):
+            # score this challenger in memory (model pool keeps it warm)
+            scorer = scorer or ScoringEngine.from_config(CFG_PATH)
+            scorer.model_version = str(spec.get("version") or load_scoring_config(CFG_PATH)["model_version"])
+            try:
+                df_new[p_col] = scorer.score_frame(df_new, spec["model"])
+            except Exception as e:
+                print(f"[WARN] scoring {spec['model_version']} with '{spec['model']}' failed: {e}")
+
+        print(f"[INFO] {spec['model_version']}: AUC/KS using y_col='{y_col}', p_col='{p_col}'")
+        metrics = model_metrics(df_new, y_col=y_col, p_col=p_col, baseline=spec["baseline"],
+                                score_ref=load_score_reference(spec["model_version"]),
+                                n_groups=int(calib_cfg.get("n_groups", 10)),
+                                bands=calib_cfg.get("pd_bands"))
+        model_rows.append({
+            "batch_time": batch_time,
+            "model_version": spec["model_version"],
+            "role": "champion" if i == 0 else "challenger",
+            "p_col": p_col,
+            **metrics,
+        })
+
+    write_append_rows(MODEL_OUT, model_rows)
+    print(f"[OK] model-level → {MODEL_OUT} ({len(model_rows)} model(s))")
+
+    champion = model_rows[0]
+    auc, ks = champion["auc"], champion["ks"]
+    auc_drop, ks_drop = champion["auc_drop"], champion["ks_drop"]
+    models_json = json.dumps([
+        {k: r[k] for k in ("model_version", "role", "auc", "ks", "score_psi", "calib_gap")}
+        for r in model_rows
+    ]) if len(model_rows) > 1 else None
 
     # === BUILD BATCH SUMMARY ===
     summary = {
         "run_name": cfg.get("run_name", "daily_batch"),
-        "batch_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "batch_time": batch_time,
         "data_window": cfg.get("data_window", "N/A"),
-        "model_version": cfg.get("model_version", "v1.0"),
+        "model_version": champion["model_version"],
         "data_source": cfg.get("data_source", "unknown / demo"),
         "report_owner": cfg.get("report_owner", "Christine Ding (Data Scientist)"),
         "auc": auc,
         "ks": ks,
         "auc_drop": auc_drop,
         "ks_drop": ks_drop,
+        "score_psi": champion["score_psi"],
+        "calib_gap": champion["calib_gap"],
+        "brier": champion["brier"],
+        "hl_stat": champion["hl_stat"],
+        "hl_pvalue": champion["hl_pvalue"],
+        "deciles_json": champion["deciles_json"],
+        "bands_json": champion["bands_json"],
         "psi_max_value": psi_max_value,
         "psi_max_feature": psi_max_feature,
         "max_missing_rate": max_missing_rate,
         "max_missing_feature": max_missing_feature,
         "pass_80_rule": cfg.get("pass_80_rule", True),
         "fairness_groups": cfg.get("fairness_groups", "income_group, addr_state"),
-        "dq_notes": cfg.get("dq_notes", "No unusual ETL/schema issues observed."),
+        **dq,
+        **miss_summary,
+        **joint_summary,
+        **anomaly_summary,
         "top_drift_json": top_drift_json,
+        "drift_alerts_json": drift.get("drift_alerts_json", "[]"),
+        **attr_summary,
+        **seg_summary,
+        **refs_summary,
+        **({"models_json": models_json} if models_json else {}),
     }
     
     write_append_one_row(BATCH_OUT, summary)
     print(f"[OK] batch-level → {BATCH_OUT}")
+
+    # === SCORING-TIME SNAPSHOT (joined to late labels by label_engine --ingest) ===
+    if load_label_config(CFG_PATH).get("enabled"):
+        try:
+            batch_id = snapshot_batch(df_new, batch_time, champion["model_version"],
+                                      p_col=champion["p_col"], cfg_path=CFG_PATH)
+            if batch_id is not None:
+                print(f"[OK] label snapshot → batch {batch_id} ({champion['n_scored']} scores)")
+        except Exception as e:
+            print(f"[WARN] label snapshot failed: {e}")
     print(f"[SUMMARY] AUC={auc}, KS={ks}, AUC_drop={auc_drop}, KS_drop={ks_drop}")
     print(f"[SUMMARY] PSI_max={psi_max_value} on '{psi_max_feature}'")
     print(f"[SUMMARY] Missing_max={max_missing_rate} on '{max_missing_feature}'")
@@ -1,31 +1,180 @@
-import os, glob
+import os, glob, sys
+from pathlib import Path
+import pandas as pd
+import altair as alt
 import streamlit as st
 
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from smartloan_agent.report_catalog import get_report_catalog
+from smartloan_agent.shap_engine import get_shap_engine, mean_abs_shap, beeswarm_frame
+from smartloan_agent.explanation_store import list_stores, open_store, load_store_config
+
+BATCH_CSV = "monitor/X_new.csv"
+
 st.title("Explainability")
 
-# --- newest compliance report (by file mtime) ---
-mds = sorted(glob.glob("reports/compliance_report_*.md"), key=os.path.getmtime, reverse=True)
+# --- newest compliance report (from the report catalog) ---
+catalog = get_report_catalog()
+catalog.sync()
+mds = catalog.latest("compliance_report", 1)
 if mds:
     latest = mds[0]
-    st.caption(f"Showing: {os.path.basename(latest)}")
-    with open(latest, "r", encoding="utf-8") as f:
-        st.markdown(f.read())
+    st.caption(f"Showing: {os.path.basename(latest['path'])}")
+    st.markdown(catalog.read(latest))
 else:
     st.info("No compliance report found in /reports.")
 
 st.divider()
 
-# --- SHAP images in a sensible order ---
-order = ["bar", "waterfall", "beeswarm"]
-imgs = [p for p in glob.glob("reports/*shap*.png")]
-
-if imgs:
-    for kw in order:
-        for fp in imgs:
-            if kw in os.path.basename(fp).lower():
-                # 用 columns() 置中
-                col1, col2, col3 = st.columns([1,2,1])  # 左中右欄位
-                with col2:  # 把圖放在中間欄位
-                    st.image(fp, caption=os.path.basename(fp), width=600)  # 控制寬度
+# ===== LOAD ENGINE & BATCH WITH CACHING =====
+@st.cache_resource
+def load_engine():
+    """One SHAP engine per server process (models + explainers loaded once)."""
+    return get_shap_engine()
+
+@st.cache_data(ttl=600)
+def load_batch(path, mtime):
+    return pd.read_csv(path, encoding="utf-8-sig")
+
+def show_static_images():
+    """Pre-rendered SHAP images (used when no model artifacts are available)."""
+    order = ["bar", "waterfall", "beeswarm"]
+    imgs = [p for p in glob.glob("reports/*shap*.png")]
+
+    if imgs:
+        for kw in order:
+            for fp in imgs:
+                if kw in os.path.basename(fp).lower():
+                    # 用 columns() 置中
+                    col1, col2, col3 = st.columns([1,2,1])  # 左中右欄位
+                    with col2:  # 把圖放在中間欄位
+                        st.image(fp, caption=os.path.basename(fp), width=600)  # 控制寬度
+    else:
+        st.info("No SHAP images found.")
+
+# --- SHAP for the current batch ---
+st.subheader("🔍 SHAP Explanations (Current Batch)")
+
+engine = load_engine()
+models = engine.available_models()
+
+if not models or not os.path.exists(BATCH_CSV):
+    st.info(
+        f"Live SHAP needs model artifacts ({', '.join(engine.models.values())}) "
+        f"and `{BATCH_CSV}`. Showing pre-rendered images instead."
+    )
+    show_static_images()
 else:
-    st.info("No SHAP images found.")
+    df_batch = load_batch(BATCH_CSV, os.path.getmtime(BATCH_CSV))
+
+    col1, col2, col3 = st.columns([1, 1, 1])
+    with col1:
+        model_name = st.selectbox("Model:", models, index=len(models) - 1)
+    with col2:
+        full_batch = st.checkbox("Full batch", value=False)
+        default_n = min(int(engine.sample_size or 2000), len(df_batch))
+        sample_n = st.number_input(
+            "Sample size:", min_value=100, max_value=len(df_batch),
+            value=max(100, default_n), step=500, disabled=full_batch
+        )
+    with col3:
+        top_n = st.slider("Top features:", 5, 30, 15)
+
+    try:
+        with st.spinner("Computing SHAP values..."):
+            res = engine.explain(df_batch, model_name, sample_size=None if full_batch else int(sample_n))
+    except Exception as e:
+        st.error(f"❌ SHAP computation failed: {e}")
+        show_static_images()
+        st.stop()
+
+    st.caption(
+        f"{len(res.values):,} of {res.batch_rows:,} rows · {res.meta.get('explainer')} explainer · "
+        f"model `{res.model_version.split(':')[0]}` · values in log-odds"
+        + (" · from cache" if res.meta.get("cached") else "")
+    )
+
+    imp = mean_abs_shap(res).head(top_n)
+    bar = (
+        alt.Chart(imp)
+        .mark_bar()
+        .encode(
+            x=alt.X("mean_abs_shap:Q", title="mean |SHAP|"),
+            y=alt.Y("feature:N", sort="-x", title=None),
+            tooltip=["feature", alt.Tooltip("mean_abs_shap:Q", format=".4f"),
+                     alt.Tooltip("share:Q", format=".1%")],
+        )
+        .properties(height=max(200, 22 * len(imp)), title="Global importance")
+    )
+    st.altair_chart(bar, use_container_width=True)
+
+    swarm = beeswarm_frame(res, top_n=top_n)
+    bees = (
+        alt.Chart(swarm)
+        .mark_circle(size=14, opacity=0.6)
+        .encode(
+            x=alt.X("shap:Q", title="SHAP value (impact on log-odds)"),
+            y=alt.Y("feature:N", sort=imp["feature"].tolist(), title=None),
+            yOffset="jitter:Q",
+            color=alt.Color("value_pct:Q", scale=alt.Scale(scheme="redblue", reverse=True),
+                            title="feature value (pct)"),
+            tooltip=["feature", alt.Tooltip("value:Q", format=".3f"),
+                     alt.Tooltip("shap:Q", format=".4f")],
+        )
+        .transform_calculate(jitter="random()")
+        .properties(height=max(240, 28 * len(imp)), title="Beeswarm")
+    )
+    st.altair_chart(bees, use_container_width=True)
+
+    with st.expander("📸 Pre-rendered SHAP images"):
+        show_static_images()
+
+# --- Per-applicant reason codes (explanation store) ---
+st.divider()
+st.subheader("🧾 Applicant Explanation Lookup")
+
+store_cfg = load_store_config()
+stores = list_stores(store_cfg["dir"])
+if not stores:
+    st.info(
+        "No stored explanations yet. Set `explanation_store.enabled: true` in config.yaml "
+        "and run `python monitor/monitor_1.py`, or run "
+        "`python -m smartloan_agent.explanation_store --csv monitor/X_new.csv`."
+    )
+else:
+    col1, col2, col3 = st.columns([2, 2, 1])
+    with col1:
+        labels = [f"{m['batch_id']} · {m['model']} ({m['n_rows']:,} rows)" for m in stores]
+        pick = st.selectbox("Batch:", range(len(stores)), format_func=lambda i: labels[i])
+    store = open_store(stores[pick]["path"])
+    with col2:
+        applicant_id = st.text_input("Applicant ID:", placeholder=f"e.g. {next(iter(store.row_of))}")
+    with col3:
+        k = st.number_input("Reasons:", min_value=1, max_value=20, value=store.meta["top_k"])
+
+    if applicant_id:
+        if applicant_id.strip() not in store:
+            st.warning(f"Applicant `{applicant_id}` not found in batch {store.meta['batch_id']}.")
+        else:
+            exp = store.get(applicant_id.strip(), int(k))
+            st.metric("Predicted risk", f"{exp['probability']:.1%}",
+                      help=f"log-odds {exp['logit']:.3f} = base {exp['base_value']:.3f} + sum of SHAP")
+            reasons = pd.DataFrame(exp["reasons"])
+            reasons.index = range(1, len(reasons) + 1)
+            st.dataframe(reasons, use_container_width=True)
+
+            row = store.row_frame(applicant_id.strip()).head(20)
+            chart = (
+                alt.Chart(row)
+                .mark_bar()
+                .encode(
+                    x=alt.X("shap:Q", title="SHAP value (log-odds)"),
+                    y=alt.Y("feature:N", sort=row["feature"].tolist(), title=None),
+                    color=alt.condition("datum.shap > 0", alt.value("#d62728"), alt.value("#1f77b4")),
+                    tooltip=["feature", alt.Tooltip("value:Q", format=".3f"),
+                             alt.Tooltip("shap:Q", format=".4f")],
+                )
+                .properties(height=max(200, 22 * len(row)), title="Top contributions")
+            )
+            st.altair_chart(chart, use_container_width=True)
@@ -1,6 +1,15 @@
+import sys
+from pathlib import Path
 import pandas as pd
-import numpy as np
 import streamlit as st
+import yaml
+
+# Add parent directory to path to import smartloan_agent
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from smartloan_agent.fairness_engine import (
+    simple_fairness, group_cutoff_fairness, optimize_group_cutoffs, optimizer_config, OBJECTIVES,
+)
 
 # DEBUG: Check for NaN in data
 st.set_page_config(
@@ -11,119 +20,6 @@ st.set_page_config(
 
 
 
-# ---------- Helper Functions ----------
-def recover_annual_inc(s_log: pd.Series) -> pd.Series:
-    """Recover annual income from log-transformed values."""
-    rec = np.expm1(s_log)
-    return np.exp(s_log) if (rec < 0).any() else rec
-
-def make_state_group(s: pd.Series, min_count: int = 200) -> pd.Series:
-    """Group low-frequency states into 'OTHER' category."""
-    s = s.astype(str).fillna("UNKNOWN")
-    vc = s.value_counts()
-    keep = set(vc[vc >= min_count].index)
-    return s.where(s.isin(keep), "OTHER")
-
-def simple_fairness(df, y_true, y_score, group_col, target_approval=0.40):
-    """
-    Compute fairness metrics using a GLOBAL cutoff (same for all groups).
-    Returns per-group stats and summary with 80% rule compliance.
-    """
-    d = df[[y_true, y_score, group_col]].dropna().copy()
-    
-    # Global cutoff: approve top X% based on lowest risk scores
-    cutoff = float(np.quantile(d[y_score].values, target_approval))
-    d["approve"] = (d[y_score] <= cutoff).astype(int)
-
-    rows = []
-    for g, gdf in d.groupby(group_col):
-        n = len(gdf)
-        ar = gdf["approve"].mean() if n else np.nan
-        
-        # TPR for "good" customers (y_true == 0)
-        good = (gdf[y_true] == 0)
-        tprg = gdf.loc[good, "approve"].mean() if good.sum() > 0 else np.nan
-        
-        rows.append({
-            "group": g, 
-            "n": n, 
-            "approve_rate": ar, 
-            "TPR_good": tprg
-        })
-    
-    per = pd.DataFrame(rows).sort_values("n", ascending=False).reset_index(drop=True)
-
-    # Disparate Impact Ratio (DIR) vs majority group
-    base = per.loc[per["n"].idxmax(), "approve_rate"]
-    per["DIR_vs_majority"] = per["approve_rate"] / base if base > 0 else np.nan
-
-    # 80% rule: min/max approval rate ratio
-    dir_min_over_max = per["approve_rate"].min() / per["approve_rate"].max()
-    
-    # TPR range (fairness across groups)
-    tpr_range = (
-        (per["TPR_good"].max() - per["TPR_good"].min()) 
-        if per["TPR_good"].notna().any() 
-        else np.nan
-    )
-
-    summary = {
-        "used_cutoff": cutoff,
-        "DIR_min_over_max": float(dir_min_over_max),
-        "TPR_good_range": float(tpr_range) if pd.notna(tpr_range) else np.nan,
-        "pass_80_rule": bool(dir_min_over_max >= 0.8),
-    }
-    return per, summary
-
-def group_cutoff_fairness(df, y_true, y_score, group_col, target_approval=0.40):
-    """
-    Compute fairness metrics using GROUP-SPECIFIC cutoffs (equalizing approval rates).
-    Returns per-group stats and summary with 80% rule compliance.
-    """
-    d = df[[y_true, y_score, group_col]].dropna().copy()
-    
-    # Calculate group-specific cutoffs to achieve target approval rate in each group
-    cuts = d.groupby(group_col)[y_score].quantile(target_approval).to_dict()
-
-    d["approve_fair"] = 0
-    for g, c in cuts.items():
-        d.loc[(d[group_col] == g) & (d[y_score] <= c), "approve_fair"] = 1
-
-    rows = []
-    for g, gdf in d.groupby(group_col):
-        n = len(gdf)
-        ar = gdf["approve_fair"].mean() if n else np.nan
-        
-        good = (gdf[y_true] == 0)
-        tprg = gdf.loc[good, "approve_fair"].mean() if good.sum() > 0 else np.nan
-        
-        rows.append({
-            "group": g, 
-            "n": n, 
-            "approve_rate": ar, 
-            "TPR_good": tprg
-        })
-    
-    per = pd.DataFrame(rows).sort_values("n", ascending=False).reset_index(drop=True)
-
-    base = per.loc[per["n"].idxmax(), "approve_rate"]
-    per["DIR_vs_majority"] = per["approve_rate"] / base if base > 0 else np.nan
-
-    dir_min_over_max = per["approve_rate"].min() / per["approve_rate"].max()
-    tpr_range = (
-        (per["TPR_good"].max() - per["TPR_good"].min()) 
-        if per["TPR_good"].notna().any() 
-        else np.nan
-    )
-
-    summary = {
-        "used_cutoffs": "group-specific",
-        "DIR_min_over_max": float(dir_min_over_max),
-        "TPR_good_range": float(tpr_range) if pd.notna(tpr_range) else np.nan,
-        "pass_80_rule": bool(dir_min_over_max >= 0.8),
-    }
-    return per, summary
-
 def kpi_label(ok: bool) -> str:
     """Format pass/fail status with emoji."""
     return "✅ PASS" if ok else "❌ FAIL"
@@ -140,6 +36,15 @@ def load_fairness_data():
         st.info("Please ensure the fairness test data is available.")
         st.stop()
 
+@st.cache_data(ttl=600)
+def load_optimizer_defaults():
+    """`fairness.optimizer` defaults from config.yaml."""
+    try:
+        with open("monitor/config.yaml", "r", encoding="utf-8") as f:
+            return optimizer_config(yaml.safe_load(f))
+    except FileNotFoundError:
+        return optimizer_config({})
+
 # ===== MAIN UI =====
 st.title("⚖️ Fairness Analysis (Before vs After)")
 st.markdown("""
@@ -305,6 +210,60 @@ st.bar_chart(
 )
 st.caption("Y-axis: Approval rate (%)")
 
+# ===== OPTIMIZED CUTOFFS =====
+st.markdown("---")
+st.subheader("🧮 Optimized Group Cutoffs")
+st.caption("Group-specific cutoffs that optimize an objective under fairness constraints "
+           "at the target approval rate.")
+
+opt_cfg = load_optimizer_defaults()
+col_o1, col_o2, col_o3 = st.columns(3)
+with col_o1:
+    objective = st.selectbox(
+        "Objective",
+        OBJECTIVES,
+        index=OBJECTIVES.index(opt_cfg["objective"]) if opt_cfg["objective"] in OBJECTIVES else 0,
+        format_func=lambda x: "Maximize expected good approvals" if x == "good_approvals"
+        else "Minimize expected defaults",
+    )
+with col_o2:
+    min_dir = st.slider("Minimum DIR", 0.50, 1.00, float(opt_cfg["min_dir"]), 0.01)
+with col_o3:
+    tpr_tol = st.slider("Max TPR_good range", 0.01, 0.50,
+                        float(opt_cfg["tpr_tol"] if opt_cfg["tpr_tol"] is not None else 0.50), 0.01)
+
+with st.spinner("Optimizing cutoffs..."):
+    per_o, sum_o, frontier = optimize_group_cutoffs(
+        df, "loan_status", "pd_score", group_col, target,
+        objective=objective, min_dir=min_dir, tpr_tol=tpr_tol,
+        approval_tol=float(opt_cfg["approval_tol"]), grid=int(opt_cfg["grid"]),
+        frontier=opt_cfg["frontier"],
+    )
+
+if not sum_o["feasible"]:
+    st.warning("⚠️ No group cutoffs meet these constraints at this approval target. "
+               "Relax the TPR range or the minimum DIR.")
+else:
+    col_m1, col_m2, col_m3, col_m4 = st.columns(4)
+    col_m1.metric("80% Rule (Optimized)", kpi_label(sum_o["pass_80_rule"]),
+                  f"DIR={sum_o['DIR_min_over_max']:.3f}", delta_color="off")
+    col_m2.metric("TPR Range (Optimized)", f"{sum_o['TPR_good_range']:.3f}")
+    col_m3.metric("Approval rate", f"{sum_o['approve_rate']:.2%}")
+    col_m4.metric("Expected good approvals" if objective == "good_approvals" else "Expected defaults",
+                  f"{sum_o['expected_good_approvals' if objective == 'good_approvals' else 'expected_defaults']:,.1f}")
+
+    display_per_o = per_o.copy()
+    for col in ["approve_rate", "TPR_good"]:
+        display_per_o[col] = display_per_o[col].apply(lambda x: f"{x:.2%}" if pd.notna(x) else "N/A")
+    for col in ["cutoff", "DIR_vs_majority"]:
+        display_per_o[col] = display_per_o[col].apply(lambda x: f"{x:.4f}" if pd.notna(x) else "N/A")
+    for col in ["expected_good_approvals", "expected_defaults"]:
+        display_per_o[col] = display_per_o[col].round(1)
+    st.dataframe(display_per_o, use_container_width=True)
+
+st.markdown("**Frontier**: best objective at each DIR floor")
+st.dataframe(frontier.round(4), use_container_width=True)
+
 # ===== SUMMARY TABLE =====
 st.markdown("---")
 st.subheader("📄 Fairness Summary Report")
@@ -326,7 +285,16 @@ summary_df = pd.DataFrame([
         "DIR_min_over_max": round(sum_a["DIR_min_over_max"], 6),
         "TPR_good_range": round(sum_a["TPR_good_range"], 6)
     },
-])
+] + ([
+    {
+        "stage": "Optimized",
+        "policy": f"optimized_{objective}",
+        "target_approval": target,
+        "pass_80_rule": sum_o["pass_80_rule"],
+        "DIR_min_over_max": round(sum_o["DIR_min_over_max"], 6),
+        "TPR_good_range": round(sum_o["TPR_good_range"], 6)
+    },
+] if sum_o["feasible"] else []))
 
 st.dataframe(summary_df, use_container_width=True)
 
@@ -4,13 +4,33 @@ import pandas as pd
 import numpy as np
 from datetime import datetime
 from jinja2 import Environment, FileSystemLoader
-import yaml
 import argparse
-from openai import OpenAI
 import streamlit as st
-import glob
+import sys
+from pathlib import Path
 from dotenv import load_dotenv
 
+# Add parent directory to path to import smartloan_agent
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from smartloan_agent.compliance_rules import (
+    get_thresholds,
+    check_flags,
+    rule_based_summary,
+    rule_based_actions,
+    safe_format,
+    score_context,
+    dq_context,
+    anomaly_context,
+)
+from smartloan_agent.llm_cache import (
+    AsyncChatClient,
+    LLMSummaryCache,
+    generate_summaries_sync,
+)
+from smartloan_agent.report_index import REPORT_KINDS, get_report_index
+from smartloan_agent.report_catalog import get_report_catalog, register_report
+
 load_dotenv()
 
 # ===== PAGE CONFIG =====
@@ -31,45 +51,6 @@ PROMPT_FILE = os.path.join(MONITOR_DIR, "llm_system_prompt.txt")
 os.makedirs(REPORTS_DIR, exist_ok=True)
 
 # ===== HELPER FUNCTIONS =====
-def safe_float(value):
-    """Convert value to float, return None if it fails or is NaN/Inf."""
-    try:
-        if value is None or pd.isna(value):
-            return None
-        val = float(value)
-        if np.isnan(val) or np.isinf(val):
-            return None
-        return val
-    except Exception:
-        return None
-
-def safe_compare_gt(value, threshold):
-    """
-    Safely compare value > threshold.
-    Returns False if either value is None/NaN (no alert triggered).
-    """
-    val = safe_float(value)
-    thr = safe_float(threshold)
-    
-    if val is None or thr is None:
-        return False
-    
-    return val > thr
-
-def safe_compare_range(value, lower, upper):
-    """
-    Check if lower < value <= upper.
-    Returns False if any value is None/NaN.
-    """
-    val = safe_float(value)
-    low = safe_float(lower)
-    up = safe_float(upper)
-    
-    if val is None or low is None or up is None:
-        return False
-    
-    return low < val <= up
-
 def get_latest_metrics(csv_path):
     """Read the latest row from the CSV file."""
     df = pd.read_csv(csv_path, engine="c", encoding="utf-8-sig")
@@ -77,133 +58,8 @@ def get_latest_metrics(csv_path):
         raise ValueError("The CSV file is empty")
     return df.iloc[-1].to_dict()
 
-def get_thresholds(yaml_path):
-    """Read thresholds from the YAML file."""
-    with open(yaml_path, "r", encoding="utf-8") as f:
-        config = yaml.safe_load(f) or {}
-    return {
-        "psi_warn": config.get("psi_threshold_warn", 0.10),
-        "psi_alert": config.get("psi_threshold_alert", 0.20),
-        "auc_drop": config.get("auc_drop_alert", 0.05),
-        "ks_drop": config.get("ks_drop_alert", 0.10),
-        "miss_rate": config.get("missing_rate_alert", 0.10),
-    }
-
-def check_flags(metrics, thresholds):
-    """
-    Check if metrics exceed alert thresholds.
-    Safe handling of None/NaN values - returns False if data missing.
-    """
-    return {
-        "auc_drop_alert": safe_compare_gt(
-            metrics.get("auc_drop"), 
-            thresholds["auc_drop"]
-        ),
-        "ks_drop_alert": safe_compare_gt(
-            metrics.get("ks_drop"), 
-            thresholds["ks_drop"]
-        ),
-        "missing_rate_alert": safe_compare_gt(
-            metrics.get("max_missing_rate"), 
-            thresholds["miss_rate"]
-        ),
-        "psi_alert": safe_compare_gt(
-            metrics.get("psi_max_value"), 
-            thresholds["psi_alert"]
-        ),
-        "psi_warn": safe_compare_range(
-            metrics.get("psi_max_value"),
-            thresholds["psi_warn"],
-            thresholds["psi_alert"]
-        ),
-    }
-
-# ===== RULE-BASED FUNCTIONS =====
-def rule_based_summary(metrics, flags, thresholds):
-    """Generate a rule-based summary."""
-    summary = ["Monitoring completed for the latest batch."]
-    
-    # Performance
-    if flags["auc_drop_alert"] or flags["ks_drop_alert"]:
-        issues = []
-        if flags["auc_drop_alert"]:
-            auc_drop = safe_float(metrics.get("auc_drop"))
-            issues.append(f"AUC drop {auc_drop:.3f}" if auc_drop else "AUC drop detected")
-        if flags["ks_drop_alert"]:
-            ks_drop = safe_float(metrics.get("ks_drop"))
-            issues.append(f"KS drop {ks_drop:.3f}" if ks_drop else "KS drop detected")
-        summary.append(f"Model performance weakened ({', '.join(issues)}).")
-    else:
-        auc = safe_float(metrics.get("auc"))
-        ks = safe_float(metrics.get("ks"))
-        auc_str = f"{auc:.3f}" if auc else "N/A"
-        ks_str = f"{ks:.3f}" if ks else "N/A"
-        summary.append(f"AUC={auc_str} and KS={ks_str} are within acceptable range.")
-    
-    # Drift
-    if flags["psi_alert"]:
-        psi_val = safe_float(metrics.get("psi_max_value"))
-        psi_str = f"{psi_val:.3f}" if psi_val else "N/A"
-        summary.append(
-            f"Significant drift detected on '{metrics.get('psi_max_feature', 'N/A')}' "
-            f"(PSI={psi_str})."
-        )
-    elif flags["psi_warn"]:
-        psi_val = safe_float(metrics.get("psi_max_value"))
-        psi_str = f"{psi_val:.3f}" if psi_val else "N/A"
-        summary.append(
-            f"Moderate drift on '{metrics.get('psi_max_feature', 'N/A')}' "
-            f"(PSI={psi_str}); continue monitoring."
-        )
-    else:
-        summary.append("No significant drift detected.")
-    
-    # Missing data
-    if flags["missing_rate_alert"]:
-        miss_rate = safe_float(metrics.get("max_missing_rate"))
-        miss_str = f"{miss_rate:.1%}" if miss_rate else "N/A"
-        summary.append(
-            f"Excessive missing data on '{metrics.get('max_missing_feature', 'N/A')}' "
-            f"({miss_str})."
-        )
-    else:
-        summary.append("Missing data is within acceptable limits.")
-    
-    # Fairness
-    pass_80 = metrics.get("pass_80_rule")
-    if str(pass_80).lower() in {"true", "1", "yes"}:
-        summary.append("Fairness metrics meet the 80% rule.")
-    else:
-        summary.append(
-            f"Potential fairness concern in {metrics.get('fairness_groups', 'N/A')}; "
-            f"review required."
-        )
-    
-    return " ".join(summary)
-
-def rule_based_actions(flags, metrics):
-    """Generate rule-based action recommendations."""
-    actions = ["Continue daily monitoring."]
-    
-    if flags["psi_warn"] or flags["psi_alert"]:
-        actions.append(
-            f"Track '{metrics.get('psi_max_feature', 'key feature')}' PSI "
-            f"for 7-14 days."
-        )
-    
-    if flags["auc_drop_alert"] or flags["ks_drop_alert"]:
-        actions.append("Review model calibration and plan retraining.")
-    
-    if flags["missing_rate_alert"]:
-        actions.append("Investigate ETL processes for missing data issues.")
-    
-    if str(metrics.get("pass_80_rule", True)).lower() not in {"true", "1", "yes"}:
-        actions.append("Conduct a fairness audit across protected groups.")
-    
-    return "\n".join(["- " + a for a in actions])
-
 def render_report(template_path, context):
-    """Render the report using Jinja2 and save it."""
+    """Render the report using Jinja2, save it and register it in the catalog."""
     env = Environment(
         loader=FileSystemLoader(os.path.dirname(template_path) or "."), 
         autoescape=False
@@ -216,72 +72,67 @@ def render_report(template_path, context):
     
     with open(file_path, "w", encoding="utf-8") as f:
         f.write(md)
+    register_report(file_path, batch_id=context.get("batch_time"), cfg_path=CONFIG_YAML)
     
     return file_path, md
 
-def read_file(file_path):
-    """Read file content, return error message if it fails."""
-    try:
-        with open(file_path, "r", encoding="utf-8") as f:
-            return f.read()
-    except Exception as e:
-        return f"(Failed to read: {e})"
-
-def save_file(text, prefix):
-    """Save text to a new file with a timestamp."""
+def save_file(text, prefix, batch_id=None):
+    """Save text to a new file with a timestamp and register it in the catalog."""
     time_str = datetime.now().strftime("%Y%m%d_%H%M%S")
     file_name = f"{prefix}{time_str}.md"
     file_path = os.path.join(REPORTS_DIR, file_name)
     
     with open(file_path, "w", encoding="utf-8") as f:
         f.write(text)
+    register_report(file_path, batch_id=batch_id, cfg_path=CONFIG_YAML)
     
     return file_path
 
-def safe_format(value, decimals=3):
+@st.cache_resource
+def get_summary_cache():
+    """One SQLite-backed summary cache per server process."""
+    return LLMSummaryCache.from_config(CONFIG_YAML)
+
+def offline_summary(metrics, error):
+    """Fallback: simple keyword-based summary."""
+    key_lines = [
+        line for line in str(metrics).splitlines() 
+        if any(word in line.lower() for word in ["auc", "psi", "alert", "missing"])
+    ]
+    
+    if not key_lines:
+        return "No key information found for summary."
+    
+    summary = "\n".join(f"- {line}" for line in key_lines[:5])
+    return (
+        f"## Simple Summary (Offline Mode)\n\n{summary}\n\n"
+        f"_Note: Set OPENAI_API_KEY for AI-enhanced summaries._\n\n"
+        f"_Error: {str(error)}_"
+    )
+
+def make_llm_summaries(metrics, prompts):
     """
-    Format number with specified decimals, return 'N/A' if None.
-    Used to prepare values for Jinja2 templates.
+    Generate one LLM summary per prompt style (concurrently, cached).
+    Returns {style: (text, cached)}; failed styles fall back to offline mode.
     """
-    val = safe_float(value)
-    if val is None:
-        return "N/A"
-    return f"{val:.{decimals}f}"
-
-def make_llm_summary(metrics, prompt):
-    """Generate an LLM-based summary with fallback."""
     try:
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            raise ValueError("OPENAI_API_KEY not set")
-        
-        client = OpenAI(api_key=api_key)
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": prompt},
-                {"role": "user", "content": str(metrics)}
-            ],
-            temperature=0.2,
+        client = AsyncChatClient.from_config(CONFIG_YAML)
+        results = generate_summaries_sync(
+            metrics, prompts, client=client, cache=get_summary_cache()
         )
-        return response.choices[0].message.content.strip()
-    
     except Exception as e:
-        # Fallback: simple keyword-based summary
-        key_lines = [
-            line for line in str(metrics).splitlines() 
-            if any(word in line.lower() for word in ["auc", "psi", "alert", "missing"])
-        ]
-        
-        if not key_lines:
-            return "No key information found for summary."
-        
-        summary = "\n".join(f"- {line}" for line in key_lines[:5])
-        return (
-            f"## Simple Summary (Offline Mode)\n\n{summary}\n\n"
-            f"_Note: Set OPENAI_API_KEY for AI-enhanced summaries._\n\n"
-            f"_Error: {str(e)}_"
-        )
+        return {style: (offline_summary(metrics, e), False) for style in prompts}
+    
+    return {
+        style: (r["text"], r["cached"]) if r["error"] is None
+        else (offline_summary(metrics, r["error"]), False)
+        for style, r in results.items()
+    }
+
+def make_llm_summary(metrics, prompt):
+    """Generate an LLM-based summary with cache + fallback."""
+    text, _ = make_llm_summaries(metrics, {"custom": prompt})["custom"]
+    return text
 
 # ===== MAIN UI =====
 st.title("📑 Compliance Report & LLM Summary Generator")
@@ -339,7 +190,6 @@ if os.path.exists(METRICS_CSV) and os.path.exists(CONFIG_YAML):
                 "psi_max_feature": metrics.get("psi_max_feature", "N/A"),
                 "max_missing_feature": metrics.get("max_missing_feature", "N/A"),
                 "top_drift": [],
-                "dq_notes": metrics.get("dq_notes", "No unusual ETL/schema issues observed."),
                 "fairness_groups": metrics.get("fairness_groups", "income_group, addr_state"),
                 "pass_80_rule": metrics.get("pass_80_rule", True),
                 "fairness_comment": (
@@ -362,6 +212,11 @@ if os.path.exists(METRICS_CSV) and os.path.exists(CONFIG_YAML):
                 ]),
                 "next_review": metrics.get("next_review", "Quarterly model committee (scheduled)"),
                 "actions": actions,
+                
+                # Score stability & calibration (pre-formatted)
+                **score_context(metrics, thresholds, flags),
+                **dq_context(metrics),
+                **anomaly_context(metrics),
             }
             
             file_path, rendered_md = render_report(J2_FILE, context)
@@ -432,10 +287,13 @@ if os.path.exists(METRICS_CSV) and os.path.exists(CONFIG_YAML):
         with st.spinner("Generating AI summary..."):
             try:
                 metrics = get_latest_metrics(METRICS_CSV)
-                summary = make_llm_summary(metrics, prompt)
-                file_path = save_file(summary, "llm_summary_")
+                summary, cached = make_llm_summaries(metrics, {"custom": prompt})["custom"]
+                file_path = save_file(summary, "llm_summary_", metrics.get("batch_time"))
                 
-                st.success(f"✅ Generated: `{os.path.basename(file_path)}`")
+                st.success(
+                    f"✅ Generated: `{os.path.basename(file_path)}`"
+                    + (" (from cache)" if cached else "")
+                )
                 
                 col1, col2 = st.columns([1, 3])
                 with col1:
@@ -454,6 +312,28 @@ if os.path.exists(METRICS_CSV) and os.path.exists(CONFIG_YAML):
                 st.error(f"❌ Error generating AI summary: {e}")
                 with st.expander("🐛 Debug Info"):
                     st.exception(e)
+    
+    if st.button("⚡ Generate All Styles", use_container_width=True):
+        with st.spinner("Generating all summary styles in parallel..."):
+            try:
+                metrics = get_latest_metrics(METRICS_CSV)
+                results = make_llm_summaries(metrics, prompt_options)
+                
+                tabs = st.tabs(list(results.keys()))
+                for tab, (style, (text, cached)) in zip(tabs, results.items()):
+                    slug = style.lower().replace(" ", "_")
+                    file_path = save_file(text, f"llm_summary_{slug}_", metrics.get("batch_time"))
+                    with tab:
+                        st.caption(
+                            f"`{os.path.basename(file_path)}`"
+                            + (" · from cache" if cached else "")
+                        )
+                        st.markdown(text)
+            
+            except Exception as e:
+                st.error(f"❌ Error generating AI summaries: {e}")
+                with st.expander("🐛 Debug Info"):
+                    st.exception(e)
 else:
     st.warning(f"⚠️ Need `{METRICS_CSV}` and `{CONFIG_YAML}` to generate summary.")
 
@@ -462,19 +342,20 @@ st.markdown("---")
 # ===== 4. HISTORICAL SUMMARIES =====
 st.subheader("📝 Historical AI Summaries (Last 5)")
 
-llm_files = sorted(
-    glob.glob(os.path.join(REPORTS_DIR, "llm_summary_*.md")),
-    key=os.path.getmtime,
-    reverse=True
-)[:5]
+catalog = get_report_catalog(CONFIG_YAML)
+catalog.sync()
+llm_entries = catalog.latest("llm_summary", 5)
 
-if llm_files:
-    for file_path in llm_files:
-        file_name = os.path.basename(file_path)
-        file_time = datetime.fromtimestamp(os.path.getmtime(file_path)).strftime("%Y-%m-%d %H:%M")
+if llm_entries:
+    for entry in llm_entries:
+        file_name = os.path.basename(entry["path"])
+        file_time = entry["created"][:16]
         
         with st.expander(f"📄 {file_name} (Created: {file_time})"):
-            text = read_file(file_path)
+            try:
+                text = catalog.read(entry)
+            except Exception as e:
+                text = f"(Failed to read: {e})"
             st.markdown(text)
             
             st.download_button(
@@ -487,5 +368,48 @@ if llm_files:
 else:
     st.info("ℹ️ No AI summaries yet. Generate one using the button above!")
 
+st.markdown("---")
+
+# ===== 5. SEARCH HISTORICAL REPORTS =====
+st.subheader("🔎 Search Historical Reports")
+
+col_q, col_kind, col_feat = st.columns([3, 1, 1])
+with col_q:
+    search_query = st.text_input(
+        "Search reports:", placeholder="e.g. fico_mid drift alert"
+    )
+with col_kind:
+    search_kind = st.selectbox("Report type:", ["All"] + list(REPORT_KINDS))
+with col_feat:
+    search_feature = st.text_input("Mentions feature:", placeholder="e.g. fico_mid")
+
+col_since, col_until, col_k = st.columns([1, 1, 1])
+with col_since:
+    search_since = st.date_input("From:", value=None)
+with col_until:
+    search_until = st.date_input("To:", value=None)
+with col_k:
+    search_k = st.number_input("Max results:", min_value=1, max_value=50, value=5)
+
+if search_query or search_feature:
+    try:
+        index = get_report_index(CONFIG_YAML)
+        index.sync()
+        hits = index.search(
+            search_query,
+            top_k=int(search_k),
+            kind=None if search_kind == "All" else search_kind,
+            feature=search_feature.strip() or None,
+            since=search_since.isoformat() if search_since else None,
+            until=search_until.isoformat() if search_until else None,
+        )
+        st.caption(f"{len(hits)} result(s) from {len(index)} indexed reports")
+        for hit in hits:
+            with st.expander(f"📄 {os.path.basename(hit['path'])} ({hit['created']}) · score {hit['score']:.2f}"):
+                st.markdown(hit["snippet"])
+                st.caption(f"`{hit['path']}`")
+    except Exception as e:
+        st.error(f"❌ Report search failed: {e}")
+
 st.markdown("---")
 st.caption("📑 **SmartLoan Compliance & LLM** | Automated Reporting with AI | UK FCA Standards")
\ No newline at end of file
@@ -2,6 +2,7 @@
 import streamlit as st
 import sys
 import os
+import uuid
 from dotenv import load_dotenv
 
 # Get the directory containing this file (pages/)
@@ -64,15 +65,50 @@ agent = get_agent()
 if agent is None:
     st.stop()
 
-# Initialize chat history
+# Initialize chat history (one agent memory thread per browser session)
 if "messages" not in st.session_state:
     st.session_state.messages = []
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+session_id = st.session_state.session_id
 
 # Display chat history
 for message in st.session_state.messages:
     with st.chat_message(message["role"]):
         st.markdown(message["content"])
 
+def stream_response(message):
+    """
+    Render the agent's answer incrementally: tool calls in a status box,
+    answer tokens as they arrive. Returns the final answer text.
+    """
+    status = st.status("🤔 Analyzing...", expanded=False)
+    result = {"answer": "", "latency": {}}
+    
+    def tokens():
+        for event in agent.stream(message, session_id=session_id):
+            if event["type"] == "tool_call":
+                status.update(label=f"🔧 Calling `{event['name']}`...")
+                status.write(f"🔧 `{event['name']}` {event['args'] or ''}")
+            elif event["type"] == "tool_result":
+                status.write(f"✅ `{event['name']}` returned")
+            elif event["type"] == "token":
+                yield event["content"]
+            elif event["type"] == "error":
+                yield event["content"]
+            elif event["type"] == "done":
+                result["answer"] = event["content"]
+                result["latency"] = event["latency"]
+    
+    streamed = st.write_stream(tokens())
+    lat = result["latency"]
+    ttft = f"{lat['ttft_s']:.2f}s" if lat.get("ttft_s") is not None else "N/A"
+    status.update(
+        label=f"✅ Done · first token {ttft} · total {lat.get('total_s', 0):.2f}s",
+        state="complete",
+    )
+    return result["answer"] or (streamed if isinstance(streamed, str) else "")
+
 # Chat input
 if prompt := st.chat_input("Ask about model health, drift, fairness, or compliance..."):
     # Add user message
@@ -80,11 +116,9 @@ if prompt := st.chat_input("Ask about model health, drift, fairness, or complian
     with st.chat_message("user"):
         st.markdown(prompt)
     
-    # Get agent response
+    # Stream agent response
     with st.chat_message("assistant"):
-        with st.spinner("🤔 Analyzing..."):
-            response = agent.chat(prompt)
-            st.markdown(response)
+        response = stream_response(prompt)
     
     # Add assistant message
     st.session_state.messages.append({"role": "assistant", "content": response})
@@ -97,20 +131,20 @@ col1, col2 = st.sidebar.columns(2)
 with col1:
     if st.button("🏥 Health Check", use_container_width=True):
         with st.spinner("Running health check..."):
-            response = agent.run_daily_check()
+            response = agent.run_daily_check(session_id=session_id)
             st.session_state.messages.append({"role": "assistant", "content": response})
             st.rerun()
 
 with col2:
     if st.button("📊 Weekly Audit", use_container_width=True):
         with st.spinner("Running weekly audit..."):
-            response = agent.run_weekly_audit()
+            response = agent.run_weekly_audit(session_id=session_id)
             st.session_state.messages.append({"role": "assistant", "content": response})
             st.rerun()
 
 if st.sidebar.button("🔄 Clear Chat", use_container_width=True):
     st.session_state.messages = []
-    agent.clear_history()
+    agent.clear_history(session_id)
     st.rerun()
 
 # Example queries
@@ -131,7 +165,7 @@ for example in examples:
     if st.sidebar.button(f"💬 {example}", key=example, use_container_width=True):
         st.session_state.messages.append({"role": "user", "content": example})
         with st.spinner("🤔 Analyzing..."):
-            response = agent.chat(example)
+            response = agent.chat(example, session_id=session_id)
             st.session_state.messages.append({"role": "assistant", "content": response})
         st.rerun()
 
@@ -156,6 +190,28 @@ try:
 except Exception as e:
     st.sidebar.info("Run a batch to see metrics")
 
+# Agent latency (time to first token / total)
+latency = agent.latency.summary()
+if latency:
+    st.sidebar.markdown("### ⏱️ Agent Latency")
+    col1, col2 = st.sidebar.columns(2)
+    with col1:
+        ttft = latency.get("ttft", {})
+        st.metric("First token p50", f"{ttft.get('p50_s', 0):.2f}s")
+    with col2:
+        total = latency.get("total", {})
+        st.metric("Total p50", f"{total.get('p50_s', 0):.2f}s")
+    st.sidebar.caption(f"p95 total: {total.get('p95_s', 0):.2f}s over {total.get('n', 0)} turns")
+
+# Fast-path routing (rule-based answers vs LLM)
+if agent.router is not None:
+    routes = agent.router.stats()
+    if routes["total"]:
+        st.sidebar.metric("Fast-path hit rate", f"{routes['fast_path_hit_rate']:.0%}")
+        with st.sidebar.expander("Per-route latency"):
+            for name, r in routes["routes"].items():
+                st.caption(f"**{name}** · {r['n']} queries · p50 {r['p50_s'] or 0:.3f}s")
+
 # Footer
 st.sidebar.markdown("---")
 st.sidebar.markdown("""
@@ -0,0 +1,180 @@
+"""
+Offline latency benchmark for GovernanceAgent.
+
+Drives `chat`, `run_daily_check` and `run_weekly_audit` against the scripted
+fake model (no network) and splits end-to-end time into:
+
+- model:     wall time inside chat-model calls (simulated by the fake)
+- tools:     wall time inside tool calls (union of overlapping calls)
+- overhead:  everything else - LangGraph, memory hook, checkpointer, routing
+
+Usage (from the repo root):
+
+    python -m smartloan_agent.agent_bench --iterations 20 --latency_ms 50 --token_delay_ms 2
+    python -m smartloan_agent.agent_bench --json bench_output.json
+
+Note: the weekly audit really runs generate_compliance_report, so each
+iteration writes a governance report to the configured report directory.
+"""
+import os, json, time, argparse, tempfile, threading, uuid
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from .agent_core import GovernanceAgent
+from .agent_fake_llm import SCRIPTS, ScriptedChatModel
+from .agent_metrics import percentile
+
+OPEN_QUERY = "What issues need immediate attention?"
+FAST_QUERY = "What's the current model performance?"
+
+SCENARIOS = {
+    # name: (script, fast_path, call)
+    "chat": ("chat", False, lambda a, sid: a.chat(OPEN_QUERY, session_id=sid)),
+    "chat_fast_path": ("chat", True, lambda a, sid: a.chat(FAST_QUERY, session_id=sid)),
+    "daily_check": ("daily_check", False, lambda a, sid: a.run_daily_check(session_id=sid)),
+    "weekly_audit": ("weekly_audit", False, lambda a, sid: a.run_weekly_audit(session_id=sid)),
+}
+
+
+# ---------- Timing Callback ----------
+def _union_seconds(intervals):
+    """Total length covered by possibly overlapping (start, end) intervals."""
+    total, cur_s, cur_e = 0.0, None, None
+    for s, e in sorted(intervals):
+        if cur_e is None or s > cur_e:
+            if cur_e is not None:
+                total += cur_e - cur_s
+            cur_s, cur_e = s, e
+        else:
+            cur_e = max(cur_e, e)
+    if cur_e is not None:
+        total += cur_e - cur_s
+    return total
+
+
+class TimingHandler(BaseCallbackHandler):
+    """Collects model/tool intervals for one turn (thread-safe: tools run in parallel)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._open, self.model, self.tools = {}, [], []
+
+    def reset(self):
+        with self._lock:
+            self._open, self.model, self.tools = {}, [], []
+
+    def _start(self, run_id):
+        with self._lock:
+            self._open[run_id] = time.perf_counter()
+
+    def _end(self, run_id, bucket):
+        t = time.perf_counter()
+        with self._lock:
+            start = self._open.pop(run_id, None)
+            if start is not None:
+                bucket.append((start, t))
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._start(run_id)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self._end(run_id, self.model)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, self.model)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        self._start(run_id)
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._end(run_id, self.tools)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, self.tools)
+
+
+# ---------- Benchmark ----------
+def run_scenario(name, iterations=20, warmup=2, latency_s=0.05, token_delay_s=0.002,
+                 memory_dir=None):
+    """Run one scenario; returns per-iteration samples in seconds."""
+    script, fast_path, call = SCENARIOS[name]
+    memory_dir = memory_dir or tempfile.mkdtemp(prefix="agent_bench_")
+    llm = ScriptedChatModel(script=SCRIPTS[script], latency_s=latency_s, token_delay_s=token_delay_s)
+    agent = GovernanceAgent(
+        llm=llm,
+        fast_path=fast_path,
+        memory_path=os.path.join(memory_dir, f"{name}.sqlite"),
+    )
+    timer = TimingHandler()
+    agent.callbacks.append(timer)
+
+    samples = {"e2e": [], "model": [], "tools": [], "tools_sum": [], "overhead": []}
+    for i in range(warmup + iterations):
+        timer.reset()
+        sid = f"bench-{uuid.uuid4().hex[:8]}"  # fresh thread: no memory growth between runs
+        t0 = time.perf_counter()
+        call(agent, sid)
+        e2e = time.perf_counter() - t0
+        if i < warmup:
+            continue
+        busy = _union_seconds(timer.model + timer.tools)
+        samples["e2e"].append(e2e)
+        samples["model"].append(_union_seconds(timer.model))
+        samples["tools"].append(_union_seconds(timer.tools))
+        samples["tools_sum"].append(sum(e - s for s, e in timer.tools))
+        samples["overhead"].append(max(0.0, e2e - busy))
+    return samples
+
+def summarize(samples):
+    return {
+        k: {"p50_ms": 1000 * percentile(v, 50), "p95_ms": 1000 * percentile(v, 95)}
+        for k, v in samples.items() if v
+    }
+
+def format_table(results):
+    cols = ["e2e", "model", "tools", "tools_sum", "overhead"]
+    head = f"{'scenario':<16}" + "".join(f"{c + ' p50/p95 (ms)':>26}" for c in cols)
+    lines = [head, "-" * len(head)]
+    for name, summ in results.items():
+        cells = "".join(
+            f"{summ[c]['p50_ms']:>12.1f} / {summ[c]['p95_ms']:>9.1f}  " if c in summ else f"{'-':>26}"
+            for c in cols
+        )
+        lines.append(f"{name:<16}{cells}")
+    return "\n".join(lines)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS))
+    ap.add_argument("--iterations", type=int, default=20)
+    ap.add_argument("--warmup", type=int, default=2)
+    ap.add_argument("--latency_ms", type=float, default=50.0, help="simulated model latency per call")
+    ap.add_argument("--token_delay_ms", type=float, default=2.0, help="simulated delay per streamed token")
+    ap.add_argument("--json", default=None, help="optional path for machine-readable results")
+    args = ap.parse_args()
+
+    memory_dir = tempfile.mkdtemp(prefix="agent_bench_")
+    results = {}
+    for name in args.scenarios:
+        samples = run_scenario(
+            name,
+            iterations=args.iterations,
+            warmup=args.warmup,
+            latency_s=args.latency_ms / 1000,
+            token_delay_s=args.token_delay_ms / 1000,
+            memory_dir=memory_dir,
+        )
+        results[name] = summarize(samples)
+
+    print(format_table(results))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(
+                {"params": vars(args), "results": results}, f, indent=2
+            )
+        print(f"[OK] results → {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,17 +3,30 @@ AI-Powered ML Governance Agent
 Updated for LangChain 1.0+ using LangGraph
 """
 import os
-from typing import TypedDict, Annotated, Sequence
+import time
+import asyncio
+import threading
+from typing import TypedDict, Annotated, Sequence, Iterator, AsyncIterator
 from langchain_openai import ChatOpenAI
-from langchain_core.messages import BaseMessage, HumanMessage, AIMessage
-from langgraph.prebuilt import create_react_agent
+from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, ToolMessage
+from langgraph.prebuilt import create_react_agent, ToolNode
+
+from .agent_memory import (
+    DEFAULT_MEMORY_PATH, TokenBudgetMemory, load_agent_config, make_checkpointer,
+)
+from .agent_metrics import LatencyStats
+from .agent_router import FastPathRouter, LLM_ROUTE
+from .agent_snapshot import TurnSnapshot, CONFIG_KEY
 
 from .agent_tools import (
     run_new_batch_processing,
     check_drift_metrics,
     run_fairness_audit,
+    optimize_fair_cutoffs,
     generate_compliance_report,
-    get_current_metrics
+    get_current_metrics,
+    search_reports,
+    explain_applicant
 )
 
 SYSTEM_PROMPT = """You are an AI governance agent for ML model monitoring at SmartLoan.
@@ -22,7 +35,10 @@ Your capabilities:
 - Monitor model performance (AUC, KS metrics)
 - Detect data drift (PSI analysis)
 - Audit fairness (disparate impact, 80% rule)
+- Propose group cutoffs that meet fairness constraints at an approval target
 - Generate compliance reports
+- Search historical reports (e.g. when a feature last drifted)
+- Explain an individual applicant's score (top reason codes)
 
 When users ask questions:
 1. Use tools to gather current data
@@ -37,49 +53,144 @@ Key thresholds to remember:
 - AUC drop > 0.05: Alert
 - Disparate Impact < 0.80: Fails fairness
 
+When several independent tools are needed, call them together in one step.
+
 Be concise, actionable, and always explain what metrics mean."""
 
+# Tool results shown in stream events are truncated to keep the UI light
+TOOL_PREVIEW_CHARS = 500
+
+# Tool calls from the same model step run concurrently on a thread pool
+TOOL_MAX_WORKERS = 4
+
+# Conversation thread used when the caller does not pass a session id
+DEFAULT_SESSION = "default"
+
+# Graph nodes whose output is surfaced as stream events; the memory hook
+# (pre_model_hook) rewrites history and must not be replayed to the client
+AGENT_NODE = "agent"
+TOOLS_NODE = "tools"
+
 
 class GovernanceAgent:
     """AI agent for ML governance using OpenAI and LangGraph"""
     
-    def __init__(self, api_key: str = None):
-        self.api_key = api_key or os.getenv("OPENAI_API_KEY")
+    def __init__(self, api_key: str = None, fast_path: bool = True,
+                 memory_path: str = None, max_history_tokens: int = None,
+                 llm=None, model: str = None):
+        """
+        llm:   any LangChain chat model (e.g. agent_fake_llm.ScriptedChatModel);
+               when omitted, ChatOpenAI is used and an API key is required
+        model: OpenAI model name (default: agent.model in config.yaml, else gpt-4o-mini)
+        """
+        agent_cfg = load_agent_config()
         
-        if not self.api_key:
-            raise ValueError(
-                "No API key found. Set OPENAI_API_KEY in .env file or pass api_key parameter."
+        if llm is None:
+            self.api_key = api_key or os.getenv("OPENAI_API_KEY")
+            
+            if not self.api_key:
+                raise ValueError(
+                    "No API key found. Set OPENAI_API_KEY in .env file or pass api_key parameter."
+                )
+            
+            # Use OpenAI
+            llm = ChatOpenAI(
+                model=model or agent_cfg.get("model", "gpt-4o-mini"),
+                temperature=0,
+                api_key=self.api_key
             )
-        
-        # Use OpenAI
-        self.llm = ChatOpenAI(
-            model="gpt-4o-mini",
-            temperature=0,
-            api_key=self.api_key
-        )
+        else:
+            self.api_key = api_key
+        self.llm = llm
         
         self.tools = [
             get_current_metrics,
             check_drift_metrics,
             run_fairness_audit,
+            optimize_fair_cutoffs,
             generate_compliance_report,
-            run_new_batch_processing
+            run_new_batch_processing,
+            search_reports,
+            explain_applicant
         ]
         
+        # Per-session conversation memory: SQLite checkpointer + token budget
+        self.checkpointer = make_checkpointer(
+            memory_path or agent_cfg.get("memory_path", DEFAULT_MEMORY_PATH)
+        )
+        max_tokens = max_history_tokens or agent_cfg.get("memory_max_tokens", 3000)
+        self.memory = TokenBudgetMemory(
+            max_tokens=max_tokens,
+            recent_tokens=agent_cfg.get("memory_recent_tokens", 2000),
+        )
+        
         # Create agent using LangGraph's create_react_agent
         self.agent = create_react_agent(
             model=self.llm,
-            tools=self.tools,
-            prompt=SYSTEM_PROMPT
+            tools=ToolNode(self.tools),
+            prompt=SYSTEM_PROMPT,
+            pre_model_hook=self.memory,
+            checkpointer=self.checkpointer,
         )
+        
+        # Latency samples: "ttft" (time to first token), "total"
+        self.latency = LatencyStats()
+        self.last_latency = {}
+        
+        # Common queries answered locally without an LLM round-trip
+        self.router = FastPathRouter() if fast_path else None
+        
+        # Extra LangChain callback handlers attached to every turn (e.g. benchmarks)
+        self.callbacks = []
+    
+    def _turn_config(self, snapshot=None, session_id=DEFAULT_SESSION) -> dict:
+        """
+        Run config for one turn: the session's conversation thread, a fresh
+        data snapshot shared by all tools (each file read once), and a
+        bounded pool for parallel tool calls.
+        """
+        return {
+            "configurable": {
+                "thread_id": str(session_id),
+                CONFIG_KEY: snapshot or TurnSnapshot(),
+            },
+            "max_concurrency": TOOL_MAX_WORKERS,
+            "callbacks": list(self.callbacks),
+        }
     
-    def chat(self, user_message: str) -> str:
-        """Chat with the agent"""
+    def _remember(self, session_id, user_message, answer):
+        """Append a fast-path exchange to the thread so follow-ups keep context."""
+        try:
+            self.agent.update_state(
+                {"configurable": {"thread_id": str(session_id)}},
+                {"messages": [HumanMessage(content=user_message), AIMessage(content=answer)]},
+                as_node="agent",
+            )
+        except Exception as e:
+            print(f"[WARN] could not store fast-path turn in memory: {e}")
+    
+    def _fast_path(self, user_message, snapshot):
+        """(route, rule-based answer) for common queries, or (None, None) to use the LLM."""
+        if self.router is None:
+            return None, None
+        return self.router.try_answer(user_message, snapshot)
+    
+    def chat(self, user_message: str, session_id: str = DEFAULT_SESSION) -> str:
+        """Chat with the agent (history is kept per session_id)"""
+        t0 = time.perf_counter()
+        snapshot = TurnSnapshot()
+        route, routed = self._fast_path(user_message, snapshot)
+        if routed is not None:
+            self._remember(session_id, user_message, routed)
+            self._record_latency(t0, None, route=route)
+            return routed
+        
         try:
             # Invoke the agent
-            result = self.agent.invoke({
-                "messages": [HumanMessage(content=user_message)]
-            })
+            result = self.agent.invoke(
+                {"messages": [HumanMessage(content=user_message)]},
+                config=self._turn_config(snapshot, session_id),
+            )
             
             # Extract the last message (AI's response)
             if result and "messages" in result:
@@ -92,25 +203,148 @@ class GovernanceAgent:
             
         except Exception as e:
             return f"Error: {str(e)}"
+        
+        finally:
+            self._record_latency(t0, None)
+    
+    # ---------- Streaming ----------
+    def stream(self, user_message: str, session_id: str = DEFAULT_SESSION) -> Iterator[dict]:
+        """
+        Stream the ReAct loop as events, in the order LangGraph produces them:
+        
+        - {"type": "tool_call", "name", "args", "id"}
+        - {"type": "tool_result", "name", "content"}
+        - {"type": "token", "content"}            (answer tokens)
+        - {"type": "done", "content", "latency"}  (always last)
+        - {"type": "error", "content"}
+        """
+        t0 = time.perf_counter()
+        state = {"t_first": None, "answer": ""}
+        snapshot = TurnSnapshot()
+        route, routed = self._fast_path(user_message, snapshot)
+        if routed is not None:
+            self._remember(session_id, user_message, routed)
+            yield {"type": "token", "content": routed}
+            yield self._done_event(t0, {"t_first": time.perf_counter(), "answer": routed}, route=route)
+            return
+        
+        try:
+            for mode, data in self.agent.stream(
+                {"messages": [HumanMessage(content=user_message)]},
+                config=self._turn_config(snapshot, session_id),
+                stream_mode=["messages", "updates"],
+            ):
+                yield from self._events(mode, data, state)
+        except Exception as e:
+            yield {"type": "error", "content": f"Error: {str(e)}"}
+        
+        yield self._done_event(t0, state)
+    
+    async def astream(self, user_message: str, session_id: str = DEFAULT_SESSION) -> AsyncIterator[dict]:
+        """
+        Async version of `stream` (same event shapes).
+        The SQLite checkpointer is synchronous, so the graph runs in a worker
+        thread and events are handed to the event loop as they are produced.
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        end = object()
+        
+        def pump():
+            try:
+                for event in self.stream(user_message, session_id):
+                    loop.call_soon_threadsafe(queue.put_nowait, event)
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, end)
+        
+        threading.Thread(target=pump, daemon=True).start()
+        while True:
+            event = await queue.get()
+            if event is end:
+                break
+            yield event
+    
+    def _events(self, mode, data, state):
+        """Translate one LangGraph stream item into zero or more events."""
+        if mode == "messages":
+            chunk, meta = data
+            # Only model tokens; tool output arrives via "updates"
+            if isinstance(chunk, ToolMessage) or meta.get("langgraph_node") != AGENT_NODE:
+                return
+            text = chunk.content if isinstance(chunk.content, str) else ""
+            if text:
+                if state["t_first"] is None:
+                    state["t_first"] = time.perf_counter()
+                yield {"type": "token", "content": text}
+            return
+        
+        # mode == "updates": {node_name: {"messages": [...]}}
+        data = data or {}
+        for node in (AGENT_NODE, TOOLS_NODE):
+            for msg in (data.get(node) or {}).get("messages", []):
+                if isinstance(msg, AIMessage):
+                    for tc in msg.tool_calls or []:
+                        yield {
+                            "type": "tool_call",
+                            "name": tc.get("name"),
+                            "args": tc.get("args", {}),
+                            "id": tc.get("id"),
+                        }
+                    if not msg.tool_calls and isinstance(msg.content, str):
+                        state["answer"] = msg.content
+                elif isinstance(msg, ToolMessage):
+                    yield {
+                        "type": "tool_result",
+                        "name": msg.name,
+                        "content": str(msg.content)[:TOOL_PREVIEW_CHARS],
+                    }
+    
+    def _done_event(self, t0, state, route=LLM_ROUTE):
+        self._record_latency(t0, state["t_first"], route=route)
+        return {
+            "type": "done",
+            "content": state["answer"],
+            "latency": dict(self.last_latency),
+        }
+    
+    def _record_latency(self, t0, t_first, route=LLM_ROUTE):
+        """
+        Record ttft/total for the turn. Fast-path turns are already recorded
+        per route by the router; LLM turns are recorded under LLM_ROUTE.
+        Turns without a streamed token (plain chat()) have no ttft sample.
+        """
+        t_end = time.perf_counter()
+        self.last_latency = {
+            "route": route,
+            "ttft_s": (t_first - t0) if t_first is not None else None,
+            "total_s": t_end - t0,
+        }
+        if t_first is not None:
+            self.latency.record("ttft", self.last_latency["ttft_s"])
+        self.latency.record("total", self.last_latency["total_s"])
+        if self.router is not None and route == LLM_ROUTE:
+            self.router.record(LLM_ROUTE, self.last_latency["total_s"])
     
-    def run_daily_check(self) -> str:
+    def run_daily_check(self, session_id: str = DEFAULT_SESSION) -> str:
         """Automated daily health check"""
         return self.chat(
             "Run a daily health check. Check current metrics, drift, and performance. "
-            "Flag any issues that need attention and suggest actions."
+            "Flag any issues that need attention and suggest actions.",
+            session_id=session_id,
         )
     
-    def run_weekly_audit(self) -> str:
+    def run_weekly_audit(self, session_id: str = DEFAULT_SESSION) -> str:
         """Automated weekly audit"""
         return self.chat(
             "Run a comprehensive weekly audit. Check drift, performance, "
             "fairness metrics, and generate a compliance report. "
-            "Provide an executive summary."
+            "Provide an executive summary.",
+            session_id=session_id,
         )
     
-    def clear_history(self):
-        """Clear conversation history"""
-        pass
+    def clear_history(self, session_id: str = DEFAULT_SESSION):
+        """Clear conversation history for one session"""
+        self.checkpointer.delete_thread(str(session_id))
 
 
 # Convenience function for quick testing
@@ -0,0 +1,116 @@
+"""
+Scripted fake chat model for offline agent runs and benchmarks.
+
+Replays a fixed sequence of steps per user turn: each step is either a set of
+tool calls or a final answer. Latency is simulated with a per-call delay plus
+a per-token delay while streaming, so agent-side overhead can be measured
+without OpenAI in the loop.
+
+    llm = ScriptedChatModel(script=SCRIPTS["weekly_audit"], token_delay_s=0.005)
+    agent = GovernanceAgent(llm=llm)
+"""
+import json
+import time
+import uuid
+from typing import Iterator, List
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+# Typical tool sequences for the agent's canned prompts
+SCRIPTS = {
+    "chat": [
+        {"tool_calls": [{"name": "get_current_metrics", "args": {}}]},
+        {"content": "AUC and KS are within tolerance, but fico_mid shows material drift "
+                    "(PSI above the 0.20 alert threshold). Track it for 7-14 days and "
+                    "review SHAP sensitivity if it persists."},
+    ],
+    "daily_check": [
+        {"tool_calls": [
+            {"name": "get_current_metrics", "args": {}},
+            {"name": "check_drift_metrics", "args": {}},
+        ]},
+        {"content": "Daily check: performance stable, drift ALERT on fico_mid and "
+                    "log_annual_inc. Action: monitor PSI trend and confirm upstream data."},
+    ],
+    "weekly_audit": [
+        {"tool_calls": [
+            {"name": "get_current_metrics", "args": {}},
+            {"name": "check_drift_metrics", "args": {}},
+            {"name": "run_fairness_audit", "args": {"protected_attr": "income_group_auth"}},
+        ]},
+        {"tool_calls": [{"name": "generate_compliance_report", "args": {}}]},
+        {"content": "Weekly audit: overall ALERT driven by drift; performance and fairness "
+                    "within tolerance. Compliance report generated for the model committee."},
+    ],
+    "fair_cutoffs": [
+        {"tool_calls": [{"name": "optimize_fair_cutoffs",
+                         "args": {"protected_attr": "income_group_auth", "target_approval": 0.40}}]},
+        {"content": "Group cutoffs meeting DIR >= 0.80 and the TPR_good tolerance exist at a "
+                    "40% approval rate; the frontier shows the cost of stricter DIR floors."},
+    ],
+}
+
+
+class ScriptedChatModel(BaseChatModel):
+    """
+    Deterministic chat model replaying `script` for every user turn.
+    The step is chosen from the number of AI messages since the last human
+    message, so the model is stateless and safe to share between sessions.
+    """
+
+    script: List[dict]
+    latency_s: float = 0.0        # simulated time before the first token
+    token_delay_s: float = 0.0    # simulated delay between streamed tokens
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted-fake"
+
+    def bind_tools(self, tools, **kwargs):
+        return self  # tool calls come from the script
+
+    def _step(self, messages: List[BaseMessage]) -> AIMessage:
+        last_human = max(
+            (i for i, m in enumerate(messages) if isinstance(m, HumanMessage)), default=-1
+        )
+        i = sum(1 for m in messages[last_human + 1:] if isinstance(m, AIMessage))
+        step = self.script[min(i, len(self.script) - 1)]
+        if step.get("tool_calls"):
+            return AIMessage(
+                content="",
+                tool_calls=[
+                    {"name": tc["name"], "args": dict(tc.get("args", {})),
+                     "id": f"call_{uuid.uuid4().hex[:8]}"}
+                    for tc in step["tool_calls"]
+                ],
+            )
+        return AIMessage(content=step.get("content", ""))
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        msg = self._step(messages)
+        tokens = len(msg.content.split()) if msg.content else 0
+        time.sleep(self.latency_s + self.token_delay_s * tokens)
+        return ChatResult(generations=[ChatGeneration(message=msg)])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        msg = self._step(messages)
+        time.sleep(self.latency_s)
+        if msg.tool_calls:
+            yield ChatGenerationChunk(message=AIMessageChunk(
+                content="",
+                tool_call_chunks=[
+                    {"name": tc["name"], "args": json.dumps(tc["args"]), "id": tc["id"], "index": i}
+                    for i, tc in enumerate(msg.tool_calls)
+                ],
+            ))
+            return
+        for word in msg.content.split(" "):
+            if self.token_delay_s:
+                time.sleep(self.token_delay_s)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
+            if run_manager:
+                run_manager.on_llm_new_token(word + " ", chunk=chunk)
+            yield chunk
+
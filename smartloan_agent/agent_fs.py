@@ -5,7 +5,9 @@ from pathlib import Path
 import pandas as pd
 import numpy as np
 from jinja2 import Template
-from sklearn.metrics import roc_auc_score
+
+from smartloan_agent.perf_engine import compute_auc_ks
+from smartloan_agent.report_catalog import register_report
 
 CFG_PATH = "monitor/config.yaml"
 BATCH_OUT = "monitor/batch_metrics_log.csv"
@@ -46,30 +48,7 @@ def _compute_auc_ks_from_csv(csv_path, y_col="label", p_col="score", max_rows=10
             encoding="utf-8-sig"
         )
         
-        if y_col not in df.columns or p_col not in df.columns:
-            return None, None
-        
-        # Convert to numeric and filter valid rows
-        y = pd.to_numeric(df[y_col], errors="coerce")
-        p = pd.to_numeric(df[p_col], errors="coerce")
-        mask = (~y.isna()) & (~p.isna())
-        y, p = y[mask].values, p[mask].values
-        
-        if len(y) < 5 or len(np.unique(y)) < 2:
-            return None, None
-        
-        # Compute AUC
-        auc = float(roc_auc_score(y, p))
-        
-        # Compute KS statistic
-        tmp = pd.DataFrame({"y": y, "p": p}).sort_values("p")
-        denom_good = max(1, (1 - tmp["y"]).sum())
-        denom_bad = max(1, tmp["y"].sum())
-        tmp["cum_good"] = (1 - tmp["y"]).cumsum() / denom_good
-        tmp["cum_bad"] = (tmp["y"]).cumsum() / denom_bad
-        ks = float(np.max(np.abs(tmp["cum_bad"] - tmp["cum_good"])))
-        
-        return auc, ks
+        return compute_auc_ks(df, y_col=y_col, p_col=p_col)
         
     except Exception as e:
         print(f"Warning: AUC/KS computation failed - {e}")
@@ -85,11 +64,13 @@ class SmartLoanAgentFS:
     - Generates Markdown governance report
     """
     
-    def __init__(self, cfg_path=CFG_PATH, template_path=TEMPLATE_PATH):
-        # Load config
-        if os.path.exists(cfg_path):
+    def __init__(self, cfg_path=CFG_PATH, template_path=TEMPLATE_PATH, cfg=None):
+        # Load config (or reuse an already-parsed one, e.g. the agent's turn snapshot)
+        if cfg is not None:
+            self.cfg = cfg
+        elif os.path.exists(cfg_path):
             with open(cfg_path, "r", encoding="utf-8") as f:
-                self.cfg = yaml.safe_load(f)
+                self.cfg = yaml.safe_load(f) or {}
         else:
             self.cfg = {}
         
@@ -119,10 +100,13 @@ class SmartLoanAgentFS:
         
         return df.iloc[0].to_dict()
 
-    def run(self):
-        """Main execution: read metrics, apply thresholds, generate report."""
+    def run(self, row=None):
+        """
+        Main execution: read metrics, apply thresholds, generate report.
+        `row` skips re-reading the batch log when the caller already has it.
+        """
         cfg = self.cfg
-        row = self._latest_batch_row()
+        row = dict(row) if row is not None else self._latest_batch_row()
 
         # ----- Extract metrics from batch summary -----
         psi_val = _safe_float(row.get("psi_max_value"))
@@ -237,5 +221,6 @@ class SmartLoanAgentFS:
         
         with open(out_path, "w", encoding="utf-8") as f:
             f.write(md)
+        register_report(str(out_path), batch_id=row.get("batch_time"))
 
         return metrics, str(out_path)
\ No newline at end of file
@@ -0,0 +1,173 @@
+"""
+Bounded-token conversation memory for GovernanceAgent.
+
+- Per-session threads persisted by a LangGraph SQLite checkpointer
+- A pre-model hook keeps the conversation under a token budget: recent turns
+  stay verbatim, older turns are compacted into one summary message holding
+  short Q/A notes plus the latest result of each tool (cached tool results)
+
+Compaction is rule-based (no extra LLM call), so prompt size and latency
+stay flat as a conversation grows.
+"""
+import os, sqlite3
+from pathlib import Path
+
+import yaml
+from langchain_core.messages import (
+    AIMessage, HumanMessage, RemoveMessage, SystemMessage, ToolMessage,
+)
+from langchain_core.messages.utils import count_tokens_approximately
+from langgraph.graph.message import REMOVE_ALL_MESSAGES
+
+CFG_PATH = "monitor/config.yaml"
+DEFAULT_MEMORY_PATH = "monitor/cache/agent_memory.sqlite"
+
+SUMMARY_ID = "memory-summary"
+SUMMARY_HEADER = "Conversation memory (older turns, compacted):"
+QA_CHARS = 300     # per compacted question/answer
+TOOL_CHARS = 400   # per cached tool result
+RECENT_SHARE = 0.8 # verbatim turns get at most this share; the rest is kept for the summary
+
+
+def load_agent_config(cfg_path=CFG_PATH):
+    """Read the `agent:` section of config.yaml (empty dict if missing)."""
+    if not os.path.exists(cfg_path):
+        return {}
+    with open(cfg_path, "r", encoding="utf-8") as f:
+        cfg = yaml.safe_load(f) or {}
+    return cfg.get("agent") or {}
+
+def make_checkpointer(path=DEFAULT_MEMORY_PATH):
+    """SQLite checkpointer shared by all sessions (thread-safe connection)."""
+    from langgraph.checkpoint.sqlite import SqliteSaver
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(path, check_same_thread=False)
+    saver = SqliteSaver(conn)
+    saver.setup()
+    return saver
+
+
+# ---------- Compaction ----------
+def _text(msg):
+    c = msg.content
+    if isinstance(c, list):
+        c = " ".join(p.get("text", "") if isinstance(p, dict) else str(p) for p in c)
+    return " ".join(str(c).split())
+
+def _text_lines(msg):
+    return str(msg.content).splitlines()
+
+def _clip(text, n):
+    return text if len(text) <= n else text[: n - 1] + "…"
+
+def split_turns(messages):
+    """Split a message list into turns, each starting at a HumanMessage."""
+    turns, cur = [], []
+    for m in messages:
+        if isinstance(m, HumanMessage) and cur:
+            turns.append(cur)
+            cur = []
+        cur.append(m)
+    if cur:
+        turns.append(cur)
+    return turns
+
+def _parse_summary(msg):
+    """Previous summary -> (qa_notes list, {tool: result})."""
+    notes, tools, section = [], {}, None
+    for line in _text_lines(msg):
+        if line == "Earlier turns:":
+            section = "qa"
+        elif line == "Latest tool results:":
+            section = "tools"
+        elif section == "qa" and line.startswith("- "):
+            notes.append(line[2:])
+        elif section == "tools" and line.startswith("- ") and ": " in line:
+            name, result = line[2:].split(": ", 1)
+            tools[name] = result
+    return notes, tools
+
+def _render_summary(notes, tools):
+    lines = [SUMMARY_HEADER, "Earlier turns:"]
+    lines += [f"- {n}" for n in notes]
+    if tools:
+        lines.append("Latest tool results:")
+        lines += [f"- {k}: {v}" for k, v in tools.items()]
+    return SystemMessage(content="\n".join(lines), id=SUMMARY_ID)
+
+def compact_turn(turn):
+    """One turn -> (Q/A note, {tool_name: clipped result})."""
+    question = next((_text(m) for m in turn if isinstance(m, HumanMessage)), "")
+    answer = next(
+        (_text(m) for m in reversed(turn) if isinstance(m, AIMessage) and not m.tool_calls),
+        "",
+    )
+    tools = {
+        m.name: _clip(_text(m), TOOL_CHARS)
+        for m in turn if isinstance(m, ToolMessage) and m.name
+    }
+    note = f"Q: {_clip(question, QA_CHARS)} → A: {_clip(answer, QA_CHARS)}"
+    return note, tools
+
+
+class TokenBudgetMemory:
+    """
+    LangGraph pre-model hook enforcing a token budget on the thread history.
+
+    max_tokens:    budget for the whole history sent to the model
+    recent_tokens: budget for verbatim recent turns (the current turn is always kept),
+                   capped at RECENT_SHARE of max_tokens so the summary is never starved
+    """
+
+    def __init__(self, max_tokens=3000, recent_tokens=2000):
+        self.max_tokens = int(max_tokens)
+        self.recent_tokens = min(int(recent_tokens), int(self.max_tokens * RECENT_SHARE))
+
+    @staticmethod
+    def count(messages):
+        return count_tokens_approximately(messages)
+
+    def __call__(self, state):
+        messages = list(state["messages"])
+        if self.count(messages) <= self.max_tokens:
+            return {}
+        return {"messages": [RemoveMessage(id=REMOVE_ALL_MESSAGES)] + self.compact(messages)}
+
+    def compact(self, messages):
+        """Return the compacted message list: [summary, *recent turns]."""
+        prev = None
+        if messages and isinstance(messages[0], SystemMessage) and messages[0].id == SUMMARY_ID:
+            prev, messages = messages[0], messages[1:]
+        notes, tools = _parse_summary(prev) if prev is not None else ([], {})
+
+        turns = split_turns(messages)
+        # Keep the newest turns verbatim while they fit; the current turn always stays
+        keep, used = [], 0
+        for turn in reversed(turns):
+            t = self.count(turn)
+            if keep and used + t > self.recent_tokens:
+                break
+            keep.insert(0, turn)
+            used += t
+        old = turns[: len(turns) - len(keep)]
+
+        for turn in old:
+            note, turn_tools = compact_turn(turn)
+            notes.append(note)
+            for name, result in turn_tools.items():
+                tools.pop(name, None)  # re-insert so dict order = recency
+                tools[name] = result
+
+        # Bound the summary itself (it always gets at least max - recent tokens):
+        # drop the oldest notes first, then the oldest tool results
+        budget = max(self.max_tokens - used, self.max_tokens - self.recent_tokens)
+        summary = _render_summary(notes, tools)
+        while notes and self.count([summary]) > budget:
+            notes.pop(0)
+            summary = _render_summary(notes, tools)
+        while tools and self.count([summary]) > budget:
+            tools.pop(next(iter(tools)))
+            summary = _render_summary(notes, tools)
+
+        recent = [m for turn in keep for m in turn]
+        return ([summary] if (notes or tools) else []) + recent
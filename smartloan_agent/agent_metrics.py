@@ -0,0 +1,58 @@
+"""
+Lightweight latency bookkeeping for the governance agent.
+Thread-safe, bounded in memory, no external dependencies.
+"""
+import math, threading
+from collections import defaultdict, deque
+
+
+def percentile(values, q):
+    """Nearest-rank percentile (q in 0..100); None for an empty sample."""
+    vals = sorted(values)
+    if not vals:
+        return None
+    k = max(0, min(len(vals) - 1, int(math.ceil(q / 100.0 * len(vals))) - 1))
+    return vals[k]
+
+
+class LatencyStats:
+    """
+    Rolling latency samples per metric name (e.g. "ttft", "total").
+    Keeps the last `maxlen` samples per name.
+    """
+
+    def __init__(self, maxlen=1000):
+        self.maxlen = maxlen
+        self._lock = threading.Lock()
+        self._samples = defaultdict(lambda: deque(maxlen=self.maxlen))
+
+    def record(self, name, seconds):
+        if seconds is None:
+            return
+        with self._lock:
+            self._samples[name].append(float(seconds))
+
+    def count(self, name):
+        with self._lock:
+            return len(self._samples.get(name, ()))
+
+    def summary(self):
+        """{name: {n, mean_s, p50_s, p95_s, max_s}}"""
+        with self._lock:
+            snap = {k: list(v) for k, v in self._samples.items()}
+        out = {}
+        for name, vals in snap.items():
+            if not vals:
+                continue
+            out[name] = {
+                "n": len(vals),
+                "mean_s": sum(vals) / len(vals),
+                "p50_s": percentile(vals, 50),
+                "p95_s": percentile(vals, 95),
+                "max_s": max(vals),
+            }
+        return out
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
@@ -0,0 +1,206 @@
+"""
+Deterministic fast-path router for common agent queries.
+
+Short, unambiguous questions ("What's the current model performance?",
+"Are there any drifted features?", "Generate a compliance report") are
+answered straight from batch_metrics_log.csv + config thresholds using the
+rule-based templates. Anything open-ended falls through to the LLM.
+"""
+import re, json, time, threading
+from collections import Counter
+
+from .agent_metrics import LatencyStats
+from .agent_snapshot import TurnSnapshot, thaw
+from .compliance_rules import (
+    thresholds_from_config,
+    check_flags,
+    rule_based_summary,
+    rule_based_actions,
+    safe_format,
+)
+
+LLM_ROUTE = "llm"
+
+# Longer messages are treated as open-ended
+MAX_FAST_PATH_WORDS = 12
+
+# Words that signal reasoning/explanation -> always use the LLM
+OPEN_ENDED = re.compile(
+    r"\b(why|explain|should|could|would|compare|recommend|ready|what if|"
+    r"impact|cause|mean|simple terms|audit|weekly|daily)\b"
+)
+
+ROUTES = {
+    "performance": [
+        r"^(what('?s| is) )?(the )?(current |latest )?model performance\??$",
+        r"^(what('?s| are) )?(the )?(current |latest )?(auc|ks|auc and ks|performance metrics)\??$",
+        r"^how('?s| is) the model (doing|performing)\??$",
+        r"^show( me)? (the )?(current |latest )?(performance|metrics)\??$",
+    ],
+    "drift": [
+        r"^(are there )?any drift(ed)? features\??$",
+        r"^(is there )?(any )?(data )?drift\??$",
+        r"^(which|what) features (have )?drift(ed)?\??$",
+        r"^(show( me)? )?(the )?(current |latest )?(psi|drift)( scores| metrics| status)?\??$",
+    ],
+    "compliance_report": [
+        r"^(please )?(generate|create|produce|make)( me)? (a |the )?(new )?compliance report\??$",
+        r"^compliance report( please)?\??$",
+    ],
+}
+_COMPILED = {name: [re.compile(p) for p in pats] for name, pats in ROUTES.items()}
+
+
+def normalize(message):
+    """Lower-case, unify apostrophes, collapse whitespace, strip trailing punctuation."""
+    text = (message or "").lower().replace("’", "'")
+    text = re.sub(r"\s+", " ", text).strip()
+    return re.sub(r"[.!]+$", "", text).strip()
+
+
+# ---------- Answer Templates ----------
+def _level(flag_alert, flag_warn=False):
+    return "🔴 ALERT" if flag_alert else ("🟠 WARN" if flag_warn else "🟢 OK")
+
+def answer_performance(snap):
+    m = thaw(snap.latest_row)
+    th = thresholds_from_config(snap.cfg)
+    flags = check_flags(m, th)
+    base = snap.cfg.get("baseline") or {}
+    return "\n".join([
+        f"**Current model performance** (batch {m.get('batch_time', 'N/A')}, "
+        f"model {m.get('model_version', 'N/A')})",
+        "",
+        f"- **AUC:** {safe_format(m.get('auc'))} (baseline {safe_format(base.get('roc_auc'))}, "
+        f"drop {safe_format(m.get('auc_drop'))}) — {_level(flags['auc_drop_alert'])}",
+        f"- **KS:** {safe_format(m.get('ks'))} (baseline {safe_format(base.get('ks'))}, "
+        f"drop {safe_format(m.get('ks_drop'))}) — {_level(flags['ks_drop_alert'])}",
+        "",
+        rule_based_summary(m, flags, th),
+        "",
+        "**Recommended actions**",
+        rule_based_actions(flags, m),
+    ])
+
+def answer_drift(snap):
+    m = thaw(snap.latest_row)
+    th = thresholds_from_config(snap.cfg)
+    flags = check_flags(m, th)
+    try:
+        top = json.loads(m.get("top_drift_json") or "[]")
+    except (TypeError, ValueError):
+        top = []
+
+    lines = [
+        f"**Drift status** (batch {m.get('batch_time', 'N/A')}) — "
+        f"{_level(flags['psi_alert'], flags['psi_warn'])}",
+        "",
+        f"Thresholds: PSI > {th['psi_warn']} warn, > {th['psi_alert']} alert.",
+        "",
+    ]
+    drifted = [t for t in top if (t.get("psi") or 0) > th["psi_warn"]]
+    if top:
+        lines.append("| Feature | PSI | Level |")
+        lines.append("|---|---|---|")
+        for t in top:
+            psi = t.get("psi")
+            lvl = _level(psi is not None and psi > th["psi_alert"],
+                         psi is not None and psi > th["psi_warn"])
+            lines.append(f"| {t.get('feature')} | {safe_format(psi, 4)} | {lvl} |")
+        lines.append("")
+    lines.append(
+        f"{len(drifted)} of the top {len(top)} features exceed the warning threshold."
+        if top else "No per-feature drift recorded for this batch."
+    )
+    lines += ["", "**Recommended actions**", rule_based_actions(flags, m)]
+    return "\n".join(lines)
+
+def answer_compliance_report(snap):
+    from .agent_fs import SmartLoanAgentFS
+    metrics, report_path = SmartLoanAgentFS(cfg=snap.cfg).run(row=snap.latest_row)
+    m = thaw(snap.latest_row)
+    th = thresholds_from_config(snap.cfg)
+    flags = check_flags(m, th)
+    return "\n".join([
+        f"**Compliance report generated:** `{report_path}`",
+        "",
+        f"- Overall status: **{metrics['overall']}**",
+        f"- PSI: {metrics['psi_level']} · AUC: {metrics['auc_level']} · "
+        f"KS: {metrics['ks_level']} · Fairness: {metrics['fairness_level']}",
+        "",
+        rule_based_summary(m, flags, th),
+        "",
+        "**Recommended actions**",
+        rule_based_actions(flags, m),
+    ])
+
+ANSWERS = {
+    "performance": answer_performance,
+    "drift": answer_drift,
+    "compliance_report": answer_compliance_report,
+}
+
+
+# ---------- Router ----------
+class FastPathRouter:
+    """
+    Pattern-based intent router with per-route latency and hit-rate stats.
+    Route names: keys of ROUTES, plus LLM_ROUTE for fall-through queries.
+    """
+
+    def __init__(self):
+        self.latency = LatencyStats()
+        self._counts = Counter()
+        self._lock = threading.Lock()
+
+    def match(self, message):
+        """Route name for the message, or None if it should go to the LLM."""
+        text = normalize(message)
+        if not text or len(text.split()) > MAX_FAST_PATH_WORDS or OPEN_ENDED.search(text):
+            return None
+        for name, patterns in _COMPILED.items():
+            if any(p.match(text) for p in patterns):
+                return name
+        return None
+
+    def try_answer(self, message, snapshot=None):
+        """
+        Answer locally if possible. Returns (route, text) or (None, None).
+        Failures (e.g. no batch log yet) fall through to the LLM.
+        """
+        route = self.match(message)
+        if route is None:
+            return None, None
+        t0 = time.perf_counter()
+        try:
+            text = ANSWERS[route](snapshot or TurnSnapshot())
+        except Exception:
+            return None, None
+        self.record(route, time.perf_counter() - t0)
+        return route, text
+
+    def record(self, route, seconds):
+        with self._lock:
+            self._counts[route] += 1
+        self.latency.record(route, seconds)
+
+    def stats(self):
+        """{"total", "fast_path_hit_rate", "routes": {route: {n, share, p50_s, p95_s}}}"""
+        with self._lock:
+            counts = dict(self._counts)
+        total = sum(counts.values())
+        lat = self.latency.summary()
+        hits = total - counts.get(LLM_ROUTE, 0)
+        return {
+            "total": total,
+            "fast_path_hit_rate": (hits / total) if total else None,
+            "routes": {
+                r: {
+                    "n": n,
+                    "share": n / total,
+                    "p50_s": lat.get(r, {}).get("p50_s"),
+                    "p95_s": lat.get(r, {}).get("p95_s"),
+                }
+                for r, n in sorted(counts.items())
+            },
+        }
@@ -0,0 +1,106 @@
+"""
+Per-turn data snapshot shared by the agent tools.
+
+One agent turn may call several tools (often concurrently). Instead of each
+tool re-reading batch_metrics_log.csv / config.yaml / reference_stats.pkl,
+the turn gets one TurnSnapshot: every file is read at most once, on first
+use, and handed out as a read-only view.
+"""
+import os, pickle, threading
+from types import MappingProxyType
+
+import pandas as pd
+import yaml
+
+CFG_PATH = "monitor/config.yaml"
+BATCH_OUT = "monitor/batch_metrics_log.csv"
+REF_PATH = "monitor/reference_stats.pkl"
+
+# RunnableConfig["configurable"] key the agent uses to pass the snapshot
+CONFIG_KEY = "snapshot"
+
+
+def freeze(obj):
+    """Recursively convert dicts/lists to read-only MappingProxyType/tuples."""
+    if isinstance(obj, dict):
+        return MappingProxyType({k: freeze(v) for k, v in obj.items()})
+    if isinstance(obj, (list, tuple)):
+        return tuple(freeze(v) for v in obj)
+    return obj
+
+def thaw(obj):
+    """Inverse of `freeze` (for JSON output / pandas)."""
+    if isinstance(obj, MappingProxyType):
+        return {k: thaw(v) for k, v in obj.items()}
+    if isinstance(obj, tuple):
+        return [thaw(v) for v in obj]
+    return obj
+
+
+class TurnSnapshot:
+    """
+    Immutable, lazily loaded view of the monitoring state for one agent turn.
+    Safe to share between tool threads: each source is loaded once under a lock.
+    """
+
+    def __init__(self, batch_path=BATCH_OUT, cfg_path=CFG_PATH, ref_path=REF_PATH):
+        self._paths = {"batch": batch_path, "cfg": cfg_path, "ref": ref_path}
+        self._lock = threading.Lock()
+        self._data = {}
+
+    def _get(self, name, loader):
+        with self._lock:
+            if name not in self._data:
+                try:
+                    self._data[name] = (freeze(loader(self._paths[name])), None)
+                except Exception as e:
+                    self._data[name] = (None, e)
+            value, err = self._data[name]
+        if err is not None:
+            raise err
+        return value
+
+    @staticmethod
+    def _load_batch(path):
+        if not os.path.exists(path):
+            raise FileNotFoundError(
+                f"{path} not found. Run New Batch → Run Monitor first."
+            )
+        df = pd.read_csv(path, engine="c", encoding="utf-8-sig").tail(1)
+        if df.empty:
+            raise ValueError(f"{path} is empty.")
+        return df.iloc[0].to_dict()
+
+    @staticmethod
+    def _load_cfg(path):
+        if not os.path.exists(path):
+            return {}
+        with open(path, "r", encoding="utf-8") as f:
+            return yaml.safe_load(f) or {}
+
+    @staticmethod
+    def _load_ref(path):
+        with open(path, "rb") as f:
+            ref = pickle.load(f)
+        return ref["features"] if (isinstance(ref, dict) and "features" in ref) else ref
+
+    @property
+    def latest_row(self):
+        """Last row of batch_metrics_log.csv (read-only mapping)."""
+        return self._get("batch", self._load_batch)
+
+    @property
+    def cfg(self):
+        """Parsed config.yaml (read-only mapping)."""
+        return self._get("cfg", self._load_cfg)
+
+    @property
+    def ref_stats(self):
+        """Per-feature reference statistics (read-only mapping)."""
+        return self._get("ref", self._load_ref)
+
+
+def snapshot_from_config(config):
+    """Snapshot passed by the agent for this turn, or a fresh one (direct calls)."""
+    snap = ((config or {}).get("configurable") or {}).get(CONFIG_KEY)
+    return snap if isinstance(snap, TurnSnapshot) else TurnSnapshot()
@@ -1,9 +1,24 @@
-
-
 """
 Agent tools - wraps existing functionality for LangChain
+
+Latency budgets (warm cache, demo-sized files; a [WARN] is printed when exceeded):
+- run_new_batch_processing  < 500 ms  (drift + AUC/KS over the whole batch)
+- check_drift_metrics       < 200 ms  (reads the per-feature PSI table)
+- run_fairness_audit        < 200 ms  (DIR / TPR parity on the fairness set)
+- optimize_fair_cutoffs     < 300 ms  (constrained group cutoffs + DIR frontier)
+- get_current_metrics       < 50 ms   (last row of the batch log)
+- search_reports            < 100 ms  (BM25 over the local report index)
+- explain_applicant         < 50 ms   (memory-mapped explanation store lookup)
+
+Outputs are compact: per-feature / per-group lists are capped at MAX_ITEMS
+rows and floats are rounded, so tool results stay small in the LLM context.
 """
 from langchain_core.tools import tool
+from langchain_core.runnables import RunnableConfig
+from collections import OrderedDict
+import threading
+import time
+import numpy as np
 import pandas as pd
 import sys
 import os
@@ -11,56 +26,386 @@ import os
 # Add parent directory to path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from smartloan_agent.agent_snapshot import snapshot_from_config, thaw
+from smartloan_agent.drift_engine import feature_drift_table, summarize_drift, psi_level
+from smartloan_agent.drift_metrics import drift_metric_config
+from smartloan_agent.perf_engine import compute_auc_ks, performance_drops
+from smartloan_agent.fairness_engine import (
+    FAIRNESS_PATH, SKETCH_BINS, simple_fairness, optimize_group_cutoffs, optimizer_config,
+    sketch_file, sketch_fairness,
+)
+from smartloan_agent.report_index import get_report_index
+from smartloan_agent.explanation_store import find_store
+
+BATCH_CSV = "monitor/X_new.csv"
+FEAT_OUT = "monitor/metrics_log.csv"
+
+MAX_ITEMS = 10        # max rows per list in a tool result
+FLOAT_DIGITS = 4
+CSV_CACHE_SIZE = 4    # distinct CSV files kept in memory
+
+LATENCY_BUDGET_MS = {
+    "run_new_batch_processing": 500,
+    "check_drift_metrics": 200,
+    "run_fairness_audit": 200,
+    "optimize_fair_cutoffs": 300,
+    "get_current_metrics": 50,
+    "search_reports": 100,
+    "explain_applicant": 50,
+}
+
+# Friendly names the LLM may use for fairness group columns
+GROUP_ALIASES = {
+    "income_group": "income_group_auth",
+    "income": "income_group_auth",
+    "state": "state_group",
+    "addr_state": "state_group",
+}
+
+
+# ---------- Helpers ----------
+_csv_cache = OrderedDict()
+_csv_lock = threading.Lock()
+
+def _read_csv_cached(path, **kwargs):
+    """
+    Small LRU cache of parsed CSVs keyed by (path, mtime, size, read args):
+    a file is only re-read after it changes on disk. Callers must not mutate
+    the returned frame.
+    """
+    st = os.stat(path)
+    key = (os.path.abspath(path), st.st_mtime_ns, st.st_size, tuple(sorted(kwargs.items())))
+    with _csv_lock:
+        if key in _csv_cache:
+            _csv_cache.move_to_end(key)
+            return _csv_cache[key]
+    df = pd.read_csv(path, **kwargs)
+    with _csv_lock:
+        _csv_cache[key] = df
+        while len(_csv_cache) > CSV_CACHE_SIZE:
+            _csv_cache.popitem(last=False)
+    return df
+
+def _r(v):
+    """Round floats for compact output; NaN/inf -> None."""
+    if v is None:
+        return None
+    try:
+        f = float(v)
+    except (TypeError, ValueError):
+        return v
+    return round(f, FLOAT_DIGITS) if np.isfinite(f) else None
+
+def _finish(name, out, t0):
+    """Attach elapsed_ms and warn when the tool's latency budget is exceeded."""
+    elapsed = 1000 * (time.perf_counter() - t0)
+    out["elapsed_ms"] = round(elapsed, 1)
+    budget = LATENCY_BUDGET_MS.get(name)
+    if budget is not None and elapsed > budget:
+        print(f"[WARN] {name} took {elapsed:.0f} ms (budget {budget} ms)")
+    return out
+
+def _thresholds(cfg):
+    return (
+        float(cfg.get("psi_threshold_warn", 0.10)),
+        float(cfg.get("psi_threshold_alert", 0.20)),
+        float(cfg.get("missing_rate_alert", 0.10)),
+    )
+
+def _fairness_frame(protected_attr):
+    """(fairness set, resolved group column, None) or (None, None, error dict)."""
+    if not os.path.exists(FAIRNESS_PATH):
+        return None, None, {"error": f"{FAIRNESS_PATH} not found"}
+    df = _read_csv_cached(FAIRNESS_PATH, index_col=0)
+    group_col = GROUP_ALIASES.get(protected_attr, protected_attr)
+    if group_col not in df.columns:
+        skip = {"loan_status", "pd_score"}
+        return None, None, {
+            "error": f"unknown group column '{protected_attr}'",
+            "available": [c for c in df.columns if c not in skip][:MAX_ITEMS],
+        }
+    return df, group_col, None
+
+def _drift_rows(feat_df, cfg):
+    """Per-feature table -> (drifted rows sorted by PSI desc, level counts)."""
+    warn, alert, miss_alert = _thresholds(cfg)
+    psi = pd.to_numeric(feat_df["psi"], errors="coerce")
+    miss = pd.to_numeric(feat_df.get("missing_rate_new", pd.Series(np.nan, index=feat_df.index)),
+                         errors="coerce")
+    d = feat_df.assign(psi_num=psi, miss_num=miss).sort_values(
+        "psi_num", ascending=False, na_position="last"
+    )
+
+    rows, counts = [], {"OK": 0, "WARN": 0, "ALERT": 0, "N/A": 0}
+    for _, r in d.iterrows():
+        # worst level over the configured drift metrics when available, else PSI
+        level = r.get("drift_level")
+        if level not in counts:
+            level = psi_level(r["psi_num"], warn, alert)
+        counts[level] += 1
+        if level in ("WARN", "ALERT") or (pd.notna(r["miss_num"]) and r["miss_num"] > miss_alert):
+            rows.append({
+                "feature": r["feature"],
+                "psi": _r(r["psi_num"]),
+                "level": level,
+                "metric": r.get("drift_metric") if isinstance(r.get("drift_metric"), str) else "psi",
+                "missing_rate": _r(r["miss_num"]),
+            })
+    return rows, counts
+
+
+@tool
+def run_new_batch_processing(csv_path: str = BATCH_CSV, config: RunnableConfig = None) -> dict:
+    """
+    Process a new batch CSV in memory: feature PSI / missingness vs the
+    reference and AUC/KS vs the baseline (if label and score columns exist).
+    Read-only: nothing is written to the monitoring logs.
+    """
+    t0 = time.perf_counter()
+    try:
+        snap = snapshot_from_config(config)
+        cfg = snap.cfg
+        if not os.path.exists(csv_path):
+            return _finish("run_new_batch_processing", {"error": f"{csv_path} not found"}, t0)
+
+        df_new = _read_csv_cached(csv_path).replace([np.inf, -np.inf], np.nan)
+        feat_df = feature_drift_table(df_new, snap.ref_stats, drift_metric_config(cfg))
+        drift = summarize_drift(feat_df, top_n=3)
+        drifted, counts = _drift_rows(feat_df, cfg)
+
+        labels_cfg = cfg.get("labels") or {}
+        y_col = labels_cfg.get("y_col", "label")
+        p_col = labels_cfg.get("p_col", "score")
+        auc = ks = auc_drop = ks_drop = None
+        if y_col in df_new.columns and p_col in df_new.columns:
+            auc, ks = compute_auc_ks(df_new, y_col=y_col, p_col=p_col)
+            auc_drop, ks_drop = performance_drops(auc, ks, cfg.get("baseline"))
+
+        out = {
+            "csv_path": csv_path,
+            "n_rows": int(len(df_new)),
+            "n_features_checked": int(len(feat_df)),
+            "psi_max_value": _r(drift["psi_max_value"]),
+            "psi_max_feature": drift["psi_max_feature"],
+            "max_missing_rate": _r(drift["max_missing_rate"]),
+            "max_missing_feature": drift["max_missing_feature"],
+            "level_counts": counts,
+            "drifted_features": drifted[:MAX_ITEMS],
+            "auc": _r(auc), "ks": _r(ks),
+            "auc_drop": _r(auc_drop), "ks_drop": _r(ks_drop),
+        }
+        if auc is None:
+            out["performance_note"] = f"AUC/KS not computed (needs '{y_col}' and '{p_col}' columns)"
+    except Exception as e:
+        out = {"error": str(e)}
+    return _finish("run_new_batch_processing", out, t0)
+
 
 @tool
-def run_new_batch_processing(csv_path: str) -> dict:
+def check_drift_metrics(config: RunnableConfig = None) -> dict:
     """
-    Process a new batch of data through the monitoring pipeline.
-    Calculates PSI, performance metrics, and logs results.
+    Check current drift metrics (PSI) for all features from the latest run.
+    Returns drifted features (WARN/ALERT or high missing rate) and severity counts.
     """
-    # TODO: Extract logic from your 2_New_Batch.py
-    # For now, return placeholder
-    return {"status": "processed", "message": f"Processed {csv_path}"}
+    t0 = time.perf_counter()
+    try:
+        cfg = snapshot_from_config(config).cfg
+        if not os.path.exists(FEAT_OUT) or os.path.getsize(FEAT_OUT) == 0:
+            return _finish("check_drift_metrics", {
+                "error": f"{FEAT_OUT} not found. Run New Batch → Run Monitor first."
+            }, t0)
+
+        feat_df = _read_csv_cached(FEAT_OUT, encoding="utf-8-sig")
+        if feat_df.empty or "psi" not in feat_df.columns:
+            return _finish("check_drift_metrics", {"error": f"{FEAT_OUT} has no PSI table"}, t0)
+
+        drifted, counts = _drift_rows(feat_df, cfg)
+        warn, alert, miss_alert = _thresholds(cfg)
+        out = {
+            "n_features": int(len(feat_df)),
+            "n_drifted": len(drifted),
+            "level_counts": counts,
+            "overall": "ALERT" if counts["ALERT"] else ("WARN" if counts["WARN"] else "OK"),
+            "thresholds": {"psi_warn": warn, "psi_alert": alert, "missing_rate_alert": miss_alert},
+            "drifted_features": drifted[:MAX_ITEMS],
+        }
+    except Exception as e:
+        out = {"error": str(e)}
+    return _finish("check_drift_metrics", out, t0)
 
 
 @tool
-def check_drift_metrics() -> dict:
+def run_fairness_audit(protected_attr: str = "income_group_auth", target_approval: float = 0.40,
+                       config: RunnableConfig = None) -> dict:
     """
-    Check current drift metrics (PSI) for all features.
-    Returns top drifted features and severity.
+    Run fairness analysis on a group column of the fairness test set
+    (e.g. income_group_auth, state_group) with a global approval cutoff.
+    Calculates disparate impact ratio, TPR parity and 80% rule compliance.
     """
-    # TODO: Extract logic from your 3_Metrics_and_Drift.py
-    return {"status": "checked", "drifted_features": 2}
+    t0 = time.perf_counter()
+    try:
+        fair_cfg = snapshot_from_config(config).cfg.get("fairness") or {}
+        min_group = int(fair_cfg.get("min_group_size", 200))
+        stream_mb = fair_cfg.get("stream_above_mb")
+        if (stream_mb is not None and os.path.exists(FAIRNESS_PATH)
+                and os.path.getsize(FAIRNESS_PATH) > float(stream_mb) * 2 ** 20):
+            # too large to hold in memory: merged per-group score sketches
+            group_col = GROUP_ALIASES.get(protected_attr, protected_attr)
+            sk = sketch_file(FAIRNESS_PATH, "loan_status", "pd_score", group_col,
+                             int(fair_cfg.get("sketch_bins", SKETCH_BINS)))
+            per, summ = sketch_fairness(sk, float(target_approval), "global")
+        else:
+            df, group_col, err = _fairness_frame(protected_attr)
+            if err:
+                return _finish("run_fairness_audit", err, t0)
+            per, summ = simple_fairness(df, "loan_status", "pd_score", group_col, float(target_approval))
+        small = per.loc[per["n"] < min_group, "group"].astype(str).tolist()
+        out = {
+            "protected_attr": group_col,
+            "n_rows": int(per["n"].sum()),
+            "n_groups": int(len(per)),
+            "target_approval": float(target_approval),
+            "cutoff": _r(summ["used_cutoff"]),
+            "DIR_min_over_max": _r(summ["DIR_min_over_max"]),
+            "TPR_good_range": _r(summ["TPR_good_range"]),
+            "pass_80_rule": summ["pass_80_rule"],
+            "groups": [
+                {"group": str(r["group"]), "n": int(r["n"]),
+                 "approve_rate": _r(r["approve_rate"]), "TPR_good": _r(r["TPR_good"]),
+                 "DIR_vs_majority": _r(r["DIR_vs_majority"])}
+                for _, r in per.head(MAX_ITEMS).iterrows()
+            ],
+        }
+        if len(per) > MAX_ITEMS:
+            out["groups_truncated"] = int(len(per) - MAX_ITEMS)
+        if "max_approve_rate_error" in summ:
+            out["streamed"] = True
+            out["max_approve_rate_error"] = _r(summ["max_approve_rate_error"])
+        if small:
+            out["small_groups"] = small[:MAX_ITEMS]
+            out["note"] = f"groups with n < {min_group} are statistically unreliable"
+    except Exception as e:
+        out = {"error": str(e)}
+    return _finish("run_fairness_audit", out, t0)
 
 
 @tool
-def run_fairness_audit(protected_attr: str = "gender") -> dict:
+def optimize_fair_cutoffs(protected_attr: str = "income_group_auth", target_approval: float = 0.40,
+                          objective: str = None, min_dir: float = None, tpr_tol: float = None,
+                          config: RunnableConfig = None) -> dict:
     """
-    Run fairness analysis on specified protected attribute.
-    Calculates disparate impact, 80% rule compliance.
+    Find group-specific approval cutoffs on the fairness test set that maximise
+    expected good approvals (objective="good_approvals") or minimise expected
+    defaults (objective="defaults") while keeping DIR >= min_dir (default 0.8),
+    the TPR_good range <= tpr_tol and the overall approval rate at the target.
+    Also returns the objective-vs-DIR frontier. Unset arguments use config.yaml.
     """
-    # TODO: Extract logic from your 5_Faireness_1.py
-    return {"status": "audited", "protected_attr": protected_attr}
+    t0 = time.perf_counter()
+    try:
+        opt = optimizer_config(snapshot_from_config(config).cfg)
+        for k, v in (("objective", objective), ("min_dir", min_dir), ("tpr_tol", tpr_tol)):
+            if v is not None:
+                opt[k] = v
+        df, group_col, err = _fairness_frame(protected_attr)
+        if err:
+            return _finish("optimize_fair_cutoffs", err, t0)
+
+        per, summ, frontier = optimize_group_cutoffs(
+            df, "loan_status", "pd_score", group_col, float(target_approval),
+            objective=opt["objective"], min_dir=float(opt["min_dir"]),
+            tpr_tol=None if opt["tpr_tol"] is None else float(opt["tpr_tol"]),
+            approval_tol=float(opt["approval_tol"]), grid=int(opt["grid"]),
+            frontier=opt["frontier"],
+        )
+        out = {
+            "protected_attr": group_col,
+            "target_approval": float(target_approval),
+            **{k: _r(v) if isinstance(v, float) else v for k, v in summ.items()},
+            "frontier": [{k: _r(v) if isinstance(v, float) else v for k, v in r.items()}
+                         for r in frontier.head(MAX_ITEMS).to_dict("records")],
+        }
+        if summ["feasible"]:
+            out["groups"] = [
+                {"group": str(r["group"]), "n": int(r["n"]), "cutoff": _r(r["cutoff"]),
+                 "approve_rate": _r(r["approve_rate"]), "TPR_good": _r(r["TPR_good"]),
+                 "DIR_vs_majority": _r(r["DIR_vs_majority"])}
+                for _, r in per.head(MAX_ITEMS).iterrows()
+            ]
+            if len(per) > MAX_ITEMS:
+                out["groups_truncated"] = int(len(per) - MAX_ITEMS)
+        else:
+            out["note"] = "no cutoffs meet the constraints; relax tpr_tol, min_dir or the approval target"
+    except Exception as e:
+        out = {"error": str(e)}
+    return _finish("optimize_fair_cutoffs", out, t0)
+
+
+@tool
+def search_reports(query: str, feature: str = None, since: str = None, until: str = None,
+                   kind: str = None, top_k: int = 5) -> dict:
+    """
+    Search historical reports (compliance reports, AI summaries, governance
+    reports) by keywords, ranked by BM25. Optional filters: feature name
+    (e.g. fico_mid), since/until dates (YYYY-MM-DD) and kind
+    (compliance_report, llm_summary, governance).
+    """
+    t0 = time.perf_counter()
+    try:
+        index = get_report_index()
+        index.sync()
+        hits = index.search(
+            query, top_k=max(1, min(int(top_k), MAX_ITEMS)),
+            kind=kind, feature=feature, since=since, until=until,
+        )
+        out = {"n_indexed": len(index), "hits": hits}
+    except Exception as e:
+        out = {"error": str(e)}
+    return _finish("search_reports", out, t0)
+
+
+@tool
+def explain_applicant(applicant_id: str, batch_id: str = None, top_k: int = 5) -> dict:
+    """
+    Top reason codes (largest SHAP contributions) behind one applicant's score,
+    for adverse-action notices and complaints. batch_id defaults to the newest
+    batch with stored explanations.
+    """
+    t0 = time.perf_counter()
+    try:
+        store = find_store(batch_id)
+        if store is None:
+            out = {"error": "no explanation store found; enable explanation_store in config.yaml"}
+        else:
+            out = store.get(applicant_id, max(1, min(int(top_k), MAX_ITEMS)))
+            out["reasons"] = [{k: _r(v) for k, v in r.items()} for r in out["reasons"]]
+            out.update({k: _r(out[k]) for k in ("base_value", "logit", "probability")})
+    except KeyError as e:
+        out = {"error": str(e).strip("'\"")}
+    except Exception as e:
+        out = {"error": str(e)}
+    return _finish("explain_applicant", out, t0)
 
 
 @tool
-def generate_compliance_report() -> dict:
+def generate_compliance_report(config: RunnableConfig = None) -> dict:
     """
     Generate comprehensive compliance report.
     """
     from smartloan_agent.agent_fs import SmartLoanAgentFS
-    agent = SmartLoanAgentFS()
-    metrics, report_path = agent.run()
+    snap = snapshot_from_config(config)
+    agent = SmartLoanAgentFS(cfg=snap.cfg)
+    metrics, report_path = agent.run(row=snap.latest_row)
     return {"metrics": metrics, "report_path": report_path}
 
 
 @tool
-def get_current_metrics() -> dict:
+def get_current_metrics(config: RunnableConfig = None) -> dict:
     """
     Get current model performance metrics (AUC, KS, PSI).
     """
+    t0 = time.perf_counter()
     try:
-        df = pd.read_csv("monitor/batch_metrics_log.csv").tail(1)
-        return df.iloc[0].to_dict()
+        out = dict(thaw(snapshot_from_config(config).latest_row))
     except Exception as e:
-        return {"error": str(e)}
\ No newline at end of file
+        out = {"error": str(e)}
+    return _finish("get_current_metrics", out, t0)
@@ -0,0 +1,204 @@
+"""
+Row-level anomaly stage.
+
+One anomaly model is fitted on the training reference and persisted:
+- method "isolation_forest"  sklearn IsolationForest, score = -score_samples
+- method "robust_z"          RMS of robust z-scores (median / 1.4826 * MAD)
+The cut-off is the (1 - contamination) quantile of the training scores.
+Either way the robust median / MAD are stored too. The per-feature |z|
+of a flagged row names the features that drive it.
+
+Batches are scored in chunks on a process pool. Each worker loads the
+model once, so cost grows linearly with rows and shrinks with cores. The
+output stays bounded for the compliance report: an anomaly rate, the
+top_n rows with their top 3 driver features, and the driver counts over
+all flagged rows.
+
+    python -m smartloan_agent.anomaly_engine --fit --csv X_train_1.csv
+"""
+import os, json, argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import yaml
+
+CFG_PATH = "monitor/config.yaml"
+DEFAULT_MODEL_PATH = "monitor/anomaly_model.joblib"
+MAD_SCALE = 1.4826   # MAD -> standard deviation for normal data
+
+
+def load_anomaly_config(cfg_path=CFG_PATH):
+    """`anomaly:` section of config.yaml with defaults."""
+    cfg = {}
+    if os.path.exists(cfg_path):
+        with open(cfg_path, "r", encoding="utf-8") as f:
+            cfg = yaml.safe_load(f) or {}
+    out = {
+        "enabled": True,
+        "method": "isolation_forest",
+        "features": [],
+        "contamination": 0.01,
+        "n_estimators": 200,
+        "model_path": DEFAULT_MODEL_PATH,
+        "id_col": "id",
+        "chunk_size": 100_000,
+        "n_jobs": -1,
+        "top_n": 10,
+        "rate_warn": 0.02,
+        "rate_alert": 0.05,
+    }
+    out.update(cfg.get("anomaly") or {})
+    out["features"] = list(out["features"] or (cfg.get("features") or {}).get("numerical") or [])
+    return out
+
+def _n_jobs(n):
+    n = int(n or -1)
+    return (os.cpu_count() or 1) if n <= 0 else n
+
+def _matrix(df, features):
+    return df.reindex(columns=features).apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float)
+
+
+# ---------- Model ----------
+def robust_z(X, median, scale):
+    """Robust z-scores; missing values score 0 (not anomalous on that feature)."""
+    return np.nan_to_num((X - median) / scale, nan=0.0, posinf=0.0, neginf=0.0)
+
+def _raw_scores(model, X):
+    Z = robust_z(X, model["median"], model["scale"])
+    if model["method"] == "isolation_forest":
+        Xf = np.where(np.isfinite(X), X, model["median"])   # impute with the training median
+        return -model["forest"].score_samples(Xf), Z
+    return np.sqrt(np.mean(Z ** 2, axis=1)), Z
+
+def fit_anomaly_model(df, features, method="isolation_forest", contamination=0.01,
+                      n_estimators=200, random_state=42):
+    """Fit on reference rows; returns the persisted model dict."""
+    X = _matrix(df, features)
+    median = np.nanmedian(X, axis=0)
+    mad = np.nanmedian(np.abs(X - median), axis=0) * MAD_SCALE
+    std = np.nanstd(X, axis=0)
+    # features with MAD = 0 (mostly one value) fall back to the standard deviation
+    scale = np.where(mad > 0, mad, np.where(std > 0, std, 1.0))
+    model = {"method": method, "features": list(features), "median": median, "scale": scale,
+             "contamination": float(contamination), "n_fit": int(len(X)), "forest": None}
+    if method == "isolation_forest":
+        from sklearn.ensemble import IsolationForest
+        Xf = np.where(np.isfinite(X), X, median)
+        model["forest"] = IsolationForest(n_estimators=int(n_estimators), random_state=random_state,
+                                          n_jobs=1).fit(Xf)
+    elif method != "robust_z":
+        raise ValueError(f"unknown anomaly method '{method}' (isolation_forest | robust_z)")
+    scores, _ = _raw_scores(model, X)
+    model["threshold"] = float(np.quantile(scores, 1 - contamination))
+    return model
+
+def save_anomaly_model(model, path=DEFAULT_MODEL_PATH):
+    import joblib
+    joblib.dump(model, path)
+    return path
+
+def load_anomaly_model(path=DEFAULT_MODEL_PATH):
+    if not os.path.exists(path):
+        return None
+    import joblib
+    return joblib.load(path)
+
+
+# ---------- Scoring (process pool) ----------
+_worker_model = {}
+
+def _score_chunk(args):
+    """Worker: (model_path, X chunk) -> (scores, top-3 driver idx, their z)."""
+    path, X = args
+    if path not in _worker_model:
+        _worker_model[path] = load_anomaly_model(path)
+    return _score_block(_worker_model[path], X)
+
+def _score_block(model, X):
+    scores, Z = _raw_scores(model, X)
+    absz = np.abs(Z)
+    k = min(3, absz.shape[1])
+    top = np.argpartition(-absz, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(absz, top, axis=1), axis=1)
+    top = np.take_along_axis(top, order, axis=1)
+    return scores, top, np.take_along_axis(Z, top, axis=1)
+
+def score_anomalies(df, model, model_path, chunk_size=100_000, n_jobs=-1):
+    """Anomaly scores for every row plus the top-3 |z| driver features."""
+    X = _matrix(df, model["features"])
+    blocks = [X[i:i + chunk_size] for i in range(0, len(X), max(1, int(chunk_size)))]
+    n_jobs = min(_n_jobs(n_jobs), len(blocks))
+    if n_jobs <= 1:
+        parts = [_score_block(model, b) for b in blocks]
+    else:
+        with ProcessPoolExecutor(n_jobs) as ex:
+            parts = list(ex.map(_score_chunk, [(model_path, b) for b in blocks]))
+    if not parts:
+        return np.array([]), np.zeros((0, 3), int), np.zeros((0, 3))
+    return tuple(np.concatenate(p) for p in zip(*parts))
+
+
+# ---------- Batch summary ----------
+def anomaly_summary(df, model, scores, top_idx, top_z, an_cfg):
+    """Anomaly rate, top-N rows with drivers and driver counts (bounded JSON)."""
+    feats = model["features"]
+    flagged = scores > model["threshold"]
+    rate = float(flagged.mean()) if len(scores) else None
+    level = "N/A" if rate is None else (
+        "ALERT" if rate > an_cfg["rate_alert"] else "WARN" if rate > an_cfg["rate_warn"] else "OK")
+
+    id_col = an_cfg.get("id_col")
+    ids = df[id_col].astype(str).to_numpy() if id_col and id_col in df.columns else np.arange(len(df)).astype(str)
+    top_n = int(an_cfg["top_n"])
+    worst = np.argsort(-scores)[:top_n] if len(scores) else []
+    top_rows = [{
+        "id": ids[i],
+        "score": round(float(scores[i]), 4),
+        "drivers": [{"feature": feats[j], "z": round(float(z), 2)} for j, z in zip(top_idx[i], top_z[i])],
+    } for i in worst]
+
+    # main driver of every flagged row, counted per feature
+    counts = np.bincount(top_idx[flagged, 0], minlength=len(feats)) if flagged.any() else np.zeros(len(feats), int)
+    drivers = [{"feature": feats[j], "rows": int(counts[j]), "share": round(counts[j] / max(flagged.sum(), 1), 3)}
+               for j in np.argsort(-counts)[:5] if counts[j] > 0]
+    return {
+        "anomaly_rate": rate,
+        "anomaly_expected_rate": model["contamination"],
+        "anomaly_level": level,
+        "anomaly_count": int(flagged.sum()),
+        "anomaly_top_json": json.dumps(top_rows, ensure_ascii=False),
+        "anomaly_drivers_json": json.dumps(drivers, ensure_ascii=False),
+    }
+
+def anomaly_stage(df, an_cfg):
+    """Score one batch with the persisted model ({} when no model is fitted)."""
+    model = load_anomaly_model(an_cfg["model_path"])
+    if model is None:
+        print(f"[WARN] anomaly stage skipped: no model at {an_cfg['model_path']} "
+              f"(fit it with: python -m smartloan_agent.anomaly_engine --fit)")
+        return {}
+    scores, top_idx, top_z = score_anomalies(df, model, an_cfg["model_path"],
+                                             int(an_cfg["chunk_size"]), an_cfg["n_jobs"])
+    return anomaly_summary(df, model, scores, top_idx, top_z, an_cfg)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--fit", action="store_true", help="fit the anomaly model on --csv")
+    ap.add_argument("--csv", default="X_train_1.csv")
+    args = ap.parse_args()
+    cfg = load_anomaly_config()
+    if args.fit:
+        df = pd.read_csv(args.csv, encoding="utf-8-sig")
+        model = fit_anomaly_model(df, cfg["features"], cfg["method"], cfg["contamination"], cfg["n_estimators"])
+        save_anomaly_model(model, cfg["model_path"])
+        print(f"[OK] {model['method']} anomaly model on {model['n_fit']:,} rows "
+              f"(threshold={model['threshold']:.4f}) → {cfg['model_path']}")
+    else:
+        print(json.dumps(anomaly_stage(pd.read_csv(args.csv, encoding="utf-8-sig"), cfg), indent=2))
+
+
+if __name__ == "__main__":
+    main()
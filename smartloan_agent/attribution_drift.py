@@ -0,0 +1,193 @@
+"""
+Attribution drift: did the model's reliance on each feature change?
+
+Per batch, mean |SHAP| per feature and its share of total attribution are
+computed on a fixed-size sample (shap_engine: closed-form linear SHAP for LR,
+chunked TreeSHAP for XGBoost) and compared with a stored reference profile.
+
+- share_diff        share_new - share_ref per feature
+- attr_drift_tvd    total variation distance between share vectors
+                    (0.5 * sum |share_new - share_ref|, 0 = same reliance, 1 = disjoint)
+
+Build the reference once from a representative dataset (e.g. training data):
+
+    python -m smartloan_agent.attribution_drift --build_reference --csv X_train_1.csv
+"""
+import os, json, argparse
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import yaml
+
+from .shap_engine import get_shap_engine, mean_abs_shap
+
+CFG_PATH = "monitor/config.yaml"
+DEFAULT_REF_PATH = "monitor/reference_attribution.json"
+
+
+def load_attribution_config(cfg_path=CFG_PATH):
+    """`attribution:` section of config.yaml with defaults."""
+    cfg = {}
+    if os.path.exists(cfg_path):
+        with open(cfg_path, "r", encoding="utf-8") as f:
+            cfg = yaml.safe_load(f) or {}
+    out = {
+        "enabled": True,
+        "model": "xgb",
+        "sample_size": 1000,
+        "reference_path": DEFAULT_REF_PATH,
+        "share_shift_warn": 0.02,
+        "share_shift_alert": 0.05,
+        "tvd_warn": 0.10,
+        "tvd_alert": 0.20,
+    }
+    out.update(cfg.get("attribution") or {})
+    return out
+
+
+# ---------- Profiles ----------
+def attribution_profile(res):
+    """ShapResult -> {model, model_version, n_rows, features: {f: {mean_abs, share}}}."""
+    imp = mean_abs_shap(res)
+    return {
+        "model": res.model_name,
+        "model_version": res.model_version.split(":")[1] if ":" in res.model_version else res.model_version,
+        "n_rows": int(len(res.values)),
+        "created": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "features": {
+            f: {"mean_abs": float(m), "share": float(s)}
+            for f, m, s in imp[["feature", "mean_abs_shap", "share"]].itertuples(index=False)
+        },
+    }
+
+def load_reference(path=DEFAULT_REF_PATH, model=None):
+    """Reference profile for `model` (None if the file or model entry is missing)."""
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        ref = json.load(f)
+    return (ref.get("models") or {}).get(model) if model else ref
+
+def save_reference(profile, path=DEFAULT_REF_PATH):
+    """Store/replace the reference profile of one model."""
+    ref = {"models": {}}
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            ref = json.load(f)
+    ref.setdefault("models", {})[profile["model"]] = profile
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(ref, f, indent=2)
+    return path
+
+
+# ---------- Comparison ----------
+def _level(v, warn, alert):
+    if v is None or pd.isna(v):
+        return "N/A"
+    if v > alert:
+        return "ALERT"
+    if v > warn:
+        return "WARN"
+    return "OK"
+
+def compare_profiles(new, ref, share_warn=0.02, share_alert=0.05):
+    """
+    Per-feature attribution table: feature, mean_abs_new/ref, share_new/ref,
+    share_diff, level (on |share_diff|). Sorted by |share_diff| desc.
+    """
+    feats = list(new["features"])
+    if ref:
+        feats += [f for f in ref["features"] if f not in new["features"]]
+    rows = []
+    for f in feats:
+        n = new["features"].get(f, {})
+        r = (ref or {}).get("features", {}).get(f, {})
+        share_new, share_ref = n.get("share", 0.0), r.get("share", np.nan)
+        diff = share_new - share_ref if ref else np.nan
+        rows.append({
+            "feature": f,
+            "mean_abs_new": n.get("mean_abs", 0.0),
+            "mean_abs_ref": r.get("mean_abs", np.nan),
+            "share_new": share_new,
+            "share_ref": share_ref,
+            "share_diff": diff,
+            "level": _level(abs(diff) if pd.notna(diff) else None, share_warn, share_alert),
+        })
+    out = pd.DataFrame(rows)
+    return out.reindex(out["share_diff"].abs().sort_values(ascending=False, na_position="last").index) \
+              .reset_index(drop=True)
+
+def summarize_attribution(table, tvd_warn=0.10, tvd_alert=0.20):
+    """Batch-level attribution drift fields for batch_metrics_log.csv."""
+    diff = pd.to_numeric(table["share_diff"], errors="coerce")
+    out = {
+        "attr_drift_tvd": None, "attr_level": "N/A",
+        "attr_max_shift_feature": None, "attr_max_shift": None,
+    }
+    if diff.notna().any():
+        tvd = float(0.5 * diff.abs().sum())
+        i = diff.abs().idxmax()
+        out.update({
+            "attr_drift_tvd": tvd,
+            "attr_level": _level(tvd, tvd_warn, tvd_alert),
+            "attr_max_shift_feature": table.loc[i, "feature"],
+            "attr_max_shift": float(diff[i]),
+        })
+    return out
+
+
+# ---------- Batch Run ----------
+def attribution_drift(df, cfg=None, cfg_path=CFG_PATH):
+    """
+    Attribution drift for one batch frame.
+    Returns (per-feature table, batch summary dict) or (None, None) when the
+    model artifact is unavailable.
+    """
+    cfg = cfg or load_attribution_config(cfg_path)
+    engine = get_shap_engine(cfg_path)
+    model = cfg["model"]
+    if model not in engine.available_models():
+        print(f"[WARN] attribution drift skipped: model '{model}' artifact not found")
+        return None, None
+
+    res = engine.explain(df, model, sample_size=int(cfg["sample_size"]), seed=0)
+    new = attribution_profile(res)
+    ref = load_reference(cfg["reference_path"], model)
+    if ref is None:
+        print(f"[WARN] no reference attribution for '{model}' in {cfg['reference_path']}; "
+              f"build it with: python -m smartloan_agent.attribution_drift --build_reference")
+    elif ref.get("model_version") != new["model_version"]:
+        print(f"[WARN] reference attribution is for model_version {ref.get('model_version')}, "
+              f"batch uses {new['model_version']}")
+
+    table = compare_profiles(new, ref, cfg["share_shift_warn"], cfg["share_shift_alert"])
+    summary = summarize_attribution(table, cfg["tvd_warn"], cfg["tvd_alert"])
+    summary["attr_model"] = model
+    summary["attr_sample_rows"] = new["n_rows"]
+    return table, summary
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--build_reference", action="store_true")
+    ap.add_argument("--csv", default="X_train_1.csv", help="reference dataset")
+    ap.add_argument("--model", default=None, help="model name (default: attribution.model)")
+    ap.add_argument("--sample_size", type=int, default=None, help="0 = all rows")
+    args = ap.parse_args()
+
+    cfg = load_attribution_config()
+    model = args.model or cfg["model"]
+    if not args.build_reference:
+        ap.print_help()
+        return
+    df = pd.read_csv(args.csv)
+    n = cfg["sample_size"] * 5 if args.sample_size is None else args.sample_size
+    res = get_shap_engine().explain(df, model, sample_size=n, seed=0)
+    path = save_reference(attribution_profile(res), cfg["reference_path"])
+    print(f"[OK] reference attribution for '{model}' ({len(res.values)} rows) → {path}")
+
+
+if __name__ == "__main__":
+    main()
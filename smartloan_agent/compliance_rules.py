@@ -0,0 +1,299 @@
+"""
+Rule-based compliance logic shared by the Compliance page and the agent.
+Thresholds come from monitor/config.yaml; all helpers are NaN/None safe.
+"""
+import json
+import pandas as pd
+import numpy as np
+import yaml
+
+# ===== HELPER FUNCTIONS =====
+def safe_float(value):
+    """Convert value to float, return None if it fails or is NaN/Inf."""
+    try:
+        if value is None or pd.isna(value):
+            return None
+        val = float(value)
+        if np.isnan(val) or np.isinf(val):
+            return None
+        return val
+    except Exception:
+        return None
+
+def safe_compare_gt(value, threshold):
+    """
+    Safely compare value > threshold.
+    Returns False if either value is None/NaN (no alert triggered).
+    """
+    val = safe_float(value)
+    thr = safe_float(threshold)
+    
+    if val is None or thr is None:
+        return False
+    
+    return val > thr
+
+def safe_compare_range(value, lower, upper):
+    """
+    Check if lower < value <= upper.
+    Returns False if any value is None/NaN.
+    """
+    val = safe_float(value)
+    low = safe_float(lower)
+    up = safe_float(upper)
+    
+    if val is None or low is None or up is None:
+        return False
+    
+    return low < val <= up
+
+def thresholds_from_config(config):
+    """Thresholds from an already-parsed config dict."""
+    config = config or {}
+    calib = config.get("calibration") or {}
+    return {
+        "psi_warn": config.get("psi_threshold_warn", 0.10),
+        "psi_alert": config.get("psi_threshold_alert", 0.20),
+        "auc_drop": config.get("auc_drop_alert", 0.05),
+        "ks_drop": config.get("ks_drop_alert", 0.10),
+        "miss_rate": config.get("missing_rate_alert", 0.10),
+        "score_psi_warn": calib.get("score_psi_warn", 0.10),
+        "score_psi_alert": calib.get("score_psi_alert", 0.25),
+        "hl_pvalue": calib.get("hl_pvalue_alert", 0.05),
+        "calib_gap": calib.get("calib_gap_alert", 0.05),
+    }
+
+def get_thresholds(yaml_path):
+    """Read thresholds from the YAML file."""
+    with open(yaml_path, "r", encoding="utf-8") as f:
+        config = yaml.safe_load(f) or {}
+    return thresholds_from_config(config)
+
+def check_flags(metrics, thresholds):
+    """
+    Check if metrics exceed alert thresholds.
+    Safe handling of None/NaN values - returns False if data missing.
+    """
+    return {
+        "auc_drop_alert": safe_compare_gt(
+            metrics.get("auc_drop"), 
+            thresholds["auc_drop"]
+        ),
+        "ks_drop_alert": safe_compare_gt(
+            metrics.get("ks_drop"), 
+            thresholds["ks_drop"]
+        ),
+        "missing_rate_alert": safe_compare_gt(
+            metrics.get("max_missing_rate"), 
+            thresholds["miss_rate"]
+        ),
+        "psi_alert": safe_compare_gt(
+            metrics.get("psi_max_value"), 
+            thresholds["psi_alert"]
+        ),
+        "psi_warn": safe_compare_range(
+            metrics.get("psi_max_value"),
+            thresholds["psi_warn"],
+            thresholds["psi_alert"]
+        ),
+        "score_psi_alert": safe_compare_gt(
+            metrics.get("score_psi"),
+            thresholds.get("score_psi_alert", 0.25)
+        ),
+        "score_psi_warn": safe_compare_range(
+            metrics.get("score_psi"),
+            thresholds.get("score_psi_warn", 0.10),
+            thresholds.get("score_psi_alert", 0.25)
+        ),
+        "calib_alert": (
+            safe_compare_gt(thresholds.get("hl_pvalue", 0.05), metrics.get("hl_pvalue"))
+            or safe_compare_gt(abs(safe_float(metrics.get("calib_gap")) or 0.0),
+                               thresholds.get("calib_gap", 0.05))
+        ),
+    }
+
+# ===== RULE-BASED FUNCTIONS =====
+def rule_based_summary(metrics, flags, thresholds):
+    """Generate a rule-based summary."""
+    summary = ["Monitoring completed for the latest batch."]
+    
+    # Performance
+    if flags["auc_drop_alert"] or flags["ks_drop_alert"]:
+        issues = []
+        if flags["auc_drop_alert"]:
+            auc_drop = safe_float(metrics.get("auc_drop"))
+            issues.append(f"AUC drop {auc_drop:.3f}" if auc_drop else "AUC drop detected")
+        if flags["ks_drop_alert"]:
+            ks_drop = safe_float(metrics.get("ks_drop"))
+            issues.append(f"KS drop {ks_drop:.3f}" if ks_drop else "KS drop detected")
+        summary.append(f"Model performance weakened ({', '.join(issues)}).")
+    else:
+        auc = safe_float(metrics.get("auc"))
+        ks = safe_float(metrics.get("ks"))
+        auc_str = f"{auc:.3f}" if auc else "N/A"
+        ks_str = f"{ks:.3f}" if ks else "N/A"
+        summary.append(f"AUC={auc_str} and KS={ks_str} are within acceptable range.")
+    
+    # Drift
+    if flags["psi_alert"]:
+        psi_val = safe_float(metrics.get("psi_max_value"))
+        psi_str = f"{psi_val:.3f}" if psi_val else "N/A"
+        summary.append(
+            f"Significant drift detected on '{metrics.get('psi_max_feature', 'N/A')}' "
+            f"(PSI={psi_str})."
+        )
+    elif flags["psi_warn"]:
+        psi_val = safe_float(metrics.get("psi_max_value"))
+        psi_str = f"{psi_val:.3f}" if psi_val else "N/A"
+        summary.append(
+            f"Moderate drift on '{metrics.get('psi_max_feature', 'N/A')}' "
+            f"(PSI={psi_str}); continue monitoring."
+        )
+    else:
+        summary.append("No significant drift detected.")
+    
+    # Score stability & calibration
+    if flags.get("score_psi_alert") or flags.get("score_psi_warn"):
+        score_psi = safe_float(metrics.get("score_psi"))
+        summary.append(
+            f"{'Material' if flags.get('score_psi_alert') else 'Moderate'} shift in the PD score "
+            f"distribution (score PSI={score_psi:.3f})."
+        )
+    if flags.get("calib_alert"):
+        gap = safe_float(metrics.get("calib_gap"))
+        gap_str = f"{gap:+.3f}" if gap is not None else "N/A"
+        summary.append(f"Calibration check failed (mean PD minus observed default rate {gap_str}).")
+
+    # Missing data
+    if flags["missing_rate_alert"]:
+        miss_rate = safe_float(metrics.get("max_missing_rate"))
+        miss_str = f"{miss_rate:.1%}" if miss_rate else "N/A"
+        summary.append(
+            f"Excessive missing data on '{metrics.get('max_missing_feature', 'N/A')}' "
+            f"({miss_str})."
+        )
+    else:
+        summary.append("Missing data is within acceptable limits.")
+    if metrics.get("dq_status") in ("WARN", "ALERT"):
+        summary.append(f"Data-quality checks raised {metrics['dq_status']}: {metrics.get('dq_notes', '')}")
+    
+    # Fairness
+    pass_80 = metrics.get("pass_80_rule")
+    if str(pass_80).lower() in {"true", "1", "yes"}:
+        summary.append("Fairness metrics meet the 80% rule.")
+    else:
+        summary.append(
+            f"Potential fairness concern in {metrics.get('fairness_groups', 'N/A')}; "
+            f"review required."
+        )
+    
+    return " ".join(summary)
+
+def rule_based_actions(flags, metrics):
+    """Generate rule-based action recommendations."""
+    actions = ["Continue daily monitoring."]
+    
+    if flags["psi_warn"] or flags["psi_alert"]:
+        actions.append(
+            f"Track '{metrics.get('psi_max_feature', 'key feature')}' PSI "
+            f"for 7-14 days."
+        )
+    
+    if flags["auc_drop_alert"] or flags["ks_drop_alert"]:
+        actions.append("Review model calibration and plan retraining.")
+    
+    if flags.get("calib_alert"):
+        actions.append("Review PD calibration by decile; consider recalibration before IFRS 9 staging.")
+    
+    if flags.get("score_psi_alert"):
+        actions.append("Investigate the score distribution shift against the reference population.")
+    
+    if flags["missing_rate_alert"]:
+        actions.append("Investigate ETL processes for missing data issues.")
+    
+    if metrics.get("dq_status") == "ALERT":
+        actions.append("Hold the batch for an ETL / schema review before relying on its scores.")
+    
+    if str(metrics.get("pass_80_rule", True)).lower() not in {"true", "1", "yes"}:
+        actions.append("Conduct a fairness audit across protected groups.")
+    
+    return "\n".join(["- " + a for a in actions])
+
+def safe_format(value, decimals=3):
+    """
+    Format number with specified decimals, return 'N/A' if None.
+    Used to prepare values for Jinja2 templates.
+    """
+    val = safe_float(value)
+    if val is None:
+        return "N/A"
+    return f"{val:.{decimals}f}"
+
+def score_context(metrics, thresholds, flags):
+    """
+    Template variables for the score stability & calibration section
+    (pre-formatted strings, decile rows parsed from deciles_json).
+    """
+    try:
+        deciles = json.loads(metrics.get("deciles_json") or "[]")
+    except (TypeError, ValueError):
+        deciles = []
+    rows = [{
+        "group": d.get("group"),
+        "n": d.get("n"),
+        "score_range": f"{d['score_min']:.3f}–{d['score_max']:.3f}",
+        "observed_rate": f"{d['observed_rate']:.2%}",
+        "expected_rate": f"{d['expected_rate']:.2%}",
+    } for d in deciles]
+    return {
+        "score_psi": safe_format(metrics.get("score_psi"), 4),
+        "brier": safe_format(metrics.get("brier"), 4),
+        "hl_stat": safe_format(metrics.get("hl_stat"), 2),
+        "hl_pvalue": safe_format(metrics.get("hl_pvalue"), 3),
+        "calib_gap": safe_format(metrics.get("calib_gap"), 4),
+        "score_psi_threshold_warn": thresholds.get("score_psi_warn", 0.10),
+        "score_psi_threshold_alert": thresholds.get("score_psi_alert", 0.25),
+        "hl_pvalue_threshold": thresholds.get("hl_pvalue", 0.05),
+        "score_psi_alert": flags.get("score_psi_alert", False),
+        "score_psi_warn": flags.get("score_psi_warn", False),
+        "calib_alert": flags.get("calib_alert", False),
+        "deciles": rows,
+    }
+
+def dq_context(metrics):
+    """
+    Template variables for the data-quality notes
+    (check rows parsed from dq_json, values pre-formatted).
+    """
+    try:
+        checks = json.loads(metrics.get("dq_json") or "[]")
+    except (TypeError, ValueError):
+        checks = []
+    notes, status = metrics.get("dq_notes"), metrics.get("dq_status")
+    return {
+        "dq_notes": notes if isinstance(notes, str) and notes else "No unusual ETL/schema issues observed.",
+        "dq_status": status if isinstance(status, str) and status else "N/A",
+        "dq_checks": [{
+            "check": c.get("check"),
+            "target": c.get("target"),
+            "level": c.get("level"),
+            "detail": c.get("detail"),
+        } for c in checks],
+    }
+
+def anomaly_context(metrics):
+    """Template variables for the row-level anomaly line (empty when not run)."""
+    rate = safe_float(metrics.get("anomaly_rate"))
+    if rate is None:
+        return {"anomaly_rate": None}
+    try:
+        drivers = json.loads(metrics.get("anomaly_drivers_json") or "[]")
+    except (TypeError, ValueError):
+        drivers = []
+    expected = safe_float(metrics.get("anomaly_expected_rate"))
+    return {
+        "anomaly_rate": f"{rate:.2%}",
+        "anomaly_expected_rate": f"{expected:.2%}" if expected is not None else "N/A",
+        "anomaly_alert": metrics.get("anomaly_level") in ("WARN", "ALERT"),
+        "anomaly_drivers": ", ".join(f"{d['feature']} ({d['share']:.0%})" for d in drivers[:3]) or "N/A",
+    }
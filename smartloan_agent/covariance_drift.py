@@ -0,0 +1,193 @@
+"""
+Joint-structure drift: correlation-matrix change and Mahalanobis mean shift.
+
+Univariate PSI does not see a shift in how features move together, for
+example the dti / int_rate / installment_to_income relationship. The
+reference keeps the mean vector and covariance of the numeric features
+(`joint` in reference_stats.pkl). Each batch accumulates its own in a
+separate chunked pass over the rows. It is not fused into the drift pass,
+because feature_drift_table works one sorted column at a time and the
+co-moment update needs whole rows. File batches stream through
+accumulate_file without being loaded.
+
+CovarianceAccumulator is mergeable. Every chunk contributes
+(n, mean, centred co-moment matrix), and chunks are combined with the
+pairwise update of Chan et al.:
+    C = C_a + C_b + outer(d, d) * n_a * n_b / n,   d = mean_b - mean_a
+That is numerically stable and O(rows x features^2) with a single pass.
+Rows with a missing value in any of the features are skipped.
+
+Reported per batch:
+- corr_frobenius       ||R_new - R_ref||_F over the off-diagonal entries
+- corr_top_pairs_json  feature pairs whose correlation changed most
+- mahalanobis_d        sqrt((mu_new - mu_ref)' S_ref^-1 (mu_new - mu_ref))
+- mahalanobis_pvalue   chi2(k) test of n * d^2 (tiny for large batches; d is the effect size)
+
+    python -m smartloan_agent.covariance_drift --build_reference --csv X_train_1.csv
+"""
+import os, json, pickle, argparse
+
+import numpy as np
+import pandas as pd
+import yaml
+from scipy.stats import chi2
+
+from .drift_engine import REF_PATH
+from .drift_metrics import metric_level, LEVEL_RANK
+from .scoring_engine import iter_chunks
+
+CFG_PATH = "monitor/config.yaml"
+
+
+def load_covariance_config(cfg_path=CFG_PATH):
+    """`joint_drift:` section of config.yaml with defaults."""
+    cfg = {}
+    if os.path.exists(cfg_path):
+        with open(cfg_path, "r", encoding="utf-8") as f:
+            cfg = yaml.safe_load(f) or {}
+    out = {
+        "enabled": True,
+        "features": (cfg.get("features") or {}).get("numerical") or [],
+        "chunk_size": 500_000,
+        "top_n": 3,
+        "frobenius_warn": 0.10,
+        "frobenius_alert": 0.25,
+        "mahalanobis_warn": 0.20,
+        "mahalanobis_alert": 0.50,
+    }
+    out.update(cfg.get("joint_drift") or {})
+    return out
+
+
+def _corr(cov):
+    sd = np.sqrt(np.diag(cov))
+    sd = np.where(sd > 0, sd, np.nan)
+    return cov / np.outer(sd, sd)
+
+
+class CovarianceAccumulator:
+    """Streaming, mergeable mean vector + covariance of k features."""
+
+    def __init__(self, features):
+        self.features = list(features)
+        k = len(self.features)
+        self.n = 0
+        self.mean = np.zeros(k)
+        self.C = np.zeros((k, k))      # sum of outer products of deviations
+
+    def _combine(self, n_b, mean_b, C_b):
+        if n_b == 0:
+            return self
+        n_a, n = self.n, self.n + n_b
+        d = mean_b - self.mean
+        self.C = self.C + C_b + np.outer(d, d) * (n_a * n_b / n)
+        self.mean = self.mean + d * (n_b / n)
+        self.n = n
+        return self
+
+    def update(self, df):
+        """Add one chunk (complete rows only)."""
+        X = df.reindex(columns=self.features).apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float)
+        X = X[np.isfinite(X).all(axis=1)]
+        if not len(X):
+            return self
+        mean_b = X.mean(axis=0)
+        Xc = X - mean_b
+        return self._combine(len(X), mean_b, Xc.T @ Xc)
+
+    def merge(self, other):
+        return self._combine(other.n, other.mean, other.C)
+
+    def covariance(self):
+        return self.C / max(self.n - 1, 1)
+
+    def correlation(self):
+        return _corr(self.covariance())
+
+    def to_dict(self):
+        return {"features": self.features, "n": int(self.n),
+                "mean": self.mean.tolist(), "cov": self.covariance().tolist()}
+
+
+def accumulate_frame(df, features, chunk_size=500_000):
+    acc = CovarianceAccumulator(features)
+    for start in range(0, len(df), chunk_size):
+        acc.update(df.iloc[start:start + chunk_size])
+    return acc
+
+def accumulate_file(path, features, chunk_size=500_000):
+    acc = CovarianceAccumulator(features)
+    for chunk in iter_chunks(path, chunk_size):
+        acc.update(chunk)
+    return acc
+
+
+# ---------- Drift ----------
+def joint_drift(acc, ref, top_n=3):
+    """Correlation drift and Mahalanobis shift of a batch accumulator vs the reference dict."""
+    feats = [f for f in ref["features"] if f in acc.features]
+    ri = [ref["features"].index(f) for f in feats]
+    bi = [acc.features.index(f) for f in feats]
+    mu_ref = np.asarray(ref["mean"])[ri]
+    cov_ref = np.asarray(ref["cov"])[np.ix_(ri, ri)]
+    out = {"joint_n": int(acc.n), "corr_frobenius": None, "corr_top_pairs_json": "[]",
+           "mahalanobis_d": None, "mahalanobis_pvalue": None}
+    if acc.n < 2 or len(feats) < 2:
+        return out
+
+    R_ref, R_new = _corr(cov_ref), acc.correlation()[np.ix_(bi, bi)]
+    diff = np.nan_to_num(R_new - R_ref)
+    iu = np.triu_indices(len(feats), k=1)
+    out["corr_frobenius"] = float(np.sqrt(np.sum(diff[iu] ** 2)))
+    order = np.argsort(-np.abs(diff[iu]))[:top_n]
+    out["corr_top_pairs_json"] = json.dumps([{
+        "pair": f"{feats[iu[0][i]]} & {feats[iu[1][i]]}",
+        "corr_ref": round(float(R_ref[iu[0][i], iu[1][i]]), 3),
+        "corr_new": round(float(R_new[iu[0][i], iu[1][i]]), 3),
+    } for i in order], ensure_ascii=False)
+
+    delta = acc.mean[bi] - mu_ref
+    d2 = float(delta @ np.linalg.pinv(cov_ref) @ delta)
+    out["mahalanobis_d"] = float(np.sqrt(max(d2, 0.0)))
+    out["mahalanobis_pvalue"] = float(chi2.sf(acc.n * d2, len(feats)))
+    return out
+
+def covariance_drift(df, ref, cov_cfg):
+    """Batch summary fields, or {} when the reference has no `joint` block."""
+    joint = (ref or {}).get("joint") if isinstance(ref, dict) else None
+    if not joint:
+        print("[WARN] joint drift skipped: reference_stats.pkl has no 'joint' block "
+              "(build it with: python -m smartloan_agent.covariance_drift --build_reference)")
+        return {}
+    acc = accumulate_frame(df, joint["features"], int(cov_cfg["chunk_size"]))
+    out = joint_drift(acc, joint, int(cov_cfg["top_n"]))
+    levels = [
+        metric_level(out["corr_frobenius"], {"warn": cov_cfg["frobenius_warn"], "alert": cov_cfg["frobenius_alert"]}),
+        metric_level(out["mahalanobis_d"], {"warn": cov_cfg["mahalanobis_warn"], "alert": cov_cfg["mahalanobis_alert"]}),
+    ]
+    out["joint_level"] = max(levels, key=LEVEL_RANK.get)
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--build_reference", action="store_true",
+                    help="add the mean vector / covariance of --csv to reference_stats.pkl")
+    ap.add_argument("--csv", default="X_train_1.csv")
+    args = ap.parse_args()
+    if not args.build_reference:
+        ap.print_help()
+        return
+    cfg = load_covariance_config()
+    with open(REF_PATH, "rb") as f:
+        ref = pickle.load(f)
+    feats = cfg["features"] or list(ref.get("features", {}))
+    acc = accumulate_file(args.csv, feats, int(cfg["chunk_size"]))
+    ref["joint"] = acc.to_dict()
+    with open(REF_PATH, "wb") as f:
+        pickle.dump(ref, f)
+    print(f"[OK] joint reference ({acc.n:,} complete rows, {len(feats)} features) → {REF_PATH}")
+
+
+if __name__ == "__main__":
+    main()
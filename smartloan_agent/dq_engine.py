@@ -0,0 +1,185 @@
+"""
+Data-quality engine: turns batch checks into `dq_notes` for the report.
+
+Column checks run inside the drift pass (feature_drift_table). They reuse
+the ColumnView that the drift metrics already sorted:
+- out_of_range_rate   share outside the reference [min, max]
+- tail_rate           share outside the reference [p01, p99] (about 2% expected)
+- coerce_fail_rate    non-empty values that are not numeric
+
+Frame checks are one vectorised pass each over the batch frame:
+- one-hot groups      rows with several categories set, or none set for
+                      groups without a dropped base level; non-0/1 values
+- schema              columns missing from, or unseen in, the reference
+                      column list (unseen one-hot levels are called out)
+- duplicates          repeated rows, found by hashing each row once
+
+Levels come from the `data_quality:` thresholds in config.yaml.
+"""
+import os, json
+
+import numpy as np
+import pandas as pd
+import yaml
+
+CFG_PATH = "monitor/config.yaml"
+CLEAN_NOTE = "No unusual ETL/schema issues observed."
+LEVEL_RANK = {"OK": 0, "WARN": 1, "ALERT": 2}
+
+
+def load_dq_config(cfg_path=CFG_PATH):
+    """`data_quality:` section of config.yaml with defaults."""
+    cfg = {}
+    if os.path.exists(cfg_path):
+        with open(cfg_path, "r", encoding="utf-8") as f:
+            cfg = yaml.safe_load(f) or {}
+    out = {
+        "enabled": True,
+        "onehot_groups": {},
+        "expected_columns": [],
+        "thresholds": {},
+    }
+    out.update(cfg.get("data_quality") or {})
+    th = {
+        "out_of_range_rate": {"warn": 0.005, "alert": 0.02},
+        "tail_rate": {"warn": 0.05, "alert": 0.10},
+        "coerce_fail_rate": {"warn": 0.0, "alert": 0.01},
+        "onehot_invalid_rate": {"warn": 0.0, "alert": 0.01},
+        "duplicate_rate": {"warn": 0.0, "alert": 0.01},
+        "missing_columns": {"warn": 0, "alert": 0},
+        "unseen_columns": {"warn": 0, "alert": 0},
+    }
+    for k, v in (out.get("thresholds") or {}).items():
+        th.setdefault(k, {}).update(v or {})
+    out["thresholds"] = th
+    return out
+
+def dq_level(v, th):
+    if v is None or pd.isna(v) or not th:
+        return "OK"
+    if v > th.get("alert", np.inf):
+        return "ALERT"
+    if v > th.get("warn", np.inf):
+        return "WARN"
+    return "OK"
+
+
+# ---------- Column checks (inside the drift pass) ----------
+def _outside_rate(sorted_vals, lo, hi):
+    if lo is None or hi is None or not len(sorted_vals):
+        return np.nan
+    below = np.searchsorted(sorted_vals, lo, side="left")
+    above = len(sorted_vals) - np.searchsorted(sorted_vals, hi, side="right")
+    return float((below + above) / len(sorted_vals))
+
+def column_dq(view):
+    """Range and type checks of one ColumnView against its reference stats."""
+    ref = view.ref
+    return {
+        "out_of_range_rate": _outside_rate(view.sorted, ref.get("min"), ref.get("max")),
+        "tail_rate": _outside_rate(view.sorted, ref.get("p01"), ref.get("p99")),
+        "coerce_fail_rate": float(view.n_coerce_fail / view.n_total) if view.n_total else np.nan,
+    }
+
+
+# ---------- Frame checks ----------
+def onehot_checks(df, groups):
+    """Per prefix: share of rows with 0 / >1 categories set, and non-0/1 values."""
+    rows = []
+    for prefix, allow_none in (groups or {}).items():
+        cols = [c for c in df.columns if c.startswith(prefix)]
+        if not cols:
+            continue
+        X = df[cols].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float)
+        non_binary = ~np.isin(X, (0.0, 1.0))
+        n_set = np.where(non_binary, 0.0, X).sum(axis=1)
+        bad = (n_set > 1) | non_binary.any(axis=1)
+        if not allow_none:
+            bad |= n_set == 0
+        rows.append({
+            "group": prefix + "*",
+            "several_set": int((n_set > 1).sum()),
+            "none_set": int((n_set == 0).sum()) if not allow_none else 0,
+            "non_binary": int(non_binary.any(axis=1).sum()),
+            "invalid_rate": float(bad.mean()) if len(bad) else 0.0,
+        })
+    return rows
+
+def schema_checks(columns, expected, groups=None):
+    """Missing / unseen columns vs the reference column list (None = not checked)."""
+    if not expected:
+        return None
+    columns, expected = list(columns), set(expected)
+    unseen = [c for c in columns if c not in expected]
+    return {
+        "missing": [c for c in expected if c not in set(columns)],
+        "unseen": unseen,
+        "unseen_onehot": [c for c in unseen if any(c.startswith(p) for p in (groups or {}))],
+    }
+
+def duplicate_rows(df):
+    """Number of rows identical to an earlier row (one 64-bit hash per row)."""
+    if df.empty:
+        return 0
+    h = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    return int(len(h) - len(np.unique(h)))
+
+
+# ---------- Report ----------
+def dq_report(feat_df, df, dq_cfg, expected_columns=None):
+    """
+    Combine column and frame checks.
+    Returns {dq_status, dq_notes, dq_json} (dq_json: checks above OK).
+    """
+    th = dq_cfg["thresholds"]
+    checks = []
+
+    def add(check, target, value, detail):
+        level = dq_level(value, th.get(check))
+        if level != "OK":
+            checks.append({"check": check, "target": target, "value": value,
+                           "level": level, "detail": detail})
+
+    for col in ("out_of_range_rate", "tail_rate", "coerce_fail_rate"):
+        if col not in feat_df.columns:
+            continue
+        for feat, v in feat_df[["feature", col]].itertuples(index=False):
+            if pd.notna(v):
+                add(col, feat, round(float(v), 4), {
+                    "out_of_range_rate": f"'{feat}' {v:.1%} outside the training range",
+                    "tail_rate": f"'{feat}' {v:.1%} outside training p01-p99",
+                    "coerce_fail_rate": f"'{feat}' {v:.1%} non-numeric values",
+                }[col])
+
+    for g in onehot_checks(df, dq_cfg.get("onehot_groups")):
+        parts = [f"{g[k]} {label}" for k, label in
+                 (("several_set", "with several set"), ("none_set", "with none set"),
+                  ("non_binary", "non-0/1")) if g[k]]
+        add("onehot_invalid_rate", g["group"], round(g["invalid_rate"], 4),
+            f"{g['group']}: {g['invalid_rate']:.1%} invalid rows ({', '.join(parts)})")
+
+    schema = schema_checks(df.columns, expected_columns or dq_cfg.get("expected_columns"),
+                           dq_cfg.get("onehot_groups"))
+    if schema:
+        add("missing_columns", "schema", len(schema["missing"]),
+            f"{len(schema['missing'])} expected column(s) missing, e.g. {schema['missing'][:3]}")
+        unseen = schema["unseen_onehot"] or schema["unseen"]
+        add("unseen_columns", "schema", len(schema["unseen"]),
+            f"{len(schema['unseen'])} unseen column(s)"
+            + (f" incl. new one-hot levels {schema['unseen_onehot'][:3]}" if schema["unseen_onehot"]
+               else f", e.g. {unseen[:3]}"))
+
+    n_dup = duplicate_rows(df)
+    add("duplicate_rate", "rows", round(n_dup / max(len(df), 1), 4),
+        f"{n_dup} duplicate row(s) ({n_dup / max(len(df), 1):.1%})")
+
+    checks.sort(key=lambda c: -LEVEL_RANK[c["level"]])
+    status = checks[0]["level"] if checks else "OK"
+    notes = CLEAN_NOTE if not checks else (
+        f"{len(checks)} data-quality issue(s): " + "; ".join(c["detail"] for c in checks[:5])
+        + (f" (+{len(checks) - 5} more)" if len(checks) > 5 else "") + ".")
+    return {
+        "dq_status": status,
+        "dq_notes": notes,
+        "dq_json": json.dumps(checks, ensure_ascii=False, default=float),
+    }
@@ -0,0 +1,130 @@
+"""
+In-process drift engine (PSI / KS / Wasserstein / JS, missingness and mean
+shift per feature). Shared by monitor/monitor_1.py and the agent tools;
+the metrics themselves live in drift_metrics.py.
+"""
+import json, pickle
+import numpy as np
+import pandas as pd
+
+from .drift_metrics import (ColumnView, bin_index, psi_from_counts, column_drift,
+                            drift_metric_config, feature_metric_spec, DEFAULT_METRICS)
+from .dq_engine import column_dq
+
+REF_PATH = "monitor/reference_stats.pkl"
+
+
+def load_reference_stats(path=REF_PATH):
+    """Per-feature reference stats from reference_stats.pkl."""
+    with open(path, "rb") as f:
+        ref = pickle.load(f)
+    return ref["features"] if (isinstance(ref, dict) and "features" in ref) else ref
+
+def calculate_psi(series, bins, expected_counts):
+    s = pd.to_numeric(series, errors="coerce").replace([np.inf, -np.inf], np.nan).dropna()
+    if s.empty or bins is None or expected_counts is None:
+        return np.nan
+    bins = np.asarray(bins, dtype=float)
+    exp = np.asarray(expected_counts, dtype=float)
+    if exp.size != bins.size - 1:
+        return np.nan
+    new_counts = np.bincount(bin_index(s.values, bins), minlength=exp.size)
+    return psi_from_counts(new_counts, exp)
+
+def feature_drift_table(df_new, ref_stats, metric_cfg=None, bin_counts=None):
+    """
+    One row per reference feature present in the batch (sorted by feature):
+    feature, psi, ks, wasserstein, js, missing_rate_new, mean_diff,
+    drift_level / drift_metric (worst level over the feature's metrics),
+    out_of_range_rate, tail_rate, coerce_fail_rate (DQ from the same view).
+    metric_cfg: drift_metric_config(cfg); None = all metrics, default thresholds.
+    bin_counts: optional dict filled with the batch counts per feature on the
+    reference bins (reused by the multi-reference comparison).
+    """
+    metric_cfg = metric_cfg or drift_metric_config({})
+    common = [c for c in ref_stats.keys() if c in df_new.columns]
+    metric_cols = list(dict.fromkeys(["psi"] + DEFAULT_METRICS + metric_cfg["metrics"]))
+    dq_cols = ["out_of_range_rate", "tail_rate", "coerce_fail_rate"]
+    columns = (["feature"] + metric_cols + ["missing_rate_new", "mean_diff", "drift_level", "drift_metric"]
+               + dq_cols)
+
+    rows = []
+    for col in common:
+        base = ref_stats.get(col, {})
+        base_mean = base.get("mean", np.nan)
+
+        s = pd.to_numeric(df_new[col], errors="coerce")
+        miss_rate = float(pd.isna(s).mean())
+        mean_diff = float(s.mean() - base_mean) if pd.notna(base_mean) else np.nan
+
+        bins, counts = base.get("bins"), base.get("counts")
+        t = str(base.get("type", "")).lower()
+        is_num = (t in ("numeric", "numerical")) or (bins is not None and counts is not None)
+
+        row = dict.fromkeys(metric_cols + dq_cols, np.nan)
+        level, metric = "N/A", None
+        if is_num:
+            metrics, thresholds = feature_metric_spec(metric_cfg, col)
+            view = ColumnView(df_new[col], base)
+            vals, level, metric = column_drift(view, metrics, thresholds)
+            row.update(vals)
+            row.update(column_dq(view))
+            if bin_counts is not None and view.counts is not None:
+                bin_counts[col] = view.counts
+        row.update({
+            "feature": col,
+            "missing_rate_new": miss_rate,
+            "mean_diff": mean_diff,
+            "drift_level": level,
+            "drift_metric": metric,
+        })
+        rows.append(row)
+
+    if not rows:
+        return pd.DataFrame(columns=columns)
+    return pd.DataFrame(rows)[columns].sort_values("feature").reset_index(drop=True)
+
+def summarize_drift(feat_df, top_n=3):
+    """
+    Batch-level drift summary from a feature_drift_table:
+    psi max value/feature, max missing rate/feature, top-N drift JSON.
+    """
+    psi_num = pd.to_numeric(feat_df["psi"], errors="coerce")
+    miss_num = pd.to_numeric(feat_df["missing_rate_new"], errors="coerce")
+
+    out = {
+        "psi_max_value": None, "psi_max_feature": None,
+        "max_missing_rate": None, "max_missing_feature": None,
+    }
+    if psi_num.notna().any():
+        i = psi_num.idxmax()
+        out["psi_max_value"], out["psi_max_feature"] = float(psi_num[i]), feat_df.loc[i, "feature"]
+    if miss_num.notna().any():
+        i = miss_num.idxmax()
+        out["max_missing_rate"], out["max_missing_feature"] = float(miss_num[i]), feat_df.loc[i, "feature"]
+
+    top = (feat_df.assign(psi_num=psi_num)
+                  .dropna(subset=["psi_num"])
+                  .sort_values("psi_num", ascending=False)
+                  .head(top_n))
+    out["top_drift_json"] = json.dumps(
+        [{"feature": a, "psi": float(b), "ref": "ref-dist"} for a, b in top[["feature", "psi_num"]].values],
+        ensure_ascii=False
+    )
+    if "drift_level" in feat_df.columns:
+        flagged = feat_df[feat_df["drift_level"].isin(["WARN", "ALERT"])]
+        out["drift_alerts_json"] = json.dumps([
+            {"feature": f, "metric": m, "value": round(float(feat_df.loc[i, m]), 4), "level": lv}
+            for i, f, m, lv in flagged[["feature", "drift_metric", "drift_level"]].itertuples()
+        ], ensure_ascii=False)
+    return out
+
+def psi_level(v, warn=0.10, alert=0.20):
+    """OK / WARN / ALERT / N/A for one PSI value."""
+    if v is None or pd.isna(v):
+        return "N/A"
+    if v > alert:
+        return "ALERT"
+    if v > warn:
+        return "WARN"
+    return "OK"
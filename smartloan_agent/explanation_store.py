@@ -0,0 +1,285 @@
+"""
+Per-applicant explanation store.
+
+One store per (batch, model) holds the full-batch SHAP matrix as on-disk
+.npy arrays that are opened memory-mapped, so a lookup reads one row and
+never loads the whole matrix:
+
+    {dir}/{batch_id}__{model}/
+        meta.json        model, model_version, feature_names, base_value, top_k
+        ids.npy          applicant ids (str), row i <-> ids[i]
+        shap.npy         float32 [n_rows, n_features]   SHAP values (log-odds)
+        data.npy         float32 [n_rows, n_features]   feature values
+        logit.npy        float32 [n_rows]               base_value + row sum
+        topk_idx.npy     int32   [n_rows, top_k]        reason-code feature index
+        topk_shap.npy    float32 [n_rows, top_k]        reason-code SHAP value
+
+Top-k reasons (largest |SHAP| per row) are precomputed at build time; the
+id -> row index is a dict built once per opened store, so get() is O(1).
+
+    python -m smartloan_agent.explanation_store --csv monitor/X_new.csv --model xgb
+"""
+import os, json, shutil, argparse, threading
+from collections import OrderedDict
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import yaml
+
+from .shap_engine import get_shap_engine
+
+CFG_PATH = "monitor/config.yaml"
+DEFAULT_STORE_DIR = "monitor/cache/explanations"
+OPEN_STORES = 4   # stores kept open (id index + memmaps) per process
+
+
+def load_store_config(cfg_path=CFG_PATH):
+    """`explanation_store:` section of config.yaml with defaults."""
+    cfg = {}
+    if os.path.exists(cfg_path):
+        with open(cfg_path, "r", encoding="utf-8") as f:
+            cfg = yaml.safe_load(f) or {}
+    out = {
+        "enabled": False,
+        "model": "xgb",
+        "id_col": "id",
+        "top_k": 5,
+        "dir": DEFAULT_STORE_DIR,
+        "keep_batches": 5,
+    }
+    out.update(cfg.get("explanation_store") or {})
+    return out
+
+def applicant_ids(df, id_col="id"):
+    """Applicant ids as strings; row position when the batch has no id column."""
+    if id_col and id_col in df.columns:
+        ids = df[id_col].astype(str).to_numpy()
+        if pd.Index(ids).has_duplicates:
+            raise ValueError(f"duplicate applicant ids in column '{id_col}'")
+        return ids
+    return np.arange(len(df)).astype(str)
+
+def top_k_reasons(values, k):
+    """Indices / values of the k largest |SHAP| per row, sorted by |SHAP| desc."""
+    k = min(int(k), values.shape[1])
+    absv = np.abs(values)
+    idx = np.argpartition(-absv, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(absv, idx, axis=1), axis=1, kind="stable")
+    idx = np.take_along_axis(idx, order, axis=1).astype(np.int32)
+    return idx, np.take_along_axis(values, idx, axis=1).astype(np.float32)
+
+def _safe_id(s):
+    return "".join(c if c.isalnum() or c in "-_" else "-" for c in str(s))
+
+
+# ---------- Build ----------
+def build_store(res, ids, batch_id, store_dir=DEFAULT_STORE_DIR, top_k=5):
+    """
+    Persist a full-batch ShapResult. `ids` are the applicant ids of the whole
+    batch (indexed by res.row_index). Returns the store path.
+    """
+    if len(res.row_index) != res.batch_rows:
+        raise ValueError("explanation store needs SHAP values for the full batch (sample_size=None)")
+    path = os.path.join(store_dir, f"{_safe_id(batch_id)}__{_safe_id(res.model_name)}")
+    tmp = path + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    values = np.asarray(res.values, dtype=np.float32)
+    idx, vals = top_k_reasons(values, top_k)
+    np.save(os.path.join(tmp, "ids.npy"), np.asarray(ids)[res.row_index].astype(str))
+    np.save(os.path.join(tmp, "shap.npy"), values)
+    np.save(os.path.join(tmp, "data.npy"), np.asarray(res.data, dtype=np.float32))
+    np.save(os.path.join(tmp, "logit.npy"), (res.base_value + values.sum(axis=1)).astype(np.float32))
+    np.save(os.path.join(tmp, "topk_idx.npy"), idx)
+    np.save(os.path.join(tmp, "topk_shap.npy"), vals)
+    with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "batch_id": str(batch_id),
+            "model": res.model_name,
+            "model_version": res.model_version,
+            "feature_names": list(res.feature_names),
+            "base_value": float(res.base_value),
+            "n_rows": int(len(values)),
+            "top_k": int(idx.shape[1]),
+            "created": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        }, f, indent=2)
+
+    # readers only ever see a fully written directory
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp, path)
+    _forget(path)
+    return path
+
+
+def list_stores(store_dir=DEFAULT_STORE_DIR, model=None):
+    """Store metadata, newest first."""
+    out = []
+    if not os.path.isdir(store_dir):
+        return out
+    for name in os.listdir(store_dir):
+        meta_path = os.path.join(store_dir, name, "meta.json")
+        if name.endswith(".tmp") or not os.path.exists(meta_path):
+            continue
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if model and meta.get("model") != model:
+            continue
+        out.append({**meta, "path": os.path.join(store_dir, name)})
+    return sorted(out, key=lambda m: m["created"], reverse=True)
+
+def prune_stores(store_dir=DEFAULT_STORE_DIR, keep=5):
+    """Keep the `keep` newest stores per model; returns removed paths."""
+    removed, seen = [], {}
+    for meta in list_stores(store_dir):
+        seen[meta["model"]] = seen.get(meta["model"], 0) + 1
+        if keep and seen[meta["model"]] > keep:
+            _forget(meta["path"])
+            shutil.rmtree(meta["path"], ignore_errors=True)
+            removed.append(meta["path"])
+    return removed
+
+
+# ---------- Lookup ----------
+class ExplanationStore:
+    """Read side of one store: memory-mapped arrays + id -> row dict."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.features = self.meta["feature_names"]
+        load = lambda n: np.load(os.path.join(path, n), mmap_mode="r")
+        self.shap = load("shap.npy")
+        self.data = load("data.npy")
+        self.logit = load("logit.npy")
+        self.topk_idx = load("topk_idx.npy")
+        self.topk_shap = load("topk_shap.npy")
+        ids = np.load(os.path.join(path, "ids.npy"))
+        self.row_of = dict(zip(ids.tolist(), range(len(ids))))
+
+    def __len__(self):
+        return len(self.row_of)
+
+    def __contains__(self, applicant_id):
+        return str(applicant_id) in self.row_of
+
+    def _row(self, applicant_id):
+        row = self.row_of.get(str(applicant_id))
+        if row is None:
+            raise KeyError(f"applicant '{applicant_id}' not in batch {self.meta['batch_id']}")
+        return row
+
+    def _reason(self, row, j, shap_value):
+        return {
+            "feature": self.features[j],
+            "value": float(self.data[row, j]),
+            "shap": float(shap_value),
+            "direction": "raises risk" if shap_value > 0 else "lowers risk",
+        }
+
+    def get(self, applicant_id, top_k=None):
+        """Top-k reason codes for one applicant (precomputed; wider k reads the SHAP row)."""
+        row = self._row(applicant_id)
+        k = self.meta["top_k"] if top_k is None else int(top_k)
+        if k <= self.meta["top_k"]:
+            reasons = [self._reason(row, int(j), v)
+                       for j, v in zip(self.topk_idx[row, :k], self.topk_shap[row, :k])]
+        else:
+            idx, vals = top_k_reasons(np.asarray(self.shap[row:row + 1]), k)
+            reasons = [self._reason(row, int(j), v) for j, v in zip(idx[0], vals[0])]
+        logit = float(self.logit[row])
+        return {
+            "applicant_id": str(applicant_id),
+            "batch_id": self.meta["batch_id"],
+            "model": self.meta["model"],
+            "base_value": self.meta["base_value"],
+            "logit": logit,
+            "probability": float(1.0 / (1.0 + np.exp(-logit))),
+            "reasons": reasons,
+        }
+
+    def row_frame(self, applicant_id):
+        """Full SHAP row: feature, value, shap (sorted by |shap| desc)."""
+        row = self._row(applicant_id)
+        out = pd.DataFrame({
+            "feature": self.features,
+            "value": np.asarray(self.data[row]),
+            "shap": np.asarray(self.shap[row]),
+        })
+        return out.reindex(out["shap"].abs().sort_values(ascending=False).index).reset_index(drop=True)
+
+
+_open, _open_lock = OrderedDict(), threading.Lock()
+
+def _forget(path):
+    with _open_lock:
+        _open.pop(path, None)
+
+def open_store(path):
+    """Opened stores are kept in a small LRU so the id index is built once."""
+    with _open_lock:
+        if path in _open:
+            _open.move_to_end(path)
+            return _open[path]
+    store = ExplanationStore(path)
+    with _open_lock:
+        _open[path] = store
+        while len(_open) > OPEN_STORES:
+            _open.popitem(last=False)
+    return store
+
+def find_store(batch_id=None, model=None, cfg_path=CFG_PATH):
+    """Store for `batch_id` (newest when None) and model (config default when None)."""
+    cfg = load_store_config(cfg_path)
+    stores = list_stores(cfg["dir"], model or cfg["model"])
+    if batch_id is not None:
+        stores = [m for m in stores if m["batch_id"] == str(batch_id)
+                  or os.path.basename(m["path"]).startswith(_safe_id(batch_id) + "__")]
+    return open_store(stores[0]["path"]) if stores else None
+
+def get_explanation(applicant_id, batch_id=None, model=None, top_k=None, cfg_path=CFG_PATH):
+    """Top-k reason codes for one applicant; None when no store exists."""
+    store = find_store(batch_id, model, cfg_path)
+    return store.get(applicant_id, top_k) if store is not None else None
+
+
+# ---------- Batch Run ----------
+def store_batch_explanations(df, batch_id, cfg=None, cfg_path=CFG_PATH):
+    """Explain the full batch and persist it; returns the store path (None if model missing)."""
+    cfg = cfg or load_store_config(cfg_path)
+    engine = get_shap_engine(cfg_path)
+    if cfg["model"] not in engine.available_models():
+        print(f"[WARN] explanation store skipped: model '{cfg['model']}' artifact not found")
+        return None
+    ids = applicant_ids(df, cfg.get("id_col"))
+    # the store is the persisted copy; keep the full matrix out of the SHAP cache
+    res = engine.explain(df, cfg["model"], sample_size=None, cache=False)
+    path = build_store(res, ids, batch_id, cfg["dir"], int(cfg["top_k"]))
+    prune_stores(cfg["dir"], int(cfg.get("keep_batches") or 0))
+    return path
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--csv", default="monitor/X_new.csv")
+    ap.add_argument("--batch_id", default=None, help="default: current timestamp")
+    ap.add_argument("--model", default=None, help="default: explanation_store.model")
+    ap.add_argument("--lookup", default=None, help="print reasons for this applicant id")
+    args = ap.parse_args()
+
+    cfg = load_store_config()
+    if args.model:
+        cfg["model"] = args.model
+    if args.lookup is not None:
+        print(json.dumps(get_explanation(args.lookup, args.batch_id, cfg["model"]), indent=2))
+        return
+    batch_id = args.batch_id or datetime.now().strftime("%Y%m%d_%H%M%S")
+    path = store_batch_explanations(pd.read_csv(args.csv, encoding="utf-8-sig"), batch_id, cfg)
+    if path:
+        print(f"[OK] explanations for batch {batch_id} → {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,521 @@
+"""
+In-process fairness engine (approval-rate parity, 80% rule, TPR parity).
+Shared by the Fairness page and the agent tools.
+
+Decision sets too large for memory are audited from streamed, mergeable
+per-group score sketches (FairnessSketch / sketch_fairness):
+
+    python -m smartloan_agent.fairness_engine --csv decisions.parquet --group_col state_group
+"""
+import numpy as np
+import pandas as pd
+
+FAIRNESS_PATH = "monitor/test_fairness_features.csv"
+
+# ---------- Helper Functions ----------
+def recover_annual_inc(s_log: pd.Series) -> pd.Series:
+    """Recover annual income from log-transformed values."""
+    rec = np.expm1(s_log)
+    return np.exp(s_log) if (rec < 0).any() else rec
+
+def make_state_group(s: pd.Series, min_count: int = 200) -> pd.Series:
+    """Group low-frequency states into 'OTHER' category."""
+    s = s.astype(str).fillna("UNKNOWN")
+    vc = s.value_counts()
+    keep = set(vc[vc >= min_count].index)
+    return s.where(s.isin(keep), "OTHER")
+
+def simple_fairness(df, y_true, y_score, group_col, target_approval=0.40):
+    """
+    Compute fairness metrics using a GLOBAL cutoff (same for all groups).
+    Returns per-group stats and summary with 80% rule compliance.
+    """
+    d = df[[y_true, y_score, group_col]].dropna().copy()
+    
+    # Global cutoff: approve top X% based on lowest risk scores
+    cutoff = float(np.quantile(d[y_score].values, target_approval))
+    d["approve"] = (d[y_score] <= cutoff).astype(int)
+
+    rows = []
+    for g, gdf in d.groupby(group_col):
+        n = len(gdf)
+        ar = gdf["approve"].mean() if n else np.nan
+        
+        # TPR for "good" customers (y_true == 0)
+        good = (gdf[y_true] == 0)
+        tprg = gdf.loc[good, "approve"].mean() if good.sum() > 0 else np.nan
+        
+        rows.append({
+            "group": g, 
+            "n": n, 
+            "approve_rate": ar, 
+            "TPR_good": tprg
+        })
+    
+    per = pd.DataFrame(rows).sort_values("n", ascending=False).reset_index(drop=True)
+
+    # Disparate Impact Ratio (DIR) vs majority group
+    base = per.loc[per["n"].idxmax(), "approve_rate"]
+    per["DIR_vs_majority"] = per["approve_rate"] / base if base > 0 else np.nan
+
+    # 80% rule: min/max approval rate ratio
+    dir_min_over_max = per["approve_rate"].min() / per["approve_rate"].max()
+    
+    # TPR range (fairness across groups)
+    tpr_range = (
+        (per["TPR_good"].max() - per["TPR_good"].min()) 
+        if per["TPR_good"].notna().any() 
+        else np.nan
+    )
+
+    summary = {
+        "used_cutoff": cutoff,
+        "DIR_min_over_max": float(dir_min_over_max),
+        "TPR_good_range": float(tpr_range) if pd.notna(tpr_range) else np.nan,
+        "pass_80_rule": bool(dir_min_over_max >= 0.8),
+    }
+    return per, summary
+
+def group_cutoff_fairness(df, y_true, y_score, group_col, target_approval=0.40):
+    """
+    Compute fairness metrics using GROUP-SPECIFIC cutoffs (equalizing approval rates).
+    Returns per-group stats and summary with 80% rule compliance.
+    """
+    d = df[[y_true, y_score, group_col]].dropna().copy()
+    
+    # Calculate group-specific cutoffs to achieve target approval rate in each group
+    cuts = d.groupby(group_col)[y_score].quantile(target_approval).to_dict()
+
+    d["approve_fair"] = 0
+    for g, c in cuts.items():
+        d.loc[(d[group_col] == g) & (d[y_score] <= c), "approve_fair"] = 1
+
+    rows = []
+    for g, gdf in d.groupby(group_col):
+        n = len(gdf)
+        ar = gdf["approve_fair"].mean() if n else np.nan
+        
+        good = (gdf[y_true] == 0)
+        tprg = gdf.loc[good, "approve_fair"].mean() if good.sum() > 0 else np.nan
+        
+        rows.append({
+            "group": g, 
+            "n": n, 
+            "approve_rate": ar, 
+            "TPR_good": tprg
+        })
+    
+    per = pd.DataFrame(rows).sort_values("n", ascending=False).reset_index(drop=True)
+
+    base = per.loc[per["n"].idxmax(), "approve_rate"]
+    per["DIR_vs_majority"] = per["approve_rate"] / base if base > 0 else np.nan
+
+    dir_min_over_max = per["approve_rate"].min() / per["approve_rate"].max()
+    tpr_range = (
+        (per["TPR_good"].max() - per["TPR_good"].min()) 
+        if per["TPR_good"].notna().any() 
+        else np.nan
+    )
+
+    summary = {
+        "used_cutoffs": "group-specific",
+        "DIR_min_over_max": float(dir_min_over_max),
+        "TPR_good_range": float(tpr_range) if pd.notna(tpr_range) else np.nan,
+        "pass_80_rule": bool(dir_min_over_max >= 0.8),
+    }
+    return per, summary
+
+# ---------- Constrained Cutoff Optimizer ----------
+OPTIMIZER_DEFAULTS = {
+    "objective": "good_approvals",   # good_approvals | defaults
+    "min_dir": 0.80,                 # DIR_min_over_max floor
+    "tpr_tol": 0.10,                 # max TPR_good range (None = unconstrained)
+    "approval_tol": 0.01,            # overall approval rate within target ± tol
+    "grid": 50,                      # anchors per constraint in [0, 1]
+    "frontier": [0.80, 0.85, 0.90, 0.95],
+}
+OBJECTIVES = ("good_approvals", "defaults")
+
+def optimizer_config(cfg):
+    """`fairness.optimizer` of a loaded config.yaml merged over OPTIMIZER_DEFAULTS."""
+    out = dict(OPTIMIZER_DEFAULTS)
+    out.update(((cfg or {}).get("fairness") or {}).get("optimizer") or {})
+    return out
+
+def _group_curves(d, y_true, y_score, group_col):
+    """
+    Sort each group by score once. Index k of every cumulative array is the
+    state after approving the k lowest-risk rows of the group.
+    """
+    curves = []
+    for g, gdf in d.groupby(group_col):
+        s = gdf[y_score].to_numpy(dtype=float)
+        order = np.argsort(s, kind="stable")
+        s = s[order]
+        good = (gdf[y_true].to_numpy()[order] == 0)
+        curves.append({
+            "group": g,
+            "n": len(s),
+            "scores": s,
+            "n_good": int(good.sum()),
+            "cum_good": np.concatenate(([0], np.cumsum(good))),           # realised goods
+            "cum_exp_good": np.concatenate(([0.0], np.cumsum(1.0 - s))),  # expected goods
+            "cum_exp_bad": np.concatenate(([0.0], np.cumsum(s))),         # expected defaults
+        })
+    return curves
+
+def _bounds(curves, min_dir, tpr_tol, grid):
+    """
+    Per anchor pair (approval floor L, TPR floor T): the range of k each group
+    may take so that every approval rate is in [L, L / min_dir] and every
+    TPR_good in [T, T + tpr_tol]. Shapes (n_L, n_T, n_groups).
+    """
+    eps = 1e-9
+    anchors = np.linspace(0.0, 1.0, int(grid) + 1)
+    n = np.array([c["n"] for c in curves], dtype=float)
+    lo_r = np.ceil(anchors[:, None] * n - eps)
+    hi_r = np.floor(np.minimum(anchors[:, None] / min_dir, 1.0) * n + eps)
+
+    if tpr_tol is None:
+        lo_t, hi_t = np.zeros((1, len(curves))), n[None, :].copy()
+    else:
+        lo_t = np.empty((len(anchors), len(curves)))
+        hi_t = np.empty_like(lo_t)
+        for j, c in enumerate(curves):
+            if c["n_good"] == 0:                    # TPR_good undefined: no constraint
+                lo_t[:, j], hi_t[:, j] = 0, c["n"]
+                continue
+            lo_t[:, j] = np.searchsorted(c["cum_good"], anchors * c["n_good"] - eps, side="left")
+            hi_t[:, j] = np.searchsorted(c["cum_good"], (anchors + tpr_tol) * c["n_good"] + eps, side="right") - 1
+    lo = np.maximum(lo_r[:, None, :], lo_t[None, :, :]).astype(np.int64)
+    hi = np.minimum(hi_r[:, None, :], hi_t[None, :, :]).astype(np.int64)
+    return lo, hi
+
+def _allocate(curves, all_scores, lo, hi, K):
+    """
+    Best split of K approvals with lo <= k_g <= hi: approve lo_g in every
+    group, then the lowest remaining scores. Expected goods are concave in k_g,
+    so one score threshold (clipped per group) is optimal; it is found by
+    bisection over the pooled sorted scores.
+    """
+    def count(t, side="right"):
+        return np.array([min(max(np.searchsorted(c["scores"], t, side=side), l), h)
+                         for c, l, h in zip(curves, lo, hi)])
+
+    a, b = 0, len(all_scores) - 1
+    while a < b:
+        m = (a + b) // 2
+        if count(all_scores[m]).sum() >= K:
+            b = m
+        else:
+            a = m + 1
+    k = count(all_scores[a])
+    below = count(all_scores[a], side="left")
+    excess = int(k.sum() - K)
+    for j in range(len(k)):                    # ties at the threshold score
+        if excess <= 0:
+            break
+        drop = min(excess, int(k[j] - below[j]))
+        k[j] -= drop
+        excess -= drop
+    return k
+
+def _evaluate(curves, k):
+    n = np.array([c["n"] for c in curves])
+    rate = k / n
+    tpr = np.array([c["cum_good"][kk] / c["n_good"] if c["n_good"] else np.nan
+                    for c, kk in zip(curves, k)])
+    exp_good = np.array([c["cum_exp_good"][kk] for c, kk in zip(curves, k)])
+    exp_bad = np.array([c["cum_exp_bad"][kk] for c, kk in zip(curves, k)])
+    return rate, tpr, exp_good, exp_bad
+
+def _search(curves, all_scores, target_approval, objective, min_dir, tpr_tol, approval_tol, grid):
+    """Best feasible k per group for one DIR floor (None when infeasible)."""
+    N = sum(c["n"] for c in curves)
+    K_lo = int(np.ceil(max(target_approval - approval_tol, 0.0) * N))
+    K_hi = int(np.floor(min(target_approval + approval_tol, 1.0) * N))
+    lo, hi = _bounds(curves, min_dir, tpr_tol, grid)
+    lo, hi = lo.reshape(-1, len(curves)), hi.reshape(-1, len(curves))
+    s_lo, s_hi = lo.sum(axis=1), hi.sum(axis=1)
+    ok = (lo <= hi).all(axis=1) & (s_lo <= K_hi) & (s_hi >= K_lo)
+    if not ok.any():
+        return None, 0
+
+    # Within a candidate both objectives rank rows the same way, so they
+    # differ only in where they land inside the approval band.
+    if objective == "good_approvals":
+        K = np.minimum(s_hi, K_hi)
+    else:
+        K = np.maximum(s_lo, K_lo)
+    cand = np.unique(np.column_stack([lo, hi, K])[ok], axis=0)
+
+    best, best_key = None, None
+    for row in cand:
+        g = len(curves)
+        k = _allocate(curves, all_scores, row[:g], row[g:2 * g], int(row[-1]))
+        rate, tpr, exp_good, exp_bad = _evaluate(curves, k)
+        value = exp_good.sum() if objective == "good_approvals" else -exp_bad.sum()
+        dir_ = rate.min() / rate.max() if rate.max() > 0 else np.nan
+        tpr_range = np.nanmax(tpr) - np.nanmin(tpr) if np.isfinite(tpr).any() else 0.0
+        key = (round(value, 9), dir_, -tpr_range)
+        if best_key is None or key > best_key:
+            best, best_key = k, key
+    return best, len(cand)
+
+def optimize_group_cutoffs(df, y_true, y_score, group_col, target_approval=0.40,
+                           objective="good_approvals", min_dir=0.80, tpr_tol=0.10,
+                           approval_tol=0.01, grid=50, frontier=(0.80, 0.85, 0.90, 0.95)):
+    """
+    Group-specific cutoffs that maximise expected good approvals (sum of
+    1 - pd over approved rows) or minimise expected defaults (sum of pd),
+    subject to DIR_min_over_max >= min_dir, TPR_good range <= tpr_tol and an
+    overall approval rate of target_approval ± approval_tol.
+
+    Each group is sorted once and kept as cumulative arrays (O(n log n)).
+    The DIR and TPR constraints are range constraints, so anchoring the lowest
+    approval rate and the lowest TPR on a grid turns them into per-group
+    [lo, hi] bounds on the number of approvals. The best split of the
+    approvals inside those bounds is a clipped common score threshold. The
+    search is O(grid^2 x groups x log^2 n) and does not touch the rows again.
+
+    Returns (per, summary, frontier): per-group stats in the layout of
+    simple_fairness plus cutoffs, a summary, and the best objective value at
+    each DIR floor in `frontier`.
+    """
+    if objective not in OBJECTIVES:
+        raise ValueError(f"unknown objective '{objective}' ({' | '.join(OBJECTIVES)})")
+    d = df[[y_true, y_score, group_col]].dropna()
+    curves = _group_curves(d, y_true, y_score, group_col)
+    all_scores = np.sort(d[y_score].to_numpy(dtype=float))
+
+    def run(floor):
+        return _search(curves, all_scores, target_approval, objective, floor,
+                       tpr_tol, approval_tol, grid)
+
+    fr_rows = []
+    for floor in sorted(set(frontier or ()) | {min_dir}):
+        k, n_cand = run(floor)
+        row = {"min_dir": floor, "feasible": k is not None, "n_candidates": n_cand}
+        if k is not None:
+            rate, tpr, exp_good, exp_bad = _evaluate(curves, k)
+            row.update({
+                "approve_rate": k.sum() / len(d),
+                "DIR_min_over_max": rate.min() / rate.max() if rate.max() > 0 else np.nan,
+                "TPR_good_range": np.nanmax(tpr) - np.nanmin(tpr) if np.isfinite(tpr).any() else np.nan,
+                "expected_good_approvals": exp_good.sum(),
+                "expected_defaults": exp_bad.sum(),
+            })
+        if floor == min_dir:
+            best, n_best = k, n_cand
+        fr_rows.append(row)
+    frontier_df = pd.DataFrame(fr_rows)
+
+    summary = {
+        "used_cutoffs": "optimized",
+        "objective": objective,
+        "min_dir": min_dir,
+        "tpr_tol": tpr_tol,
+        "target_approval": target_approval,
+        "feasible": best is not None,
+        "n_candidates": n_best,
+    }
+    if best is None:
+        summary.update({"DIR_min_over_max": np.nan, "TPR_good_range": np.nan, "pass_80_rule": False})
+        return pd.DataFrame(columns=["group", "n", "cutoff", "approve_rate", "TPR_good",
+                                     "DIR_vs_majority"]), summary, frontier_df
+
+    rate, tpr, exp_good, exp_bad = _evaluate(curves, best)
+    per = pd.DataFrame({
+        "group": [c["group"] for c in curves],
+        "n": [c["n"] for c in curves],
+        # approve score <= cutoff (ties at the cutoff are broken by rank)
+        "cutoff": [c["scores"][kk - 1] if kk else np.nan for c, kk in zip(curves, best)],
+        "approve_rate": rate,
+        "TPR_good": tpr,
+        "expected_good_approvals": exp_good,
+        "expected_defaults": exp_bad,
+    }).sort_values("n", ascending=False).reset_index(drop=True)
+    base = per.loc[per["n"].idxmax(), "approve_rate"]
+    per["DIR_vs_majority"] = per["approve_rate"] / base if base > 0 else np.nan
+
+    dir_min_over_max = rate.min() / rate.max() if rate.max() > 0 else np.nan
+    summary.update({
+        "approve_rate": float(best.sum() / len(d)),
+        "DIR_min_over_max": float(dir_min_over_max),
+        "TPR_good_range": float(np.nanmax(tpr) - np.nanmin(tpr)) if np.isfinite(tpr).any() else np.nan,
+        "pass_80_rule": bool(dir_min_over_max >= 0.8),
+        "expected_good_approvals": float(exp_good.sum()),
+        "expected_defaults": float(exp_bad.sum()),
+    })
+    return per, summary, frontier_df
+
+# ---------- Streaming Fairness (score sketches) ----------
+SKETCH_BINS = 16384
+
+class FairnessSketch:
+    """
+    Mergeable per-group sketch of good / bad score counts on fixed edges.
+
+    pd scores are bounded, so equal-width bins over [lo, hi] serve as both
+    the quantile sketch and the good/bad histograms: one (2, bins) int64
+    array per group, 256 KB at the default 16384 bins, whatever the number
+    of rows. Chunks and partitions merge by adding counts, so the result
+    does not depend on how the data was split.
+
+    Error bound: cutoffs are placed on bin edges, and every count at an edge
+    is exact. A cutoff is within one bin width (hi - lo) / bins of the exact
+    quantile. Each group's approval rate differs from the exact-quantile
+    policy by at most the share of that group's rows inside the bin holding
+    the exact quantile. That share is reported as max_approve_rate_error.
+    Scores outside [lo, hi] are clamped to the first / last bin.
+    """
+
+    def __init__(self, bins=SKETCH_BINS, lo=0.0, hi=1.0):
+        self.bins, self.lo, self.hi = int(bins), float(lo), float(hi)
+        self.counts = {}     # group -> (2, bins): row 0 good (y == 0), row 1 bad
+
+    def update(self, df, y_true, y_score, group_col):
+        d = df[[y_true, y_score, group_col]].dropna()
+        if d.empty:
+            return self
+        s = d[y_score].to_numpy(dtype=float)
+        b = np.clip(((s - self.lo) / (self.hi - self.lo) * self.bins).astype(np.int64), 0, self.bins - 1)
+        bad = (d[y_true].to_numpy() != 0).astype(np.int64)
+        codes, groups = pd.factorize(d[group_col])
+        flat = np.bincount((codes * 2 + bad) * self.bins + b, minlength=len(groups) * 2 * self.bins)
+        for g, c in zip(groups, flat.reshape(len(groups), 2, self.bins)):
+            if g in self.counts:
+                self.counts[g] += c
+            else:
+                self.counts[g] = c.copy()
+        return self
+
+    def merge(self, other):
+        if (other.bins, other.lo, other.hi) != (self.bins, self.lo, self.hi):
+            raise ValueError("cannot merge sketches with different bin edges")
+        for g, c in other.counts.items():
+            self.counts[g] = self.counts[g] + c if g in self.counts else c.copy()
+        return self
+
+    @property
+    def n(self):
+        return int(sum(c.sum() for c in self.counts.values()))
+
+    @property
+    def nbytes(self):
+        return int(sum(c.nbytes for c in self.counts.values()))
+
+    def edges(self):
+        return np.linspace(self.lo, self.hi, self.bins + 1)
+
+    def cutoff_bin(self, hist, q):
+        """
+        Bin j whose upper edge is the cutoff (approve bins <= j) closest to
+        a q share of `hist`, plus the bin holding the exact quantile.
+        """
+        cum = np.cumsum(hist)
+        target = q * cum[-1]
+        j = int(np.searchsorted(cum, target, side="left"))
+        j = min(j, self.bins - 1)
+        if j > 0 and target - cum[j - 1] < cum[j] - target:
+            return j - 1, j
+        return j, j
+
+
+def sketch_frame(df, y_true, y_score, group_col, bins=SKETCH_BINS, chunk_size=1_000_000):
+    sk = FairnessSketch(bins)
+    for start in range(0, len(df), chunk_size):
+        sk.update(df.iloc[start:start + chunk_size], y_true, y_score, group_col)
+    return sk
+
+def sketch_file(path, y_true, y_score, group_col, bins=SKETCH_BINS, chunk_size=1_000_000):
+    """Stream a CSV / Parquet decision file chunk by chunk."""
+    from .scoring_engine import iter_chunks
+    sk = FairnessSketch(bins)
+    for chunk in iter_chunks(path, chunk_size):
+        sk.update(chunk, y_true, y_score, group_col)
+    return sk
+
+def sketch_fairness(sketch, target_approval=0.40, policy="global"):
+    """
+    simple_fairness (policy="global") or group_cutoff_fairness
+    (policy="group") computed from a FairnessSketch. Returns (per, summary)
+    in the same layout, plus the bound on the approval-rate error.
+    """
+    if not sketch.counts:
+        raise ValueError("empty fairness sketch")
+    groups = list(sketch.counts)
+    hists = np.stack([sketch.counts[g] for g in groups])       # (G, 2, bins)
+    total = hists.sum(axis=1)                                   # (G, bins)
+    edges = sketch.edges()
+
+    if policy == "global":
+        j, j_exact = sketch.cutoff_bin(total.sum(axis=0), target_approval)
+        cut_bins = np.full(len(groups), j)
+        exact_bins = np.full(len(groups), j_exact)
+    elif policy == "group":
+        cut_bins, exact_bins = map(np.array, zip(*(sketch.cutoff_bin(t, target_approval) for t in total)))
+    else:
+        raise ValueError(f"unknown policy '{policy}' (global | group)")
+
+    idx = np.arange(len(groups))
+    cum = np.cumsum(hists, axis=2)                              # (G, 2, bins)
+    n = total.sum(axis=1)
+    n_good = hists[:, 0].sum(axis=1)
+    approved = cum[idx, 0, cut_bins] + cum[idx, 1, cut_bins]
+    good_approved = cum[idx, 0, cut_bins]
+
+    per = pd.DataFrame({
+        "group": groups,
+        "n": n,
+        "approve_rate": approved / n,
+        "TPR_good": np.where(n_good > 0, good_approved / np.maximum(n_good, 1), np.nan),
+    }).sort_values("n", ascending=False).reset_index(drop=True)
+    base = per.loc[per["n"].idxmax(), "approve_rate"]
+    per["DIR_vs_majority"] = per["approve_rate"] / base if base > 0 else np.nan
+
+    dir_min_over_max = per["approve_rate"].min() / per["approve_rate"].max()
+    tpr_range = (
+        (per["TPR_good"].max() - per["TPR_good"].min())
+        if per["TPR_good"].notna().any()
+        else np.nan
+    )
+    summary = {
+        "DIR_min_over_max": float(dir_min_over_max),
+        "TPR_good_range": float(tpr_range) if pd.notna(tpr_range) else np.nan,
+        "pass_80_rule": bool(dir_min_over_max >= 0.8),
+        "n_rows": int(n.sum()),
+        "sketch_bins": sketch.bins,
+        "sketch_bytes": sketch.nbytes,
+        "max_approve_rate_error": float((total[idx, exact_bins] / n).max()),
+    }
+    if policy == "global":
+        summary["used_cutoff"] = float(edges[cut_bins[0] + 1])
+    else:
+        summary["used_cutoffs"] = "group-specific"
+        summary["group_cutoffs"] = {g: float(edges[b + 1]) for g, b in zip(groups, cut_bins)}
+    return per, summary
+
+
+def main():
+    import argparse, json
+    ap = argparse.ArgumentParser(description="Streaming fairness audit of a large decision file")
+    ap.add_argument("--csv", default=FAIRNESS_PATH, help="decisions (CSV or Parquet), read in chunks")
+    ap.add_argument("--group_col", default="income_group_auth")
+    ap.add_argument("--y_col", default="loan_status")
+    ap.add_argument("--p_col", default="pd_score")
+    ap.add_argument("--target_approval", type=float, default=0.40)
+    ap.add_argument("--bins", type=int, default=SKETCH_BINS)
+    ap.add_argument("--chunk_size", type=int, default=1_000_000)
+    args = ap.parse_args()
+
+    sk = sketch_file(args.csv, args.y_col, args.p_col, args.group_col, args.bins, args.chunk_size)
+    for policy in ("global", "group"):
+        per, summ = sketch_fairness(sk, args.target_approval, policy)
+        print(f"== {policy} cutoff ==")
+        print(per.to_string(index=False))
+        print(json.dumps(summ, indent=2, default=float))
+
+
+if __name__ == "__main__":
+    main()
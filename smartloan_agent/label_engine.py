@@ -0,0 +1,415 @@
+"""
+Delayed-label performance engine.
+
+Defaults (`label`) arrive months after the `score`. At scoring time each
+batch is snapshotted into a small SQLite store:
+
+    snapshots  key (64-bit hash of the application id), batch_id, score, bin,
+               label (NULL until the outcome arrives); primary key (key, batch_id),
+               so an id re-scored in a later batch is snapshotted in both
+    hist       per (batch_id, score bin): n, n_lab, n_bad, sum_p, sum_p2, sum_p_bad
+    batches    batch_time, model_version, n_rows + the latest matured metrics
+
+A label-ingest run hashes the incoming ids, joins them to `snapshots` on
+the key prefix of the primary key (every batch that scored the id), and
+applies per-bin deltas to `hist` for the touched batches only. AUC / KS / Brier / calibration are then recomputed from the
+batch histogram (O(score_bins), no rescan of old rows) and written back
+to the matching rows of batch_metrics_log.csv as *_matured columns.
+
+    python -m smartloan_agent.label_engine --snapshot monitor/X_new.csv --batch_time "2025-01-31 09:00:00"
+    python -m smartloan_agent.label_engine --ingest labels.csv
+"""
+import os, csv, sqlite3, threading, argparse
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import yaml
+from scipy.stats import chi2
+
+CFG_PATH = "monitor/config.yaml"
+DEFAULT_STORE_PATH = "monitor/cache/label_store.sqlite"
+BATCH_LOG = "monitor/batch_metrics_log.csv"
+INGEST_CHUNK = 100_000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS batches (
+    batch_id INTEGER PRIMARY KEY,
+    batch_time TEXT UNIQUE NOT NULL,
+    model_version TEXT,
+    n_rows INTEGER NOT NULL,
+    n_labelled INTEGER NOT NULL DEFAULT 0,
+    auc REAL, ks REAL, brier REAL, calib_gap REAL, hl_pvalue REAL, default_rate REAL,
+    updated TEXT
+);
+CREATE TABLE IF NOT EXISTS snapshots (
+    key INTEGER NOT NULL,         -- 64-bit hash of the application id
+    batch_id INTEGER NOT NULL,
+    score REAL NOT NULL,
+    bin INTEGER NOT NULL,
+    label INTEGER,                -- NULL until the outcome arrives
+    PRIMARY KEY (key, batch_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS hist (
+    batch_id INTEGER NOT NULL,
+    bin INTEGER NOT NULL,
+    n INTEGER NOT NULL,
+    n_lab INTEGER NOT NULL DEFAULT 0,
+    n_bad INTEGER NOT NULL DEFAULT 0,
+    sum_p REAL NOT NULL DEFAULT 0,
+    sum_p2 REAL NOT NULL DEFAULT 0,
+    sum_p_bad REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (batch_id, bin)
+) WITHOUT ROWID;
+"""
+
+
+def load_label_config(cfg_path=CFG_PATH):
+    """`delayed_labels:` section of config.yaml with defaults."""
+    cfg = {}
+    if os.path.exists(cfg_path):
+        with open(cfg_path, "r", encoding="utf-8") as f:
+            cfg = yaml.safe_load(f) or {}
+    labels = cfg.get("labels") or {}
+    out = {
+        "enabled": False,
+        "path": DEFAULT_STORE_PATH,
+        "id_col": "id",
+        "score_bins": 1000,
+        "labels_csv": "monitor/labels_incoming.csv",
+        "label_col": labels.get("y_col", "label"),
+        "batch_log": BATCH_LOG,
+    }
+    out.update(cfg.get("delayed_labels") or {})
+    out["p_col"] = labels.get("p_col", "score")
+    return out
+
+def id_keys(ids):
+    """Application ids -> signed 64-bit hash keys (SQLite INTEGER PRIMARY KEY)."""
+    ids = np.asarray(ids).astype(str).astype(object)
+    return pd.util.hash_array(ids).view(np.int64)
+
+
+# ---------- Metrics from a score histogram ----------
+def binned_metrics(h, n_groups=10):
+    """
+    Matured metrics of one batch from its per-bin arrays (ascending bins):
+    n, n_lab, n_bad, sum_p, sum_p2, sum_p_bad. Ties inside a bin are treated
+    like tied scores (trapezoid), so AUC / KS are exact up to bin width.
+    """
+    n_lab, n_bad = h["n_lab"].sum(), h["n_bad"].sum()
+    out = {"n_rows": int(h["n"].sum()), "n_labelled": int(n_lab), "label_coverage": None,
+           "auc": None, "ks": None, "brier": None, "calib_gap": None,
+           "hl_pvalue": None, "default_rate": None}
+    if out["n_rows"]:
+        out["label_coverage"] = float(n_lab / out["n_rows"])
+    if n_lab == 0:
+        return out
+
+    sum_p, sum_p2, sum_p_bad = h["sum_p"].sum(), h["sum_p2"].sum(), h["sum_p_bad"].sum()
+    out["default_rate"] = float(n_bad / n_lab)
+    out["calib_gap"] = float(sum_p / n_lab - n_bad / n_lab)
+    out["brier"] = float((sum_p2 - 2.0 * sum_p_bad + n_bad) / n_lab)
+
+    good = h["n_lab"] - h["n_bad"]
+    n_good = good.sum()
+    if n_bad > 0 and n_good > 0:
+        tpr = np.r_[0.0, np.cumsum(h["n_bad"]) / n_bad]
+        fpr = np.r_[0.0, np.cumsum(good) / n_good]
+        out["ks"] = float(np.max(np.abs(tpr - fpr)))
+        out["auc"] = float(1.0 - np.sum(np.diff(fpr) * (tpr[1:] + tpr[:-1]) / 2.0))
+
+    # Hosmer-Lemeshow on ~equal-count groups of whole bins
+    cum = np.cumsum(h["n_lab"])
+    grp = np.minimum((cum - 1) * n_groups // max(n_lab, 1), n_groups - 1)
+    grp = grp[h["n_lab"] > 0]
+    obs = np.bincount(grp, weights=h["n_bad"][h["n_lab"] > 0])
+    exp = np.bincount(grp, weights=h["sum_p"][h["n_lab"] > 0])
+    cnt = np.bincount(grp, weights=h["n_lab"][h["n_lab"] > 0])
+    ok = (cnt > 0) & (exp > 0) & (exp < cnt)
+    if ok.sum() > 2:
+        stat = np.sum((obs[ok] - exp[ok]) ** 2 / (exp[ok] * (1 - exp[ok] / cnt[ok])))
+        out["hl_pvalue"] = float(chi2.sf(stat, ok.sum() - 2))
+    return out
+
+
+class LabelStore:
+    """
+    Scoring-time snapshots + incremental matured performance.
+    Thread-safe (one connection guarded by a lock); safe to share per process.
+    """
+
+    def __init__(self, path=DEFAULT_STORE_PATH, score_bins=1000):
+        self.path = path
+        self.score_bins = int(score_bins)
+        self._lock = threading.RLock()
+        if path != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._migrate_snapshots()
+        self._conn.executescript(SCHEMA)
+
+    def _migrate_snapshots(self):
+        """Stores keyed on the id hash alone are re-keyed on (key, batch_id)."""
+        row = self._conn.execute("SELECT sql FROM sqlite_master WHERE name = 'snapshots'").fetchone()
+        if not row or "PRIMARY KEY (key, batch_id)" in row[0]:
+            return
+        with self._conn:
+            self._conn.execute("ALTER TABLE snapshots RENAME TO snapshots_old")
+            self._conn.executescript(SCHEMA)
+            self._conn.execute(
+                "INSERT INTO snapshots (key, batch_id, score, bin, label) "
+                "SELECT key, batch_id, score, bin, label FROM snapshots_old"
+            )
+            self._conn.execute("DROP TABLE snapshots_old")
+        print(f"[OK] label store {self.path}: snapshots re-keyed on (id hash, batch_id)")
+
+    @classmethod
+    def from_config(cls, cfg_path=CFG_PATH):
+        cfg = load_label_config(cfg_path)
+        return cls(path=cfg["path"], score_bins=cfg["score_bins"])
+
+    def score_bin(self, p):
+        return np.clip((np.asarray(p, dtype=float) * self.score_bins).astype(np.int64),
+                       0, self.score_bins - 1)
+
+    # ---------- Snapshots ----------
+    def snapshot(self, ids, scores, batch_time, model_version=None):
+        """
+        Store (id hash, score, bin) for one scored batch; returns its batch_id.
+        An id already snapshotted in an earlier batch keeps that snapshot too.
+        """
+        scores = np.asarray(scores, dtype=float)
+        keep = ~np.isnan(scores)
+        keys, scores = id_keys(ids)[keep], scores[keep]
+        if len(np.unique(keys)) != len(keys):
+            raise ValueError("duplicate application ids in batch snapshot")
+        bins = self.score_bin(scores)
+
+        n = np.bincount(bins, minlength=self.score_bins)
+        hist = [(int(b), int(n[b])) for b in np.flatnonzero(n)]
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                "INSERT INTO batches (batch_time, model_version, n_rows, updated) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(batch_time) DO UPDATE SET model_version = excluded.model_version "
+                "RETURNING batch_id",
+                (str(batch_time), model_version, int(len(keys)), _now()),
+            )
+            batch_id = cur.fetchone()[0]
+            if self._conn.execute("SELECT 1 FROM hist WHERE batch_id = ? LIMIT 1", (batch_id,)).fetchone():
+                raise ValueError(f"batch '{batch_time}' already snapshotted")
+            self._conn.executemany(
+                "INSERT INTO snapshots (key, batch_id, score, bin, label) VALUES (?, ?, ?, ?, NULL)",
+                zip(keys.tolist(), [batch_id] * len(keys), scores.tolist(), bins.tolist()),
+            )
+            self._conn.executemany(
+                "INSERT INTO hist (batch_id, bin, n) VALUES (?, ?, ?)",
+                [(batch_id, b, c) for b, c in hist],
+            )
+        return batch_id
+
+    # ---------- Label ingest ----------
+    def ingest(self, ids, labels):
+        """
+        Join outcomes to snapshots by id hash and update the touched batches;
+        an id scored in several batches updates each of them. Re-delivered
+        labels are idempotent; changed labels are corrected.
+        Returns {matched, new, corrected, batches: {batch_time: metrics}}
+        (counts are per snapshot row).
+        """
+        keys = id_keys(ids)
+        labels = pd.to_numeric(pd.Series(labels), errors="coerce").to_numpy()
+        ok = ~np.isnan(labels)
+        keys, labels = keys[ok], labels[ok].astype(np.int64)
+
+        stats = {"matched": 0, "new": 0, "corrected": 0}
+        touched = set()
+        with self._lock, self._conn:
+            self._conn.execute("CREATE TEMP TABLE IF NOT EXISTS incoming (key INTEGER PRIMARY KEY, label INTEGER)")
+            for i in range(0, len(keys), INGEST_CHUNK):
+                self._conn.execute("DELETE FROM incoming")
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO incoming (key, label) VALUES (?, ?)",
+                    zip(keys[i:i + INGEST_CHUNK].tolist(), labels[i:i + INGEST_CHUNK].tolist()),
+                )
+                rows = self._conn.execute(
+                    "SELECT s.batch_id, s.bin, s.score, s.label, i.label FROM incoming i "
+                    "JOIN snapshots s ON s.key = i.key "
+                    "WHERE s.label IS NULL OR s.label != i.label"
+                ).fetchall()
+                stats["matched"] += self._conn.execute(
+                    "SELECT COUNT(*) FROM incoming i JOIN snapshots s ON s.key = i.key"
+                ).fetchone()[0]
+                if not rows:
+                    continue
+                self._apply_deltas(pd.DataFrame(rows, columns=["batch_id", "bin", "p", "old", "new"]), stats)
+                self._conn.execute(
+                    "UPDATE snapshots SET label = i.label FROM incoming i "
+                    "WHERE snapshots.key = i.key AND (snapshots.label IS NULL OR snapshots.label != i.label)"
+                )
+                touched.update(int(b) for b in {r[0] for r in rows})
+
+            stats["batches"] = {}
+            for batch_id in sorted(touched):
+                batch_time, metrics = self._refresh(batch_id)
+                stats["batches"][batch_time] = metrics
+        return stats
+
+    def _apply_deltas(self, d, stats):
+        """Per-bin count / sum deltas for newly labelled and corrected rows."""
+        was = d["old"].notna()
+        stats["new"] += int((~was).sum())
+        stats["corrected"] += int(was.sum())
+        old_bad = d["old"].fillna(0).to_numpy()
+        new_bad = d["new"].to_numpy()
+        p = d["p"].to_numpy()
+        delta = pd.DataFrame({
+            "batch_id": d["batch_id"], "bin": d["bin"],
+            "n_lab": (~was).astype(int),
+            "n_bad": new_bad - old_bad,
+            "sum_p": np.where(was, 0.0, p),
+            "sum_p2": np.where(was, 0.0, p * p),
+            "sum_p_bad": (new_bad - old_bad) * p,
+        }).groupby(["batch_id", "bin"], as_index=False).sum()
+        self._conn.executemany(
+            "UPDATE hist SET n_lab = n_lab + ?, n_bad = n_bad + ?, sum_p = sum_p + ?, "
+            "sum_p2 = sum_p2 + ?, sum_p_bad = sum_p_bad + ? WHERE batch_id = ? AND bin = ?",
+            [(int(r.n_lab), int(r.n_bad), float(r.sum_p), float(r.sum_p2), float(r.sum_p_bad),
+              int(r.batch_id), int(r.bin)) for r in delta.itertuples(index=False)],
+        )
+
+    def _refresh(self, batch_id):
+        h = pd.read_sql_query(
+            "SELECT n, n_lab, n_bad, sum_p, sum_p2, sum_p_bad FROM hist WHERE batch_id = ? ORDER BY bin",
+            self._conn, params=(batch_id,),
+        )
+        m = binned_metrics({c: h[c].to_numpy() for c in h.columns})
+        self._conn.execute(
+            "UPDATE batches SET n_labelled = ?, auc = ?, ks = ?, brier = ?, calib_gap = ?, "
+            "hl_pvalue = ?, default_rate = ?, updated = ? WHERE batch_id = ?",
+            (m["n_labelled"], m["auc"], m["ks"], m["brier"], m["calib_gap"],
+             m["hl_pvalue"], m["default_rate"], _now(), batch_id),
+        )
+        batch_time = self._conn.execute(
+            "SELECT batch_time FROM batches WHERE batch_id = ?", (batch_id,)
+        ).fetchone()[0]
+        return batch_time, m
+
+    # ---------- Queries ----------
+    def batch_metrics(self):
+        """Matured metrics of every snapshotted batch (newest first)."""
+        with self._lock:
+            df = pd.read_sql_query(
+                "SELECT batch_time, model_version, n_rows, n_labelled, auc, ks, brier, "
+                "calib_gap, hl_pvalue, default_rate, updated FROM batches ORDER BY batch_time DESC",
+                self._conn,
+            )
+        df["label_coverage"] = df["n_labelled"] / df["n_rows"].where(df["n_rows"] > 0)
+        return df
+
+
+def _now():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+# ---------- Batch log backfill ----------
+MATURED_COLS = {
+    "auc": "auc_matured", "ks": "ks_matured", "brier": "brier_matured",
+    "calib_gap": "calib_gap_matured", "hl_pvalue": "hl_pvalue_matured",
+    "label_coverage": "label_coverage",
+}
+
+def backfill_batch_log(batch_metrics, csv_path=BATCH_LOG):
+    """
+    Write matured metrics into the rows of batch_metrics_log.csv with the
+    same batch_time (adds the *_matured columns on first use).
+    Returns the number of rows updated.
+    """
+    if not batch_metrics or not os.path.exists(csv_path):
+        return 0
+    log = pd.read_csv(csv_path, encoding="utf-8-sig", dtype=str, keep_default_na=False)
+    if "batch_time" not in log.columns:
+        return 0
+    for col in list(MATURED_COLS.values()) + ["labels_updated"]:
+        if col not in log.columns:
+            log[col] = ""
+    updated = 0
+    for batch_time, m in batch_metrics.items():
+        rows = log["batch_time"] == str(batch_time)
+        if not rows.any():
+            continue
+        for src, dst in MATURED_COLS.items():
+            v = m.get(src)
+            log.loc[rows, dst] = "" if v is None else repr(float(v))
+        log.loc[rows, "labels_updated"] = _now()
+        updated += int(rows.sum())
+    tmp = csv_path + ".tmp"
+    log.to_csv(tmp, index=False, encoding="utf-8-sig", quoting=csv.QUOTE_ALL, lineterminator="\n")
+    os.replace(tmp, csv_path)
+    return updated
+
+
+_shared, _shared_lock = None, threading.Lock()
+
+def get_label_store(cfg_path=CFG_PATH):
+    """Process-wide label store."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = LabelStore.from_config(cfg_path)
+        return _shared
+
+def batch_ids(df, batch_time, id_col="id"):
+    """Application ids; `<batch_time>#<row>` when the batch has no id column."""
+    if id_col and id_col in df.columns:
+        return df[id_col].astype(str).to_numpy()
+    print(f"[WARN] no '{id_col}' column; snapshot keyed by batch_time#row")
+    return np.char.add(f"{batch_time}#", np.arange(len(df)).astype(str))
+
+def snapshot_batch(df, batch_time, model_version=None, p_col=None, cfg_path=CFG_PATH):
+    """Scoring-time snapshot of one batch frame (score column: p_col or labels.p_col)."""
+    cfg = load_label_config(cfg_path)
+    p_col = p_col or cfg["p_col"]
+    if p_col not in df.columns:
+        print(f"[WARN] label snapshot skipped: no '{p_col}' column")
+        return None
+    ids = batch_ids(df, batch_time, cfg["id_col"])
+    return get_label_store(cfg_path).snapshot(ids, df[p_col], batch_time, model_version)
+
+def ingest_labels(csv_path=None, cfg_path=CFG_PATH):
+    """Ingest an outcomes file (id_col, label_col) and backfill the batch log."""
+    cfg = load_label_config(cfg_path)
+    csv_path = csv_path or cfg["labels_csv"]
+    df = pd.read_csv(csv_path, usecols=[cfg["id_col"], cfg["label_col"]], dtype={cfg["id_col"]: str})
+    stats = get_label_store(cfg_path).ingest(df[cfg["id_col"]], df[cfg["label_col"]])
+    stats["backfilled_rows"] = backfill_batch_log(stats["batches"], cfg["batch_log"])
+    print(f"[OK] labels: {len(df):,} read, {stats['matched']:,} matched, {stats['new']:,} new, "
+          f"{stats['corrected']:,} corrected; {len(stats['batches'])} batch(es) updated, "
+          f"{stats['backfilled_rows']} log row(s) backfilled")
+    return stats
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--snapshot", default=None, help="scored batch CSV to snapshot")
+    ap.add_argument("--batch_time", default=None, help="batch_time of the snapshot (default: now)")
+    ap.add_argument("--model_version", default=None)
+    ap.add_argument("--ingest", default=None, help="outcomes CSV (default: delayed_labels.labels_csv)",
+                    nargs="?", const="")
+    ap.add_argument("--show", action="store_true", help="print matured metrics per batch")
+    args = ap.parse_args()
+
+    if args.snapshot:
+        batch_time = args.batch_time or _now()
+        batch_id = snapshot_batch(pd.read_csv(args.snapshot), batch_time, args.model_version)
+        print(f"[OK] snapshot of {args.snapshot} as batch {batch_id} ({batch_time})")
+    if args.ingest is not None:
+        ingest_labels(args.ingest or None)
+    if args.show or not (args.snapshot or args.ingest is not None):
+        print(get_label_store().batch_metrics().to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+"""
+LLM summary cache + async multi-style generation.
+
+- Content-hash cache keyed on (model, prompt, normalised metrics, temperature)
+- Persistent SQLite storage with TTL + LRU eviction
+- asyncio client that generates several prompt styles concurrently
+  (per-request timeout, bounded concurrency)
+
+Works against any chat-completions compatible endpoint; point `base_url`
+(or OPENAI_BASE_URL) at `llm_stub_server.StubChatServer` to run offline.
+"""
+import os, json, math, time, hashlib, sqlite3, asyncio, threading
+from contextlib import closing, contextmanager
+from pathlib import Path
+
+import yaml
+
+CFG_PATH = "monitor/config.yaml"
+DEFAULT_MODEL = "gpt-4o-mini"
+DEFAULT_TEMPERATURE = 0.2
+DEFAULT_CACHE_PATH = "monitor/cache/llm_summary_cache.sqlite"
+
+# Keys that change on every run but do not change the meaning of the metrics
+VOLATILE_KEYS = ("batch_time", "timestamp")
+
+
+# ---------- Helper Functions ----------
+def load_llm_config(cfg_path=CFG_PATH):
+    """Read the `llm:` section of config.yaml (empty dict if missing)."""
+    if not os.path.exists(cfg_path):
+        return {}
+    with open(cfg_path, "r", encoding="utf-8") as f:
+        cfg = yaml.safe_load(f) or {}
+    return cfg.get("llm") or {}
+
+def _normalize_value(v, ndigits):
+    """Make a single value JSON-stable: NaN/Inf -> None, floats rounded."""
+    if v is None:
+        return None
+    if hasattr(v, "item") and not isinstance(v, (str, bytes)):
+        try:
+            v = v.item()  # numpy scalar -> python
+        except Exception:
+            pass
+    if isinstance(v, bool):
+        return v
+    if isinstance(v, float):
+        if math.isnan(v) or math.isinf(v):
+            return None
+        return round(v, ndigits)
+    if isinstance(v, dict):
+        return {str(k): _normalize_value(x, ndigits) for k, x in v.items()}
+    if isinstance(v, (list, tuple)):
+        return [_normalize_value(x, ndigits) for x in v]
+    if isinstance(v, (int, str)):
+        return v
+    return str(v)
+
+def normalize_metrics(metrics, ndigits=6, drop_keys=VOLATILE_KEYS):
+    """
+    Normalise a metrics row so that equivalent rows hash identically.
+    Drops volatile keys, rounds floats and maps NaN/Inf to None.
+    """
+    return {
+        str(k): _normalize_value(v, ndigits)
+        for k, v in dict(metrics).items()
+        if k not in drop_keys
+    }
+
+def metrics_payload(metrics):
+    """Canonical JSON payload sent to the LLM (sorted keys, no volatile fields)."""
+    return json.dumps(normalize_metrics(metrics), sort_keys=True, ensure_ascii=False)
+
+def cache_key(model, prompt, payload, temperature):
+    """SHA-256 over everything that determines the LLM output."""
+    raw = json.dumps(
+        {"model": model, "prompt": prompt.strip(), "payload": payload,
+         "temperature": round(float(temperature), 4)},
+        sort_keys=True, ensure_ascii=False,
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+# ---------- Persistent Cache ----------
+class LLMSummaryCache:
+    """
+    SQLite-backed summary cache.
+    Entries expire after `ttl_days`; beyond `max_entries` the least recently
+    used rows are evicted.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=500, ttl_days=30):
+        self.path = str(path)
+        self.max_entries = int(max_entries)
+        self.ttl_s = float(ttl_days) * 86400 if ttl_days else None
+        self._lock = threading.Lock()
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as con:
+            con.execute(
+                "CREATE TABLE IF NOT EXISTS summaries ("
+                " key TEXT PRIMARY KEY, model TEXT, text TEXT NOT NULL,"
+                " created REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            con.execute("CREATE INDEX IF NOT EXISTS ix_last_used ON summaries(last_used)")
+
+    @classmethod
+    def from_config(cls, cfg_path=CFG_PATH):
+        c = load_llm_config(cfg_path)
+        return cls(
+            path=c.get("cache_path", DEFAULT_CACHE_PATH),
+            max_entries=c.get("cache_max_entries", 500),
+            ttl_days=c.get("cache_ttl_days", 30),
+        )
+
+    @contextmanager
+    def _connect(self):
+        """One connection per operation: committed on success, always closed."""
+        with closing(sqlite3.connect(self.path, timeout=5)) as con, con:
+            yield con
+
+    def get(self, key):
+        """Return cached text or None (expired entries count as misses)."""
+        now = time.time()
+        with self._lock, self._connect() as con:
+            row = con.execute(
+                "SELECT text, created FROM summaries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            text, created = row
+            if self.ttl_s is not None and now - created > self.ttl_s:
+                con.execute("DELETE FROM summaries WHERE key = ?", (key,))
+                return None
+            con.execute("UPDATE summaries SET last_used = ? WHERE key = ?", (now, key))
+            return text
+
+    def put(self, key, text, model=None):
+        now = time.time()
+        with self._lock, self._connect() as con:
+            con.execute(
+                "INSERT OR REPLACE INTO summaries (key, model, text, created, last_used)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (key, model, text, now, now),
+            )
+            self._evict(con, now)
+
+    def _evict(self, con, now):
+        if self.ttl_s is not None:
+            con.execute("DELETE FROM summaries WHERE created < ?", (now - self.ttl_s,))
+        (n,) = con.execute("SELECT COUNT(*) FROM summaries").fetchone()
+        if n > self.max_entries:
+            con.execute(
+                "DELETE FROM summaries WHERE key IN ("
+                " SELECT key FROM summaries ORDER BY last_used ASC LIMIT ?)",
+                (n - self.max_entries,),
+            )
+
+    def clear(self):
+        with self._lock, self._connect() as con:
+            con.execute("DELETE FROM summaries")
+
+    def __len__(self):
+        with self._connect() as con:
+            return con.execute("SELECT COUNT(*) FROM summaries").fetchone()[0]
+
+
+# ---------- Async Client ----------
+class AsyncChatClient:
+    """
+    Thin asyncio wrapper over the OpenAI chat-completions API.
+    Each request gets its own timeout; at most `max_concurrency` are in flight.
+    """
+
+    def __init__(self, api_key=None, base_url=None, model=DEFAULT_MODEL,
+                 temperature=DEFAULT_TEMPERATURE, timeout_s=30.0, max_concurrency=3):
+        self.api_key = api_key or os.getenv("OPENAI_API_KEY")
+        if not self.api_key:
+            raise ValueError("OPENAI_API_KEY not set")
+        self.base_url = base_url or os.getenv("OPENAI_BASE_URL")
+        self.model = model
+        self.temperature = float(temperature)
+        self.timeout_s = float(timeout_s)
+        self.max_concurrency = max(1, int(max_concurrency))
+
+    @classmethod
+    def from_config(cls, cfg_path=CFG_PATH, **overrides):
+        c = load_llm_config(cfg_path)
+        kw = {
+            "model": c.get("model", DEFAULT_MODEL),
+            "temperature": c.get("temperature", DEFAULT_TEMPERATURE),
+            "timeout_s": c.get("timeout_s", 30.0),
+            "max_concurrency": c.get("max_concurrency", 3),
+        }
+        kw.update(overrides)
+        return cls(**kw)
+
+    def _make_client(self):
+        from openai import AsyncOpenAI
+        return AsyncOpenAI(
+            api_key=self.api_key,
+            base_url=self.base_url,
+            timeout=self.timeout_s,
+            max_retries=0,  # retries would blow the per-request budget
+        )
+
+    async def _complete(self, client, sem, prompt, payload):
+        async with sem:
+            resp = await asyncio.wait_for(
+                client.chat.completions.create(
+                    model=self.model,
+                    messages=[
+                        {"role": "system", "content": prompt},
+                        {"role": "user", "content": payload},
+                    ],
+                    temperature=self.temperature,
+                ),
+                timeout=self.timeout_s,
+            )
+        return (resp.choices[0].message.content or "").strip()
+
+    async def complete_many(self, prompts, payload):
+        """
+        Run several prompts against the same payload concurrently.
+        Returns {name: text or Exception}.
+        """
+        sem = asyncio.Semaphore(self.max_concurrency)
+        client = self._make_client()
+        try:
+            names = list(prompts)
+            results = await asyncio.gather(
+                *(self._complete(client, sem, prompts[n], payload) for n in names),
+                return_exceptions=True,
+            )
+        finally:
+            await client.close()
+        return dict(zip(names, results))
+
+
+# ---------- Public API ----------
+async def generate_summaries(metrics, prompts, client=None, cache=None):
+    """
+    Generate one summary per prompt style.
+    Cache hits are served locally; only misses go to the network (concurrently).
+
+    Returns {style: {"text", "cached", "error", "latency_s"}}.
+    """
+    client = client or AsyncChatClient.from_config()
+    payload = metrics_payload(metrics)
+
+    out, misses, keys = {}, {}, {}
+    for style, prompt in prompts.items():
+        key = cache_key(client.model, prompt, payload, client.temperature)
+        keys[style] = key
+        text = cache.get(key) if cache is not None else None
+        if text is not None:
+            out[style] = {"text": text, "cached": True, "error": None, "latency_s": 0.0}
+        else:
+            misses[style] = prompt
+
+    if misses:
+        t0 = time.perf_counter()
+        results = await client.complete_many(misses, payload)
+        elapsed = time.perf_counter() - t0
+        for style, res in results.items():
+            if isinstance(res, BaseException):
+                err = "timeout" if isinstance(res, asyncio.TimeoutError) else str(res)
+                out[style] = {"text": None, "cached": False, "error": err, "latency_s": elapsed}
+                continue
+            if cache is not None and res:
+                cache.put(keys[style], res, model=client.model)
+            out[style] = {"text": res, "cached": False, "error": None, "latency_s": elapsed}
+
+    return {style: out[style] for style in prompts}
+
+def generate_summaries_sync(metrics, prompts, client=None, cache=None):
+    """Blocking wrapper for callers without an event loop (e.g. Streamlit)."""
+    return asyncio.run(generate_summaries(metrics, prompts, client=client, cache=cache))
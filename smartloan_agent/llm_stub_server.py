@@ -0,0 +1,118 @@
+"""
+Local stand-in for the OpenAI chat-completions endpoint.
+
+Lets the LLM summary path run fully offline:
+
+    with StubChatServer(delay_s=0.2) as srv:
+        client = AsyncChatClient(api_key="stub", base_url=srv.base_url)
+
+or from the shell, then set OPENAI_BASE_URL=http://127.0.0.1:8089/v1:
+
+    python -m smartloan_agent.llm_stub_server --port 8089
+"""
+import json, time, uuid, argparse, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def _default_reply(messages):
+    system = next((m.get("content", "") for m in messages if m.get("role") == "system"), "")
+    return f"[stub] Summary for prompt: {system[:60].strip()}"
+
+
+class StubChatServer:
+    """
+    Minimal threaded HTTP server answering POST /v1/chat/completions.
+
+    reply:   str, or callable(messages) -> str
+    delay_s: artificial latency per request (to exercise timeouts/concurrency)
+    """
+
+    def __init__(self, reply=None, delay_s=0.0, host="127.0.0.1", port=0):
+        self.reply = reply or _default_reply
+        self.delay_s = float(delay_s)
+        self.requests = []
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self.send_error(404)
+                    return
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}")
+                with server._lock:
+                    server.requests.append(body)
+                if server.delay_s:
+                    time.sleep(server.delay_s)
+
+                messages = body.get("messages") or []
+                reply = server.reply(messages) if callable(server.reply) else str(server.reply)
+                data = json.dumps({
+                    "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": body.get("model", "stub"),
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": reply},
+                        "finish_reason": "stop",
+                    }],
+                    "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+                }).encode("utf-8")
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                try:
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # client gave up (timeout) - fine for a stub
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8089)
+    ap.add_argument("--delay_s", type=float, default=0.0)
+    args = ap.parse_args()
+
+    srv = StubChatServer(delay_s=args.delay_s, host=args.host, port=args.port)
+    print(f"[OK] stub chat-completions at {srv.base_url}")
+    try:
+        srv._httpd.serve_forever()
+    except KeyboardInterrupt:
+        srv.stop()
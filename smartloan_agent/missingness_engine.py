@@ -0,0 +1,228 @@
+"""
+Missingness pattern profiler.
+
+A broken ETL job usually blanks several columns at once. The per-feature
+missing_rate_new cannot show that. This profiler keeps three things, all
+built in one streaming pass over the batch chunks:
+
+- missing count per column
+- pattern counts: each row's null mask is bit-packed into uint64 words
+  (np.packbits) and the distinct patterns are counted with a hash-based
+  value_counts. The patterns per batch are few, so memory stays small.
+- co-missingness matrix: mask.T @ mask. Only the columns with a null in the
+  chunk take part, so complete columns cost nothing.
+
+Pattern frequencies are compared with the training reference (PSI over
+patterns plus the patterns that are new or grew most):
+
+    python -m smartloan_agent.missingness_engine --build_reference --csv X_train_1.csv
+    python -m smartloan_agent.missingness_engine --csv monitor/X_new.csv
+"""
+import os, json, argparse
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+import yaml
+
+from .drift_metrics import psi_from_counts, metric_level
+from .scoring_engine import iter_chunks
+
+CFG_PATH = "monitor/config.yaml"
+DEFAULT_REF_PATH = "monitor/reference_missingness.json"
+
+
+def load_missingness_config(cfg_path=CFG_PATH):
+    """`missingness:` section of config.yaml with defaults."""
+    cfg = {}
+    if os.path.exists(cfg_path):
+        with open(cfg_path, "r", encoding="utf-8") as f:
+            cfg = yaml.safe_load(f) or {}
+    labels = cfg.get("labels") or {}
+    out = {
+        "enabled": True,
+        "exclude_cols": [],
+        "chunk_size": 1_000_000,
+        "top_n": 5,
+        "reference_path": DEFAULT_REF_PATH,
+        "pattern_psi_warn": 0.10,
+        "pattern_psi_alert": 0.25,
+    }
+    out.update(cfg.get("missingness") or {})
+    out["exclude_cols"] = list(out["exclude_cols"]) + [labels.get("y_col", "label"), labels.get("p_col", "score")]
+    return out
+
+
+# ---------- Bit packing ----------
+def pack_mask(mask):
+    """(n, k) bool -> (n, ceil(k/64)) uint64, bit j of the row = column j is null."""
+    n, k = mask.shape
+    packed = np.packbits(mask, axis=1, bitorder="little")
+    n_bytes = 8 * max(1, -(-k // 64))
+    if packed.shape[1] < n_bytes:
+        packed = np.pad(packed, ((0, 0), (0, n_bytes - packed.shape[1])))
+    return np.ascontiguousarray(packed).view(np.uint64)
+
+def unpack_pattern(words, k):
+    """Column indexes set in one packed pattern."""
+    bits = np.unpackbits(np.asarray(words, dtype=np.uint64).view(np.uint8), bitorder="little")[:k]
+    return np.flatnonzero(bits)
+
+
+class MissingnessProfile:
+    """Mergeable missingness state for one column set."""
+
+    def __init__(self, columns):
+        self.columns = list(columns)
+        self.k = len(self.columns)
+        self.n = 0
+        self.col_missing = np.zeros(self.k, dtype=np.int64)
+        self.co_missing = np.zeros((self.k, self.k), dtype=np.int64)
+        self.patterns = Counter()     # tuple of uint64 words -> rows
+
+    def update(self, df):
+        """Add one chunk (columns missing from the chunk count as null)."""
+        mask = df.reindex(columns=self.columns).isna().to_numpy()
+        self.n += len(mask)
+        self.col_missing += mask.sum(axis=0)
+
+        idx = np.flatnonzero(mask.any(axis=0))
+        if idx.size:
+            sub = mask[:, idx].astype(np.float32)
+            self.co_missing[np.ix_(idx, idx)] += np.rint(sub.T @ sub).astype(np.int64)
+
+        words = pack_mask(mask)
+        vc = pd.DataFrame(words).value_counts(sort=False)
+        for key, cnt in zip(vc.index, vc.to_numpy()):
+            self.patterns[key if isinstance(key, tuple) else (key,)] += int(cnt)
+        return self
+
+    def merge(self, other):
+        self.n += other.n
+        self.col_missing += other.col_missing
+        self.co_missing += other.co_missing
+        self.patterns.update(other.patterns)
+        return self
+
+    def pattern_frequencies(self):
+        """{"col_a|col_b": share of rows}; "" = complete rows."""
+        out = {}
+        for key, cnt in self.patterns.items():
+            cols = unpack_pattern(key, self.k)
+            out["|".join(self.columns[i] for i in cols)] = cnt / max(self.n, 1)
+        return out
+
+    def top_pairs(self, top_n=5):
+        """Column pairs most often missing together, with P(b null | a null)."""
+        C = np.triu(self.co_missing, k=1)
+        flat = np.argsort(C, axis=None)[::-1][:top_n]
+        rows = []
+        for a, b in zip(*np.unravel_index(flat, C.shape)):
+            if C[a, b] == 0:
+                break
+            rows.append({
+                "pair": f"{self.columns[a]} & {self.columns[b]}",
+                "rate": round(C[a, b] / max(self.n, 1), 4),
+                "p_b_given_a": round(C[a, b] / max(self.col_missing[a], 1), 3),
+            })
+        return rows
+
+
+def profile_frame(df, columns=None, chunk_size=1_000_000):
+    prof = MissingnessProfile(columns if columns is not None else df.columns)
+    for start in range(0, max(len(df), 1), chunk_size):
+        prof.update(df.iloc[start:start + chunk_size])
+    return prof
+
+def profile_file(path, columns=None, chunk_size=1_000_000, exclude=()):
+    """Stream a CSV / Parquet batch chunk by chunk."""
+    prof = None
+    for chunk in iter_chunks(path, chunk_size):
+        if prof is None:
+            cols = columns or [c for c in chunk.columns if c not in set(exclude)]
+            prof = MissingnessProfile(cols)
+        prof.update(chunk)
+    return prof
+
+
+# ---------- Reference ----------
+def build_reference(prof):
+    return {"columns": prof.columns, "n": prof.n, "patterns": prof.pattern_frequencies()}
+
+def load_reference(path=DEFAULT_REF_PATH):
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def compare_patterns(freq_new, n_new, freq_ref, n_ref, top_n=5):
+    """(pattern PSI, patterns that are new or grew most vs the reference)."""
+    keys = sorted(set(freq_new) | set(freq_ref))
+    new = np.array([freq_new.get(k, 0.0) for k in keys])
+    ref = np.array([freq_ref.get(k, 0.0) for k in keys])
+    psi = psi_from_counts(new * n_new, ref * n_ref)
+    grown = np.argsort(ref - new)[:top_n]
+    return psi, [{
+        "pattern": keys[i] or "(complete)",
+        "share": round(float(new[i]), 4),
+        "ref_share": round(float(ref[i]), 4),
+    } for i in grown if new[i] > ref[i]]
+
+
+# ---------- Batch summary ----------
+def missingness_summary(prof, ref=None, top_n=5, psi_thresholds=None):
+    """Batch-level fields for batch_metrics_log.csv."""
+    freq = prof.pattern_frequencies()
+    top = sorted(freq.items(), key=lambda kv: -kv[1])[:top_n]
+    ref_freq = (ref or {}).get("patterns") or {}
+    out = {
+        "miss_complete_rate": round(freq.get("", 0.0), 4),
+        "miss_pattern_count": len(freq),
+        "miss_cols_any": int((prof.col_missing > 0).sum()),
+        "top_miss_patterns_json": json.dumps([
+            {"pattern": p or "(complete)", "share": round(s, 4),
+             **({"ref_share": round(ref_freq.get(p, 0.0), 4)} if ref else {})}
+            for p, s in top], ensure_ascii=False),
+        "co_missing_json": json.dumps(prof.top_pairs(top_n), ensure_ascii=False),
+        "miss_pattern_psi": None,
+        "miss_pattern_level": "N/A",
+        "new_miss_patterns_json": None,
+    }
+    if ref:
+        psi, grown = compare_patterns(freq, prof.n, ref_freq, int(ref.get("n") or prof.n), top_n)
+        out["miss_pattern_psi"] = round(psi, 4)
+        out["miss_pattern_level"] = metric_level(psi, psi_thresholds or {"warn": 0.10, "alert": 0.25})
+        out["new_miss_patterns_json"] = json.dumps(grown, ensure_ascii=False)
+    return out
+
+def missingness_profile(df, miss_cfg):
+    """Profile an in-memory batch and compare it with the reference."""
+    ref = load_reference(miss_cfg["reference_path"])
+    cols = (ref or {}).get("columns") or [c for c in df.columns if c not in set(miss_cfg["exclude_cols"])]
+    prof = profile_frame(df, cols, int(miss_cfg["chunk_size"]))
+    return missingness_summary(prof, ref, int(miss_cfg["top_n"]), _psi_thresholds(miss_cfg))
+
+def _psi_thresholds(miss_cfg):
+    return {"warn": float(miss_cfg["pattern_psi_warn"]), "alert": float(miss_cfg["pattern_psi_alert"])}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--csv", default="monitor/X_new.csv", help="batch (CSV or Parquet), read in chunks")
+    ap.add_argument("--build_reference", action="store_true", help="store --csv as the reference")
+    args = ap.parse_args()
+
+    cfg = load_missingness_config()
+    ref = None if args.build_reference else load_reference(cfg["reference_path"])
+    prof = profile_file(args.csv, (ref or {}).get("columns"), int(cfg["chunk_size"]), cfg["exclude_cols"])
+    if args.build_reference:
+        with open(cfg["reference_path"], "w", encoding="utf-8") as f:
+            json.dump(build_reference(prof), f, indent=2)
+        print(f"[OK] missingness reference ({prof.n:,} rows, {len(prof.patterns)} patterns) "
+              f"→ {cfg['reference_path']}")
+        return
+    print(json.dumps(missingness_summary(prof, ref, int(cfg["top_n"]), _psi_thresholds(cfg)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Warm model pool shared by scoring and SHAP.
+
+Artifacts are configured in `models:` (config.yaml) as a path per model name.
+A path may pin a version with a `{version}` placeholder
+(e.g. "models/xgb_model_{version}.joblib") or be an MLflow model URI
+("models:/smartloan_xgb/3", "runs:/<run_id>/model").
+
+Loaded models are kept in a small LRU keyed by name:version:mtime, so a
+pinned version is deserialised once per process and reloaded only when the
+artifact file changes.
+"""
+import os, threading
+from collections import OrderedDict
+
+POOL_SIZE = 3   # models kept warm per process
+MLFLOW_PREFIXES = ("models:/", "runs:/")
+
+
+def resolve_model_path(path, version=None):
+    """Fill the `{version}` placeholder of a configured artifact path."""
+    path = str(path)
+    return path.format(version=version) if "{version}" in path else path
+
+def is_mlflow_uri(path):
+    return str(path).startswith(MLFLOW_PREFIXES)
+
+def artifact_exists(path, version=None):
+    path = resolve_model_path(path, version)
+    return is_mlflow_uri(path) or os.path.exists(path)
+
+def model_key(name, path, version=None):
+    """Identity of a model artifact: name, version and file mtime (URI for MLflow)."""
+    path = resolve_model_path(path, version)
+    stamp = path if is_mlflow_uri(path) else os.stat(path).st_mtime_ns
+    return f"{name}:{version}:{stamp}"
+
+def load_model_artifact(path):
+    if is_mlflow_uri(path):
+        import mlflow.sklearn
+        return mlflow.sklearn.load_model(path)
+    import joblib
+    return joblib.load(path)
+
+
+class ModelPool:
+    """Thread-safe LRU of loaded model objects keyed by model_key()."""
+
+    def __init__(self, size=POOL_SIZE):
+        self.size = max(1, int(size))
+        self._lock = threading.Lock()
+        self._models = OrderedDict()   # key -> model
+
+    def get(self, name, path, version=None):
+        """(model, key); deserialised only on the first request for this key."""
+        path = resolve_model_path(path, version)
+        if not artifact_exists(path):
+            raise FileNotFoundError(f"model artifact not found: {path}")
+        key = model_key(name, path, version)
+        with self._lock:
+            if key in self._models:
+                self._models.move_to_end(key)
+                return self._models[key], key
+        model = load_model_artifact(path)
+        with self._lock:
+            self._models[key] = model
+            while len(self._models) > self.size:
+                self._models.popitem(last=False)
+        print(f"[OK] model pool: loaded {key.rsplit(':', 1)[0]} ({type(model).__name__})")
+        return model, key
+
+    def keys(self):
+        with self._lock:
+            return list(self._models)
+
+
+_shared, _shared_lock = None, threading.Lock()
+
+def get_model_pool(size=POOL_SIZE):
+    """Process-wide model pool."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = ModelPool(size)
+        return _shared
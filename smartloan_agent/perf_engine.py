@@ -0,0 +1,255 @@
+"""
+In-process performance engine (AUC / KS, score PSI, calibration).
+Shared by monitor/monitor_1.py, SmartLoanAgentFS and the agent tools.
+
+Everything is derived from one sort of the scores (O(n log n) total):
+AUC and KS from cumulative bad/good counts at tied-score boundaries,
+score-band PSI from searchsorted counts, observed vs expected default rate
+per decile / PD band from segment sums, Brier and Hosmer-Lemeshow.
+
+Score PSI needs a reference score histogram per model_version:
+
+    python -m smartloan_agent.perf_engine --build_score_reference --csv X_train_1.csv \\
+        --p_col score --model_version v1.0
+"""
+import os, json, argparse
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from scipy.stats import chi2
+
+from .drift_metrics import psi_from_counts
+
+SCORE_REF_PATH = "monitor/reference_scores.json"
+SCORE_BINS = 10   # score bands of the reference histogram (reference deciles)
+N_GROUPS = 10     # equal-count groups for decile calibration / Hosmer-Lemeshow
+
+
+# ---------- Single sorted pass ----------
+def _segments(starts, n, p, y):
+    """Observed vs expected defaults for contiguous segments of the sorted arrays."""
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.r_[starts[1:], n]
+    counts = ends - starts
+    observed = np.add.reduceat(y, starts) if len(starts) else np.array([])
+    expected = np.add.reduceat(p, starts) if len(starts) else np.array([])
+    return [{
+        "n": int(c),
+        "score_min": float(p[s]), "score_max": float(p[e - 1]),
+        "observed_rate": float(o / c), "expected_rate": float(x / c),
+        "observed": float(o), "expected": float(x),
+    } for s, e, c, o, x in zip(starts, ends, counts, observed, expected) if c > 0]
+
+def score_report(y, p, score_ref=None, n_groups=N_GROUPS, bands=None):
+    """
+    One sort of `p` -> performance, stability and calibration.
+
+    y: 0/1 labels (NaN = not yet observed), p: scores (NaN rows ignored).
+    score_ref: {"bins", "counts"} reference histogram for score PSI.
+    bands: optional PD master-scale edges for band calibration.
+    """
+    p = np.asarray(p, dtype=float)
+    y = np.asarray(y, dtype=float) if y is not None else np.full(len(p), np.nan)
+    scored = ~np.isnan(p)
+    p, y = p[scored], y[scored]
+
+    order = np.argsort(p, kind="mergesort")
+    p, y = p[order], y[order]
+    n = len(p)
+
+    out = {"n_scored": int(n), "score_mean": float(p.mean()) if n else None, "score_psi": None}
+    if score_ref and n:
+        edges = np.asarray(score_ref["bins"], dtype=float)
+        expected = np.asarray(score_ref["counts"], dtype=float)
+        if expected.size == edges.size - 1:
+            # counts per reference band = differences of insertion points in the sorted scores
+            pos = np.searchsorted(p, edges, side="left")
+            pos[-1] = np.searchsorted(p, edges[-1], side="right")
+            out["score_psi"] = psi_from_counts(np.diff(pos), expected)
+
+    # labelled rows keep the sorted order (filtering is O(n), no second sort)
+    lab = ~np.isnan(y)
+    p, y = p[lab], y[lab]
+    n = len(p)
+    out.update({"n_labelled": int(n), "auc": None, "ks": None, "default_rate": None,
+                "calib_gap": None, "brier": None, "hl_stat": None, "hl_pvalue": None,
+                "deciles": [], "bands": []})
+    if n == 0:
+        return out
+
+    n_bad = y.sum()
+    n_good = n - n_bad
+    out["default_rate"] = float(n_bad / n)
+    out["calib_gap"] = float(p.mean() - out["default_rate"])
+    out["brier"] = float(np.mean((p - y) ** 2))
+
+    if n_bad > 0 and n_good > 0:
+        # cumulative counts at the last row of each tied-score run
+        last = np.r_[np.flatnonzero(np.diff(p)), n - 1]
+        cum_bad = np.cumsum(y)[last]
+        cum_good = (last + 1) - cum_bad
+        tpr = np.r_[0.0, cum_bad / n_bad]
+        fpr = np.r_[0.0, cum_good / n_good]
+        out["ks"] = float(np.max(np.abs(tpr - fpr)))
+        # ascending sort: area under (fpr, tpr) of the low-score end, ties as trapezoids
+        out["auc"] = float(1.0 - np.sum(np.diff(fpr) * (tpr[1:] + tpr[:-1]) / 2.0))
+
+    group_starts = np.unique((np.arange(n_groups) * n) // n_groups)
+    deciles = _segments(group_starts, n, p, y)
+    for i, d in enumerate(deciles, start=1):
+        d["group"] = i
+    out["deciles"] = deciles
+
+    hl = [(d["observed"] - d["expected"]) ** 2 / (d["expected"] * (1 - d["expected"] / d["n"]))
+          for d in deciles if 0 < d["expected"] < d["n"]]
+    if len(hl) > 2:
+        out["hl_stat"] = float(np.sum(hl))
+        out["hl_pvalue"] = float(chi2.sf(out["hl_stat"], len(hl) - 2))
+
+    if bands:
+        edges = np.asarray(bands, dtype=float)
+        starts = np.searchsorted(p, edges[:-1], side="left")
+        # empty bands share their start with the next band; the last label wins
+        labels = {int(s): f"{lo:g}-{hi:g}" for s, lo, hi in zip(starts, edges[:-1], edges[1:])}
+        ustarts = np.unique(starts)
+        ustarts = ustarts[ustarts < n]
+        rows = _segments(ustarts, n, p, y)
+        for r, s in zip(rows, ustarts):
+            r["band"] = labels[int(s)]
+        out["bands"] = rows
+    return out
+
+
+def _clean_xy(df, y_col, p_col):
+    y = pd.to_numeric(df[y_col], errors="coerce").to_numpy(dtype=float)
+    p = pd.to_numeric(df[p_col], errors="coerce").to_numpy(dtype=float)
+    return y, p
+
+def compute_auc_ks(df, y_col="label", p_col="score"):
+    """
+    Compute AUC and KS from DataFrame with labels and predictions.
+    Returns (auc, ks) or (None, None) if computation fails.
+    """
+    try:
+        if y_col not in df.columns or p_col not in df.columns:
+            print(f"[WARN] Missing columns: y_col='{y_col}' or p_col='{p_col}'")
+            return None, None
+
+        y, p = _clean_xy(df, y_col, p_col)
+        mask = ~np.isnan(y) & ~np.isnan(p)
+        if mask.sum() < 5:
+            print(f"[WARN] Insufficient valid rows: {int(mask.sum())}")
+            return None, None
+        if len(np.unique(y[mask])) < 2:
+            print(f"[WARN] Need at least 2 classes, found: {np.unique(y[mask])}")
+            return None, None
+
+        rep = score_report(y[mask], p[mask], n_groups=1)
+        auc, ks = rep["auc"], rep["ks"]
+        print(f"[OK] Computed AUC={auc:.4f}, KS={ks:.4f}")
+        return auc, ks
+
+    except Exception as e:
+        print(f"[ERROR] AUC/KS computation failed: {e}")
+        return None, None
+
+def performance_drops(auc, ks, baseline):
+    """(auc_drop, ks_drop) vs the config baseline; None where not computable."""
+    baseline = baseline or {}
+    base_auc, base_ks = baseline.get("roc_auc"), baseline.get("ks")
+    auc_drop = max(0.0, float(base_auc) - auc) if (auc is not None and base_auc is not None) else None
+    ks_drop = max(0.0, float(base_ks) - ks) if (ks is not None and base_ks is not None) else None
+    return auc_drop, ks_drop
+
+
+# ---------- Score reference ----------
+def build_score_reference(scores, n_bins=SCORE_BINS):
+    """Reference score histogram on reference-quantile bands (open-ended outer edges)."""
+    s = pd.to_numeric(pd.Series(scores), errors="coerce").dropna().to_numpy(dtype=float)
+    edges = np.unique(np.quantile(s, np.linspace(0, 1, n_bins + 1)))
+    edges[0], edges[-1] = -np.inf, np.inf
+    counts, _ = np.histogram(s, bins=edges)
+    return {
+        "bins": [float(e) for e in edges],
+        "counts": counts.tolist(),
+        "n": int(s.size),
+        "mean": float(s.mean()),
+        "created": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    }
+
+def load_score_reference(model_version, path=SCORE_REF_PATH):
+    """Reference score histogram for one model_version (None if missing)."""
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        ref = json.load(f)
+    return (ref.get("models") or {}).get(str(model_version))
+
+def save_score_reference(model_version, hist, path=SCORE_REF_PATH):
+    ref = {"models": {}}
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            ref = json.load(f)
+    ref.setdefault("models", {})[str(model_version)] = hist
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(ref, f, indent=2)
+    return path
+
+
+# ---------- Per-model metrics ----------
+def _round_rows(rows, digits=4):
+    return [{k: round(v, digits) if isinstance(v, float) else v for k, v in r.items()} for r in rows]
+
+def model_metrics(df, y_col="label", p_col="score", baseline=None, score_ref=None,
+                  n_groups=N_GROUPS, bands=None):
+    """
+    Performance, score stability and calibration of one score column
+    (one sorted pass): auc, ks, auc_drop, ks_drop, score_psi, score_mean,
+    default_rate, calib_gap (mean score - observed default rate), brier,
+    hl_stat, hl_pvalue, deciles_json, bands_json, n_scored, n_labelled.
+    """
+    out = {"n_scored": 0, "n_labelled": 0, "auc": None, "ks": None, "auc_drop": None,
+           "ks_drop": None, "score_psi": None, "score_mean": None, "default_rate": None,
+           "calib_gap": None, "brier": None, "hl_stat": None, "hl_pvalue": None,
+           "deciles_json": None, "bands_json": None}
+    if p_col not in df.columns:
+        print(f"[WARN] score column '{p_col}' not in batch")
+        return out
+
+    if y_col in df.columns:
+        y, p = _clean_xy(df, y_col, p_col)
+    else:
+        y, p = None, pd.to_numeric(df[p_col], errors="coerce").to_numpy(dtype=float)
+    rep = score_report(y, p, score_ref, n_groups=n_groups, bands=bands)
+
+    for k in out:
+        if k in rep:
+            out[k] = rep[k]
+    out["auc_drop"], out["ks_drop"] = performance_drops(rep["auc"], rep["ks"], baseline)
+    out["deciles_json"] = json.dumps(_round_rows(rep["deciles"])) if rep["deciles"] else None
+    out["bands_json"] = json.dumps(_round_rows(rep["bands"])) if rep["bands"] else None
+    if rep["auc"] is not None:
+        print(f"[OK] Computed AUC={rep['auc']:.4f}, KS={rep['ks']:.4f}, Brier={rep['brier']:.4f}"
+              + (f", HL p={rep['hl_pvalue']:.3g}" if rep["hl_pvalue"] is not None else ""))
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--build_score_reference", action="store_true")
+    ap.add_argument("--csv", default="X_train_1.csv", help="reference dataset with a score column")
+    ap.add_argument("--p_col", default="score")
+    ap.add_argument("--model_version", default="v1.0")
+    ap.add_argument("--bins", type=int, default=SCORE_BINS)
+    args = ap.parse_args()
+    if not args.build_score_reference:
+        ap.print_help()
+        return
+    df = pd.read_csv(args.csv, usecols=[args.p_col])
+    path = save_score_reference(args.model_version, build_score_reference(df[args.p_col], args.bins))
+    print(f"[OK] reference score histogram for {args.model_version} ({len(df)} rows) → {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+"""
+Named drift references: training, trailing windows and pinned snapshots.
+
+All references share the training bin edges (reference_stats.pkl), so a
+reference is just a count vector per feature:
+
+    training        counts stored in reference_stats.pkl
+    trailing_30d    sum of the stored batch histograms of the last 30 days
+    trailing_90d    same over 90 days
+    last_approved   counts pinned when a batch / window was signed off
+
+Every monitor run stores its batch histograms (one row per feature) in a
+small SQLite store. Rolling references are rebuilt by summing those rows,
+so no raw batch file is re-read. The batch is binned once, in
+feature_drift_table. PSI against every reference is then one vectorised
+step over a [references x features x bins] array.
+
+High PSI against training but low against trailing_30d means slow
+population change. High PSI against trailing_30d means a sudden break.
+
+    python -m smartloan_agent.reference_engine --pin last_approved
+    python -m smartloan_agent.reference_engine --pin last_approved --days 30
+    python -m smartloan_agent.reference_engine --show
+"""
+import os, json, hashlib, sqlite3, threading, argparse
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import yaml
+
+from .drift_engine import REF_PATH, load_reference_stats
+from .drift_metrics import psi_from_counts, PSI_SMOOTHING
+
+CFG_PATH = "monitor/config.yaml"
+DEFAULT_STORE_PATH = "monitor/cache/reference_hist.sqlite"
+TIME_FMT = "%Y-%m-%d %H:%M:%S"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS batch_hist (
+    batch_time TEXT NOT NULL,
+    feature TEXT NOT NULL,
+    edges_key TEXT NOT NULL,      -- hash of the bin edges the counts were taken on
+    n INTEGER NOT NULL,
+    counts BLOB NOT NULL,         -- int64 counts per bin
+    PRIMARY KEY (batch_time, feature)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS pinned (
+    name TEXT NOT NULL,
+    feature TEXT NOT NULL,
+    edges_key TEXT NOT NULL,
+    n INTEGER NOT NULL,
+    counts BLOB NOT NULL,
+    source TEXT,
+    created TEXT,
+    PRIMARY KEY (name, feature)
+) WITHOUT ROWID;
+"""
+
+
+def load_reference_config(cfg_path=CFG_PATH):
+    """`references:` section of config.yaml with defaults."""
+    cfg = {}
+    if os.path.exists(cfg_path):
+        with open(cfg_path, "r", encoding="utf-8") as f:
+            cfg = yaml.safe_load(f) or {}
+    out = {
+        "enabled": True,
+        "path": DEFAULT_STORE_PATH,
+        "rolling": {"trailing_30d": 30, "trailing_90d": 90},
+        "pinned": ["last_approved"],
+        "min_rows": 500,
+    }
+    out.update(cfg.get("references") or {})
+    out["psi_warn"] = float(cfg.get("psi_threshold_warn", 0.10))
+    out["psi_alert"] = float(cfg.get("psi_threshold_alert", 0.20))
+    return out
+
+def edges_key(edges):
+    """Short hash of a feature's bin edges (stored counts are only merged on equal edges)."""
+    return hashlib.md5(np.asarray(edges, dtype=float).tobytes()).hexdigest()[:12]
+
+def _now():
+    return datetime.now().strftime(TIME_FMT)
+
+
+class ReferenceStore:
+    """
+    Per-batch feature histograms + pinned references.
+    Thread-safe (one connection guarded by a lock); safe to share per process.
+    """
+
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        self.path = path
+        self._lock = threading.RLock()
+        if path != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+
+    def record_batch(self, batch_time, bin_counts, ref_stats):
+        """Store one batch's counts per feature (re-running a batch_time replaces it)."""
+        rows = [(str(batch_time), f, edges_key(ref_stats[f]["bins"]), int(np.sum(c)),
+                 np.asarray(c, dtype=np.int64).tobytes())
+                for f, c in bin_counts.items() if f in ref_stats]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO batch_hist (batch_time, feature, edges_key, n, counts) "
+                "VALUES (?, ?, ?, ?, ?)", rows,
+            )
+        return len(rows)
+
+    def _merge(self, rows, ref_stats):
+        """Sum (feature, edges_key, counts) rows that match the current edges."""
+        keys = {f: edges_key(st["bins"]) for f, st in ref_stats.items() if st.get("bins") is not None}
+        out = {}
+        for feat, key, blob in rows:
+            if keys.get(feat) != key:
+                continue
+            c = np.frombuffer(blob, dtype=np.int64)
+            out[feat] = out[feat] + c if feat in out else c.copy()
+        return out
+
+    def rolling(self, days, ref_stats, before=None):
+        """Merged counts of the batches in [before - days, before)."""
+        before = before or _now()
+        start = (datetime.strptime(before, TIME_FMT) - timedelta(days=days)).strftime(TIME_FMT)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT feature, edges_key, counts FROM batch_hist WHERE batch_time >= ? AND batch_time < ?",
+                (start, before),
+            ).fetchall()
+        return self._merge(rows, ref_stats)
+
+    def batch(self, batch_time, ref_stats):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT feature, edges_key, counts FROM batch_hist WHERE batch_time = ?", (batch_time,),
+            ).fetchall()
+        return self._merge(rows, ref_stats)
+
+    def latest_batch_time(self):
+        with self._lock:
+            row = self._conn.execute("SELECT MAX(batch_time) FROM batch_hist").fetchone()
+        return row[0] if row else None
+
+    def pin(self, name, counts, ref_stats, source=None):
+        """Freeze `counts` as the named reference (replaces an earlier pin)."""
+        rows = [(name, f, edges_key(ref_stats[f]["bins"]), int(np.sum(c)),
+                 np.asarray(c, dtype=np.int64).tobytes(), source, _now())
+                for f, c in counts.items() if f in ref_stats]
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM pinned WHERE name = ?", (name,))
+            self._conn.executemany(
+                "INSERT INTO pinned (name, feature, edges_key, n, counts, source, created) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", rows,
+            )
+        return len(rows)
+
+    def pinned(self, name, ref_stats):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT feature, edges_key, counts FROM pinned WHERE name = ?", (name,),
+            ).fetchall()
+        return self._merge(rows, ref_stats)
+
+    def summary(self):
+        """Stored batches and pins (for --show)."""
+        with self._lock:
+            batches = pd.read_sql_query(
+                "SELECT batch_time, COUNT(*) AS features, MAX(n) AS rows FROM batch_hist "
+                "GROUP BY batch_time ORDER BY batch_time DESC", self._conn)
+            pins = pd.read_sql_query(
+                "SELECT name, source, created, COUNT(*) AS features, MAX(n) AS rows FROM pinned "
+                "GROUP BY name", self._conn)
+        return batches, pins
+
+
+_shared, _shared_lock = None, threading.Lock()
+
+def get_reference_store(cfg_path=CFG_PATH):
+    """Process-wide reference store."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = ReferenceStore(load_reference_config(cfg_path)["path"])
+        return _shared
+
+
+# ---------- References ----------
+def named_references(ref_stats, ref_cfg, store, batch_time=None):
+    """
+    {name: {feature: counts}} for training, the rolling windows and the pins.
+    References with fewer than `min_rows` rows are left out.
+    """
+    refs = {"training": {f: np.asarray(st["counts"]) for f, st in ref_stats.items()
+                         if st.get("counts") is not None}}
+    for name, days in (ref_cfg.get("rolling") or {}).items():
+        refs[name] = store.rolling(int(days), ref_stats, before=batch_time)
+    for name in ref_cfg.get("pinned") or []:
+        refs[name] = store.pinned(name, ref_stats)
+    min_rows = int(ref_cfg.get("min_rows", 0))
+    return {k: v for k, v in refs.items()
+            if v and max(int(np.sum(c)) for c in v.values()) >= min_rows}
+
+def multi_reference_psi(bin_counts, refs):
+    """
+    PSI of the batch against every reference in one step.
+    Returns a long frame: feature, reference, psi, n_ref.
+    """
+    feats = sorted(bin_counts)
+    names = list(refs)
+    if not feats or not names:
+        return pd.DataFrame(columns=["feature", "reference", "psi", "n_ref"])
+    n_bins = max(len(bin_counts[f]) for f in feats)
+
+    def pad(c):
+        return np.pad(np.asarray(c, dtype=float), (0, n_bins - len(c)))
+
+    new = np.stack([pad(bin_counts[f]) for f in feats])                      # [F, B]
+    ref = np.stack([np.stack([pad(refs[r].get(f, np.zeros(len(bin_counts[f]))))
+                              for f in feats]) for r in names])             # [R, F, B]
+    valid = np.stack([np.arange(n_bins) < len(bin_counts[f]) for f in feats])
+    # [R, F] in one broadcast; padded bins (features with fewer bins) are masked out
+    psi = psi_from_counts(new[None], ref) if valid.all() else _psi_masked(new, ref, valid)
+    n_ref = ref.sum(axis=2)
+
+    out = pd.DataFrame({
+        "feature": np.tile(feats, len(names)),
+        "reference": np.repeat(names, len(feats)),
+        "psi": psi.ravel(),
+        "n_ref": n_ref.ravel().astype(int),
+    })
+    return out[out["n_ref"] > 0].reset_index(drop=True)
+
+def _psi_masked(new, ref, valid, alpha=PSI_SMOOTHING):
+    """psi_from_counts over [R, F, B] with padded bins excluded."""
+    new = np.where(valid, new + alpha, 0.0)[None]
+    ref = np.where(valid, ref + alpha, 0.0)
+    new_pct = new / new.sum(axis=-1, keepdims=True)
+    ref_pct = ref / ref.sum(axis=-1, keepdims=True)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        terms = np.where(valid, (new_pct - ref_pct) * np.log(new_pct / ref_pct), 0.0)
+    return terms.sum(axis=-1)
+
+def summarize_references(ref_df, ref_cfg):
+    """
+    Batch-level fields: max PSI per reference (JSON) and the drift pattern
+    (stable / gradual vs training / sudden vs the short window).
+    """
+    out = {"psi_by_reference_json": "{}", "drift_pattern": None}
+    if ref_df is None or ref_df.empty:
+        return out
+    top = ref_df.loc[ref_df.groupby("reference")["psi"].idxmax()]
+    by_ref = {r: {"psi_max": round(float(p), 4), "feature": f}
+              for r, f, p in top[["reference", "feature", "psi"]].itertuples(index=False)}
+    out["psi_by_reference_json"] = json.dumps(by_ref, ensure_ascii=False)
+
+    warn = ref_cfg["psi_warn"]
+    rolling = list(ref_cfg.get("rolling") or {})
+    short = min(rolling, key=lambda r: ref_cfg["rolling"][r]) if rolling else None
+    if short in by_ref and by_ref[short]["psi_max"] > warn:
+        out["drift_pattern"] = "sudden"
+    elif by_ref.get("training", {}).get("psi_max", 0) > warn:
+        out["drift_pattern"] = "gradual" if short in by_ref else "vs_training"
+    else:
+        out["drift_pattern"] = "stable"
+    return out
+
+def reference_drift(batch_time, bin_counts, ref_stats, ref_cfg, cfg_path=CFG_PATH):
+    """
+    Score the batch against all named references, then record its histograms
+    for future rolling references. Returns (long table, summary).
+    """
+    store = get_reference_store(cfg_path)
+    refs = named_references(ref_stats, ref_cfg, store, batch_time)
+    table = multi_reference_psi(bin_counts, refs)
+    store.record_batch(batch_time, bin_counts, ref_stats)
+    return table, summarize_references(table, ref_cfg)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--pin", default=None, help="name of the reference to pin, e.g. last_approved")
+    ap.add_argument("--batch_time", default=None, help="batch to pin (default: latest stored batch)")
+    ap.add_argument("--days", type=int, default=None, help="pin the trailing window instead of one batch")
+    ap.add_argument("--show", action="store_true")
+    args = ap.parse_args()
+
+    store = get_reference_store()
+    if args.pin:
+        ref_stats = load_reference_stats(REF_PATH)
+        if args.days:
+            counts, source = store.rolling(args.days, ref_stats), f"trailing {args.days}d to {_now()}"
+        else:
+            bt = args.batch_time or store.latest_batch_time()
+            counts, source = (store.batch(bt, ref_stats) if bt else {}), f"batch {bt}"
+        if not counts:
+            print(f"[WARN] nothing to pin ({source}): no stored batch histograms")
+        else:
+            n = store.pin(args.pin, counts, ref_stats, source)
+            print(f"[OK] pinned '{args.pin}' from {source} ({n} features)")
+    if args.show or not args.pin:
+        batches, pins = store.summary()
+        print(batches.to_string(index=False))
+        print(pins.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+"""
+Report catalog: a small SQLite index of every generated report.
+
+Each writer (Compliance page, SmartLoanAgentFS) registers its file with
+`register_report`, which records path, kind, batch id, content hash and
+created time, and also adds the file to the BM25 search index (report_index).
+
+- "latest N of kind X" is an index range scan on (kind, created) - no
+  globbing or stat-ing report directories on page load
+- Retention (config `report_catalog:`):
+    dedupe             identical content of the same kind -> keep only the newest file
+    keep_per_day       newest N reports per kind and day; older extras are deleted
+    archive_after_days older reports are moved into monthly zip archives and
+                       stay readable through `read()`
+
+    python -m smartloan_agent.report_catalog --sync --retention
+"""
+import os, sqlite3, hashlib, threading, zipfile, argparse
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import yaml
+
+from .report_index import DEFAULT_DIRS, get_report_index, index_report, report_created, report_kind
+
+CFG_PATH = "monitor/config.yaml"
+DEFAULT_CATALOG_PATH = "monitor/cache/report_catalog.sqlite"
+DEFAULT_ARCHIVE_DIR = "reports/archive"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS reports (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    kind TEXT NOT NULL,
+    batch_id TEXT,
+    content_hash TEXT NOT NULL,
+    created TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    archive TEXT            -- zip file holding the report once archived
+);
+CREATE INDEX IF NOT EXISTS reports_kind_created ON reports(kind, created);
+CREATE INDEX IF NOT EXISTS reports_kind_hash ON reports(kind, content_hash);
+CREATE INDEX IF NOT EXISTS reports_created ON reports(created);
+"""
+
+
+# ---------- Helper Functions ----------
+def load_catalog_config(cfg_path=CFG_PATH):
+    """Read the `report_catalog:` section of config.yaml (empty dict if missing)."""
+    if not os.path.exists(cfg_path):
+        return {}
+    with open(cfg_path, "r", encoding="utf-8") as f:
+        cfg = yaml.safe_load(f) or {}
+    out = dict(cfg.get("report_catalog") or {})
+    out.setdefault("dirs", (cfg.get("report_index") or {}).get("dirs") or list(DEFAULT_DIRS))
+    return out
+
+def content_hash(data):
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+def _norm(path):
+    return os.path.normpath(path)
+
+
+class ReportCatalog:
+    """
+    Catalog of generated reports with retention and archiving.
+    Thread-safe (one connection guarded by a lock); safe to share per process.
+    """
+
+    def __init__(self, path=DEFAULT_CATALOG_PATH, dirs=DEFAULT_DIRS, keep_per_day=None,
+                 dedupe=True, archive_after_days=None, archive_dir=DEFAULT_ARCHIVE_DIR):
+        self.path = path
+        self.dirs = list(dirs)
+        self.keep_per_day = int(keep_per_day) if keep_per_day else None
+        self.dedupe = bool(dedupe)
+        self.archive_after_days = int(archive_after_days) if archive_after_days else None
+        self.archive_dir = archive_dir
+        self._lock = threading.RLock()
+        self._dir_mtimes = {}
+        if path != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(SCHEMA)
+
+    @classmethod
+    def from_config(cls, cfg_path=CFG_PATH):
+        cfg = load_catalog_config(cfg_path)
+        return cls(
+            path=cfg.get("path", DEFAULT_CATALOG_PATH),
+            dirs=cfg.get("dirs") or DEFAULT_DIRS,
+            keep_per_day=cfg.get("keep_per_day"),
+            dedupe=cfg.get("dedupe", True),
+            archive_after_days=cfg.get("archive_after_days"),
+            archive_dir=cfg.get("archive_dir", DEFAULT_ARCHIVE_DIR),
+        )
+
+    # ---------- Registration ----------
+    def register(self, path, kind=None, batch_id=None, text=None):
+        """
+        Record a freshly written report and apply the per-report retention
+        rules (dedupe, keep_per_day) to its kind and day.
+        Returns the list of older report paths removed by retention.
+        """
+        path = _norm(path)
+        if text is None:
+            with open(path, "rb") as f:
+                data = f.read()
+        else:
+            data = text.encode("utf-8")
+        kind = kind or report_kind(path)
+        created = report_created(path)
+        digest = content_hash(data)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO reports (path, kind, batch_id, content_hash, created, size, archive) "
+                "VALUES (?, ?, ?, ?, ?, ?, NULL) "
+                "ON CONFLICT(path) DO UPDATE SET kind = excluded.kind, "
+                "batch_id = COALESCE(excluded.batch_id, reports.batch_id), "
+                "content_hash = excluded.content_hash, created = excluded.created, "
+                "size = excluded.size, archive = NULL",
+                (path, kind, None if batch_id is None else str(batch_id),
+                 digest, created, len(data)),
+            )
+            removed = []
+            if self.dedupe:
+                removed += self._dedupe(kind, digest, keep=path)
+            if self.keep_per_day:
+                removed += self._cap_day(kind, created[:10])
+        self._unindex(removed)
+        return removed
+
+    def sync(self):
+        """
+        Register report files that were written without going through the
+        catalog (e.g. older runs). Directories unchanged since the last sync
+        are skipped. Returns the number of files added.
+        """
+        dirs = {d: os.stat(d).st_mtime_ns for d in self.dirs if os.path.isdir(d)}
+        dirs = {d: m for d, m in dirs.items() if self._dir_mtimes.get(d) != m}
+        if not dirs:
+            return 0
+        with self._lock:
+            known = {p for (p,) in self._conn.execute("SELECT path FROM reports")}
+        added = 0
+        for d in dirs:
+            with os.scandir(d) as it:
+                for e in it:
+                    if e.name.endswith(".md") and e.is_file() and _norm(e.path) not in known:
+                        self._insert_only(_norm(e.path))
+                        added += 1
+        self._dir_mtimes.update(dirs)
+        return added
+
+    def _insert_only(self, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO reports (path, kind, content_hash, created, size) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (path, report_kind(path), content_hash(data), report_created(path), len(data)),
+            )
+
+    # ---------- Queries ----------
+    def latest(self, kind, n=1, include_archived=True):
+        """
+        Newest `n` reports of `kind` as dicts (index range scan on kind, created).
+        Archived reports are included by default; read them with `read()`.
+        """
+        sql = (
+            "SELECT path, kind, batch_id, content_hash, created, size, archive FROM reports "
+            "WHERE kind = ?" + ("" if include_archived else " AND archive IS NULL") +
+            " ORDER BY created DESC LIMIT ?"
+        )
+        cols = ("path", "kind", "batch_id", "content_hash", "created", "size", "archive")
+        with self._lock:
+            rows = self._conn.execute(sql, (kind, int(n))).fetchall()
+        return [dict(zip(cols, r)) for r in rows]
+
+    def read(self, entry):
+        """Report text from disk or from its zip archive."""
+        if entry.get("archive"):
+            with zipfile.ZipFile(entry["archive"]) as zf:
+                return zf.read(os.path.basename(entry["path"])).decode("utf-8")
+        with open(entry["path"], "r", encoding="utf-8") as f:
+            return f.read()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM reports").fetchone()[0]
+
+    # ---------- Retention ----------
+    def _delete(self, rows):
+        """Delete files + catalog rows for [(id, path)]; returns deleted paths."""
+        for _, path in rows:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        self._conn.executemany("DELETE FROM reports WHERE id = ?", [(i,) for i, _ in rows])
+        return [p for _, p in rows]
+
+    def _dedupe(self, kind, digest, keep):
+        rows = self._conn.execute(
+            "SELECT id, path FROM reports WHERE kind = ? AND content_hash = ? "
+            "AND archive IS NULL AND path != ?",
+            (kind, digest, keep),
+        ).fetchall()
+        return self._delete(rows)
+
+    def _cap_day(self, kind, day):
+        rows = self._conn.execute(
+            "SELECT id, path FROM reports WHERE kind = ? AND archive IS NULL "
+            "AND created >= ? AND created < ? ORDER BY created DESC LIMIT -1 OFFSET ?",
+            (kind, day, day + "~", self.keep_per_day),
+        ).fetchall()
+        return self._delete(rows)
+
+    def apply_retention(self, now=None):
+        """
+        Full retention pass over the catalog: dedupe, keep_per_day and archiving.
+        Returns {"deleted": n, "archived": n}.
+        """
+        deleted, archived = [], []
+        with self._lock, self._conn:
+            if self.dedupe:
+                dupes = self._conn.execute(
+                    "SELECT id, path FROM ("
+                    "  SELECT id, path, ROW_NUMBER() OVER ("
+                    "    PARTITION BY kind, content_hash ORDER BY created DESC, id DESC) AS rn"
+                    "  FROM reports WHERE archive IS NULL) WHERE rn > 1"
+                ).fetchall()
+                deleted += self._delete(dupes)
+            if self.keep_per_day:
+                extra = self._conn.execute(
+                    "SELECT id, path FROM ("
+                    "  SELECT id, path, ROW_NUMBER() OVER ("
+                    "    PARTITION BY kind, substr(created, 1, 10) ORDER BY created DESC, id DESC) AS rn"
+                    "  FROM reports WHERE archive IS NULL) WHERE rn > ?",
+                    (self.keep_per_day,),
+                ).fetchall()
+                deleted += self._delete(extra)
+            if self.archive_after_days:
+                cutoff = ((now or datetime.now()) - timedelta(days=self.archive_after_days)
+                          ).strftime("%Y-%m-%d %H:%M:%S")
+                old = self._conn.execute(
+                    "SELECT id, path, kind, created FROM reports "
+                    "WHERE archive IS NULL AND created < ?", (cutoff,)
+                ).fetchall()
+                archived = self._archive(old)
+        self._unindex(deleted + archived)
+        return {"deleted": len(deleted), "archived": len(archived)}
+
+    def _archive(self, rows):
+        """Move reports into {archive_dir}/{kind}_{YYYY-MM}.zip; returns archived paths."""
+        groups = {}
+        for row in rows:
+            groups.setdefault((row[2], row[3][:7]), []).append(row)
+        done = []
+        os.makedirs(self.archive_dir, exist_ok=True)
+        for (kind, month), items in groups.items():
+            zpath = _norm(os.path.join(self.archive_dir, f"{kind}_{month}.zip"))
+            with zipfile.ZipFile(zpath, "a", compression=zipfile.ZIP_DEFLATED) as zf:
+                names = set(zf.namelist())
+                for doc_id, path, _, _ in items:
+                    if not os.path.exists(path):
+                        continue
+                    if os.path.basename(path) not in names:
+                        zf.write(path, arcname=os.path.basename(path))
+                    self._conn.execute("UPDATE reports SET archive = ? WHERE id = ?", (zpath, doc_id))
+                    done.append(path)
+        for path in done:
+            os.remove(path)
+        return done
+
+    @staticmethod
+    def _unindex(paths):
+        """Keep the search index in step with files removed by retention."""
+        if not paths:
+            return
+        try:
+            index = get_report_index()
+            for p in paths:
+                index.remove(p)
+        except Exception as e:
+            print(f"[WARN] report index cleanup failed: {e}")
+
+
+# ---------- Shared Instance ----------
+_shared, _shared_lock = None, threading.Lock()
+
+def get_report_catalog(cfg_path=CFG_PATH):
+    """Process-wide catalog instance (created on first use)."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = ReportCatalog.from_config(cfg_path)
+        return _shared
+
+def register_report(path, batch_id=None, cfg_path=CFG_PATH):
+    """Register a freshly written report in the catalog and search index; never fails the caller."""
+    try:
+        get_report_catalog(cfg_path).register(path, batch_id=batch_id)
+    except Exception as e:
+        print(f"[WARN] report catalog update failed for {path}: {e}")
+    index_report(path, cfg_path)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--config", default=CFG_PATH)
+    ap.add_argument("--sync", action="store_true", help="register unregistered report files")
+    ap.add_argument("--retention", action="store_true", help="apply dedupe / keep_per_day / archiving")
+    args = ap.parse_args()
+
+    catalog = ReportCatalog.from_config(args.config)
+    if args.sync:
+        print(f"[OK] registered {catalog.sync()} report(s)")
+    if args.retention:
+        print(f"[OK] retention: {catalog.apply_retention()}")
+    print(f"[OK] catalog holds {len(catalog)} report(s) → {catalog.path}")
+
+
+if __name__ == "__main__":
+    main()
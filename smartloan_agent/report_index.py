@@ -0,0 +1,465 @@
+"""
+Local BM25 search index over generated reports (no external service).
+
+- Inverted index persisted in SQLite: one row of postings per (term, segment),
+  stored as packed arrays; every sync/add writes one new segment, so index
+  updates cost O(new documents). Old segments are merged by `compact()`.
+- Queries load only the postings of the query terms (cached in memory) and
+  score them with vectorised BM25, so search stays in the millisecond range
+  for ~100k reports.
+- Filters: report kind (compliance_report / llm_summary / governance),
+  created date range, and a feature the report must mention (e.g. fico_mid).
+- Several instances (threads, processes) may share one index file: writes
+  made by another connection are picked up via `PRAGMA data_version`.
+
+    idx = ReportIndex.from_config()
+    idx.sync()
+    idx.search("fico_mid drift alert", feature="fico_mid", since="2025-09-01")
+"""
+import os, re, sqlite3, threading
+from collections import Counter, defaultdict
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import yaml
+
+CFG_PATH = "monitor/config.yaml"
+DEFAULT_INDEX_PATH = "monitor/cache/report_index.sqlite"
+DEFAULT_DIRS = ("reports", "monitor/reports")
+REPORT_KINDS = ("compliance_report", "llm_summary", "governance")
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+MAX_SEGMENTS = 32     # compact() once more segments than this have accumulated
+SNIPPET_CHARS = 240
+
+# Dropped from free-text queries so BM25 ranks on the informative terms
+STOPWORDS = frozenset(
+    "a an and are did do does for from has have how in is it last of on or the "
+    "to was were what when where which who why with".split()
+)
+
+# compliance_report_20250901_2142, llm_summary_20250901_104319,
+# governance_2025-09-01T21-42-10.123456
+_TS_PATTERNS = (
+    (re.compile(r"(\d{8}_\d{6})"), "%Y%m%d_%H%M%S"),
+    (re.compile(r"(\d{8}_\d{4})"), "%Y%m%d_%H%M"),
+    (re.compile(r"(\d{4}-\d{2}-\d{2}T\d{2}-\d{2}-\d{2})"), "%Y-%m-%dT%H-%M-%S"),
+)
+_TOKEN_RX = re.compile(r"\w+")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,   -- never reused: stale postings keep dead ids
+    path TEXT UNIQUE NOT NULL,
+    kind TEXT NOT NULL,
+    created TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    length INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS docs_created ON docs(created);
+CREATE TABLE IF NOT EXISTS postings (
+    term TEXT NOT NULL,
+    seg INTEGER NOT NULL,
+    doc_ids BLOB NOT NULL,
+    tfs BLOB NOT NULL,
+    PRIMARY KEY (term, seg)
+) WITHOUT ROWID;
+"""
+
+
+# ---------- Helper Functions ----------
+def load_index_config(cfg_path=CFG_PATH):
+    """Read the `report_index:` section of config.yaml (empty dict if missing)."""
+    if not os.path.exists(cfg_path):
+        return {}
+    with open(cfg_path, "r", encoding="utf-8") as f:
+        cfg = yaml.safe_load(f) or {}
+    return cfg.get("report_index") or {}
+
+def tokenize(text):
+    """Lower-case word tokens; underscores are kept so fico_mid stays one term."""
+    return _TOKEN_RX.findall(str(text).lower())
+
+def query_terms(text):
+    return list(dict.fromkeys(t for t in tokenize(text) if t not in STOPWORDS))
+
+def report_kind(path):
+    """compliance_report / llm_summary / governance (or 'other') from the file name."""
+    name = os.path.basename(path)
+    return next((k for k in REPORT_KINDS if name.startswith(k)), "other")
+
+def report_created(path, mtime=None):
+    """Creation time from the timestamp in the file name, falling back to mtime."""
+    name = os.path.basename(path)
+    for rx, fmt in _TS_PATTERNS:
+        m = rx.search(name)
+        if m:
+            try:
+                return datetime.strptime(m.group(1), fmt).strftime("%Y-%m-%d %H:%M:%S")
+            except ValueError:
+                pass
+    if mtime is None:
+        mtime = os.path.getmtime(path)
+    return datetime.fromtimestamp(mtime).strftime("%Y-%m-%d %H:%M:%S")
+
+def _created_int(created):
+    """'2025-09-01 21:42:00' -> 20250901214200 (sortable integer)."""
+    return int(re.sub(r"\D", "", created)[:14].ljust(14, "0"))
+
+def _date_bound(value, end=False):
+    """'2025-09-01' -> inclusive integer bound on created time."""
+    digits = re.sub(r"\D", "", str(value))[:14]
+    return int(digits.ljust(14, "9" if end else "0"))
+
+def make_snippet(text, terms, n=SNIPPET_CHARS):
+    """Window of `text` around the first query term, terms in **bold**."""
+    flat = " ".join(str(text).split())
+    low = flat.lower()
+    hits = [i for i in (low.find(t) for t in terms) if i >= 0]
+    start = max(0, min(hits) - n // 4) if hits else 0
+    out = flat[start:start + n]
+    for t in terms:
+        out = re.sub(rf"(?i)\b({re.escape(t)})\b", r"**\1**", out)
+    return ("…" if start else "") + out + ("…" if start + n < len(flat) else "")
+
+
+class ReportIndex:
+    """
+    BM25 search over markdown reports in one or more directories.
+    Thread-safe (one connection guarded by a lock); safe to share per process.
+    """
+
+    def __init__(self, path=DEFAULT_INDEX_PATH, dirs=DEFAULT_DIRS):
+        self.path = path
+        self.dirs = list(dirs)
+        self._lock = threading.RLock()
+        if path != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._drop_legacy_schema()
+        self._conn.executescript(SCHEMA)
+        self._terms = {}        # term -> (doc_ids, tfs) cache
+        self._dir_mtimes = {}   # report dir -> mtime at the last sync
+        self._data_version = None
+        self._refresh()
+
+    @classmethod
+    def from_config(cls, cfg_path=CFG_PATH):
+        cfg = load_index_config(cfg_path)
+        return cls(
+            path=cfg.get("path", DEFAULT_INDEX_PATH),
+            dirs=cfg.get("dirs") or DEFAULT_DIRS,
+        )
+
+    def _drop_legacy_schema(self):
+        """
+        Indexes built before doc ids were AUTOINCREMENT may have postings of
+        deleted docs attached to a reused id; drop them so sync() rebuilds.
+        """
+        row = self._conn.execute("SELECT sql FROM sqlite_master WHERE name = 'docs'").fetchone()
+        if row and "AUTOINCREMENT" not in row[0].upper():
+            print(f"[WARN] rebuilding report index {self.path} (doc ids could be reused)")
+            with self._conn:
+                self._conn.execute("DROP TABLE IF EXISTS docs")
+                self._conn.execute("DROP TABLE IF EXISTS postings")
+
+    # ---------- In-memory doc table ----------
+    def _load_docs(self):
+        """Per-doc arrays indexed by doc id: live flag, length, created, kind."""
+        rows = self._conn.execute("SELECT id, kind, created, length FROM docs").fetchall()
+        size = (max((r[0] for r in rows), default=0) + 1) if rows else 1
+        self._live = np.zeros(size, dtype=bool)
+        self._length = np.zeros(size, dtype=np.float64)
+        self._created = np.zeros(size, dtype=np.int64)
+        self._kind = np.zeros(size, dtype=np.int8)
+        for doc_id, kind, created, length in rows:
+            self._set_doc(doc_id, kind, created, length)
+
+    def _refresh(self):
+        """
+        Reload the doc table and drop cached postings if another connection
+        committed since the last check (our own commits do not count).
+        """
+        version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if version != self._data_version:
+            self._data_version = version
+            self._load_docs()
+            self._terms.clear()
+
+    def _set_doc(self, doc_id, kind, created, length):
+        if doc_id >= len(self._live):
+            grow = max(doc_id + 1, 2 * len(self._live))
+            for name in ("_live", "_length", "_created", "_kind"):
+                arr = getattr(self, name)
+                new = np.zeros(grow, dtype=arr.dtype)
+                new[: len(arr)] = arr
+                setattr(self, name, new)
+        self._live[doc_id] = True
+        self._length[doc_id] = length
+        self._created[doc_id] = _created_int(created)
+        self._kind[doc_id] = REPORT_KINDS.index(kind) + 1 if kind in REPORT_KINDS else 0
+
+    def _postings(self, term):
+        """All (doc_ids, tfs) of one term across segments (cached)."""
+        if term not in self._terms:
+            rows = self._conn.execute(
+                "SELECT doc_ids, tfs FROM postings WHERE term = ? ORDER BY seg", (term,)
+            ).fetchall()
+            if rows:
+                ids = np.concatenate([np.frombuffer(r[0], dtype=np.int32) for r in rows])
+                tfs = np.concatenate([np.frombuffer(r[1], dtype=np.int32) for r in rows])
+                # docs committed by another connection after our last _refresh()
+                known = ids < len(self._live)
+                ids, tfs = ids[known], tfs[known]
+            else:
+                ids = tfs = np.zeros(0, dtype=np.int32)
+            self._terms[term] = (ids, tfs)
+        return self._terms[term]
+
+    # ---------- Updates ----------
+    def add_files(self, paths):
+        """
+        Index new or changed reports as one new segment; unchanged files are
+        skipped. Returns the number of files (re)indexed.
+        """
+        with self._lock:
+            self._refresh()
+            batch = defaultdict(list)   # term -> [(doc_id, tf)]
+            n = 0
+            with self._conn:
+                for path in paths:
+                    path = os.path.normpath(path)
+                    st = os.stat(path)
+                    row = self._conn.execute(
+                        "SELECT id, mtime_ns, size FROM docs WHERE path = ?", (path,)
+                    ).fetchone()
+                    if row and (row[1], row[2]) == (st.st_mtime_ns, st.st_size):
+                        continue
+                    if row:
+                        self._delete(row[0])
+                    with open(path, "r", encoding="utf-8", errors="replace") as f:
+                        tokens = tokenize(f.read())
+                    kind = report_kind(path)
+                    created = report_created(path, st.st_mtime_ns / 1e9)
+                    doc_id = self._conn.execute(
+                        "INSERT INTO docs (path, kind, created, mtime_ns, size, length) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (path, kind, created, st.st_mtime_ns, st.st_size, len(tokens)),
+                    ).lastrowid
+                    self._set_doc(doc_id, kind, created, len(tokens))
+                    for term, tf in Counter(tokens).items():
+                        batch[term].append((doc_id, tf))
+                    n += 1
+                if batch:
+                    self._write_segment(batch)
+            if self._segment_count() > MAX_SEGMENTS:
+                self.compact()
+            return n
+
+    def add_file(self, path):
+        """Index (or re-index) one report right after it is written."""
+        return self.add_files([path]) > 0
+
+    def _write_segment(self, batch):
+        seg = (self._conn.execute("SELECT MAX(seg) FROM postings").fetchone()[0] or 0) + 1
+        self._conn.executemany(
+            "INSERT INTO postings (term, seg, doc_ids, tfs) VALUES (?, ?, ?, ?)",
+            [
+                (term,
+                 seg,
+                 np.array([d for d, _ in pairs], dtype=np.int32).tobytes(),
+                 np.array([t for _, t in pairs], dtype=np.int32).tobytes())
+                for term, pairs in batch.items()
+            ],
+        )
+        for term in batch:
+            self._terms.pop(term, None)
+
+    def _segment_count(self):
+        return self._conn.execute("SELECT COUNT(DISTINCT seg) FROM postings").fetchone()[0]
+
+    def _delete(self, doc_id):
+        """Drop a doc; its postings become garbage until the next compact()."""
+        self._conn.execute("DELETE FROM docs WHERE id = ?", (doc_id,))
+        if doc_id < len(self._live):
+            self._live[doc_id] = False
+
+    def remove(self, path):
+        with self._lock, self._conn:
+            self._refresh()
+            row = self._conn.execute(
+                "SELECT id FROM docs WHERE path = ?", (os.path.normpath(path),)
+            ).fetchone()
+            if row:
+                self._delete(row[0])
+
+    def compact(self):
+        """Merge all segments into one and drop postings of deleted docs."""
+        with self._lock, self._conn:
+            self._refresh()
+            merged = {}
+            for term, ids, tfs in self._conn.execute("SELECT term, doc_ids, tfs FROM postings"):
+                ids = np.frombuffer(ids, dtype=np.int32)
+                tfs = np.frombuffer(tfs, dtype=np.int32)
+                # ids we have not loaded yet belong to another writer: keep them
+                keep = np.ones(len(ids), dtype=bool)
+                inside = ids < len(self._live)
+                keep[inside] = self._live[ids[inside]]
+                prev = merged.get(term)
+                if prev is None:
+                    merged[term] = ([ids[keep]], [tfs[keep]])
+                else:
+                    prev[0].append(ids[keep])
+                    prev[1].append(tfs[keep])
+            self._conn.execute("DELETE FROM postings")
+            self._conn.executemany(
+                "INSERT INTO postings (term, seg, doc_ids, tfs) VALUES (?, 1, ?, ?)",
+                [
+                    (term, np.concatenate(i).tobytes(), np.concatenate(t).tobytes())
+                    for term, (i, t) in merged.items() if sum(len(x) for x in i)
+                ],
+            )
+            self._terms.clear()
+
+    def sync(self, prune=True, full=False):
+        """
+        Bring the index up to date with the report directories.
+        Directories whose mtime is unchanged since the last sync are skipped and
+        only files not yet indexed are read (reports are write-once; writers
+        re-register rewritten files via `add_file`). `full=True` also re-checks
+        mtime/size of every known file. With `prune`, deleted files are dropped.
+        Returns {"added": n, "removed": n}.
+        """
+        dirs = {}
+        for d in self.dirs:
+            if os.path.isdir(d):
+                mtime = os.stat(d).st_mtime_ns
+                if full or self._dir_mtimes.get(d) != mtime:
+                    dirs[d] = mtime
+        if not dirs:
+            return {"added": 0, "removed": 0}
+
+        with self._lock:
+            self._refresh()
+            known = {p: (m, s) for p, m, s in self._conn.execute(
+                "SELECT path, mtime_ns, size FROM docs"
+            )}
+        todo, removed = [], 0
+        for d in dirs:
+            seen = set()
+            with os.scandir(d) as it:
+                for e in it:
+                    if not (e.name.endswith(".md") and e.is_file()):
+                        continue
+                    p = os.path.normpath(e.path)
+                    seen.add(p)
+                    if p not in known:
+                        todo.append(p)
+                    elif full:
+                        st = e.stat()
+                        if known[p] != (st.st_mtime_ns, st.st_size):
+                            todo.append(p)
+            if prune:
+                root = os.path.normpath(d)
+                for p in known:
+                    if os.path.dirname(p) == root and p not in seen:
+                        self.remove(p)
+                        removed += 1
+        added = self.add_files(todo) if todo else 0
+        self._dir_mtimes.update(dirs)
+        return {"added": added, "removed": removed}
+
+    # ---------- Queries ----------
+    def _mask(self, kind=None, feature=None, since=None, until=None):
+        mask = self._live.copy()
+        if kind:
+            code = REPORT_KINDS.index(kind) + 1 if kind in REPORT_KINDS else 0
+            mask &= self._kind == code
+        if since:
+            mask &= self._created >= _date_bound(since)
+        if until:
+            mask &= self._created <= _date_bound(until, end=True)
+        if feature:
+            has = np.zeros_like(mask)
+            ids, _ = self._postings(str(feature).lower())
+            has[ids] = True
+            mask &= has
+        return mask
+
+    def search(self, query="", top_k=5, kind=None, feature=None, since=None, until=None):
+        """
+        BM25-ranked reports matching `query` (newest first when the query is empty).
+        Returns [{path, kind, created, score, snippet}].
+        """
+        with self._lock:
+            self._refresh()
+            mask = self._mask(kind, feature, since, until)
+            n_live = int(self._live.sum())
+            terms = query_terms(query)
+            if terms and n_live:
+                avgdl = max(self._length[self._live].mean(), 1.0)
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self._length / avgdl)
+                scores = np.zeros(len(self._live), dtype=np.float64)
+                for term in terms:
+                    ids, tfs = self._postings(term)
+                    df = int(self._live[ids].sum())
+                    if not df:
+                        continue
+                    idf = np.log(1 + (n_live - df + 0.5) / (df + 0.5))
+                    scores[ids] += idf * tfs * (BM25_K1 + 1) / (tfs + norm[ids])
+                scores[~mask] = 0.0
+                cand = np.flatnonzero(scores > 0)
+                if len(cand) > top_k:
+                    cand = cand[np.argpartition(-scores[cand], top_k - 1)[:top_k]]
+                order = cand[np.lexsort((-self._created[cand], -scores[cand]))]
+            else:
+                cand = np.flatnonzero(mask)
+                order = cand[np.argsort(-self._created[cand], kind="stable")[:top_k]]
+                scores = np.zeros(len(self._live))
+
+            hits = []
+            for doc_id in order.tolist():
+                path, kind_, created = self._conn.execute(
+                    "SELECT path, kind, created FROM docs WHERE id = ?", (doc_id,)
+                ).fetchone()
+                hits.append({"path": path, "kind": kind_, "created": created,
+                             "score": round(float(scores[doc_id]), 4)})
+
+        for h in hits:
+            try:
+                with open(h["path"], "r", encoding="utf-8", errors="replace") as f:
+                    h["snippet"] = make_snippet(f.read(), terms or ([str(feature).lower()] if feature else []))
+            except OSError:
+                h["snippet"] = ""
+        return hits
+
+    def __len__(self):
+        with self._lock:
+            self._refresh()
+            return int(self._live.sum())
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# ---------- Shared Instance ----------
+_shared, _shared_lock = None, threading.Lock()
+
+def get_report_index(cfg_path=CFG_PATH):
+    """Process-wide index instance (created on first use)."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = ReportIndex.from_config(cfg_path)
+        return _shared
+
+def index_report(path, cfg_path=CFG_PATH):
+    """Register a freshly written report; never fails the caller."""
+    try:
+        get_report_index(cfg_path).add_file(path)
+    except Exception as e:
+        print(f"[WARN] report index update failed for {path}: {e}")
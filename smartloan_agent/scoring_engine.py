@@ -0,0 +1,277 @@
+"""
+Batch scoring engine: writes the `score` column the monitor consumes.
+
+- The model (config `scoring.model`, pinned to `scoring.model_version`) comes
+  from the shared model pool, so it is deserialised once per process
+- The input schema is checked against the model's training features before
+  any row is scored (missing features fail unless `allow_missing: true`)
+- CSV and Parquet inputs are read and scored chunk by chunk; XGBoost /
+  LightGBM use their native threads, other models score sub-blocks of each
+  chunk on a thread pool; output is written to a temp file and swapped in
+- Returns rows, elapsed seconds and rows/sec (CSV runs are bound by pandas
+  text I/O; Parquet inputs score roughly an order of magnitude faster)
+
+    python -m smartloan_agent.scoring_engine --input monitor/X_new.csv
+"""
+import os, time, argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import yaml
+
+from .model_pool import get_model_pool, artifact_exists, resolve_model_path
+from .shap_engine import DEFAULT_MODELS, model_feature_names, safe_feature_name, feature_matrix
+
+CFG_PATH = "monitor/config.yaml"
+
+
+def load_scoring_config(cfg_path=CFG_PATH):
+    """`scoring:` section merged with `models:`, `model_version` and the label columns."""
+    cfg = {}
+    if os.path.exists(cfg_path):
+        with open(cfg_path, "r", encoding="utf-8") as f:
+            cfg = yaml.safe_load(f) or {}
+    labels = cfg.get("labels") or {}
+    out = {
+        "enabled": False,
+        "model": "xgb",
+        "model_version": None,
+        "input": "monitor/X_new.csv",
+        "output": None,
+        "chunk_size": 50000,
+        "n_jobs": -1,
+        "allow_missing": False,
+        "pool_size": 3,
+    }
+    out.update(cfg.get("scoring") or {})
+    out["models"] = dict(cfg.get("models") or DEFAULT_MODELS)
+    out["model_version"] = str(out["model_version"] or cfg.get("model_version", "v1.0"))
+    out["score_col"] = labels.get("p_col", "score")
+    out["exclude_cols"] = [labels.get("y_col", "label"), out["score_col"]]
+    return out
+
+def _n_jobs(n):
+    n = int(n or -1)
+    return (os.cpu_count() or 1) if n <= 0 else n
+
+
+# ---------- Schema ----------
+def check_schema(columns, features, exclude=()):
+    """
+    Compare input columns with the model's training features.
+    Returns {n_features, missing, extra}; sanitised (XGBoost) names match
+    their original column.
+    """
+    columns = list(columns)
+    have = set(columns) | {safe_feature_name(c) for c in columns}
+    missing = [f for f in features if f not in have]
+    used = {safe_feature_name(f) for f in features}
+    extra = [c for c in columns if c not in set(exclude) and safe_feature_name(c) not in used]
+    return {"n_features": len(features), "missing": missing, "extra": extra}
+
+
+# ---------- Readers / writers ----------
+def _is_parquet(path):
+    return str(path).lower().endswith((".parquet", ".pq"))
+
+def read_columns(path):
+    if _is_parquet(path):
+        import pyarrow.parquet as pq
+        return pq.ParquetFile(path).schema_arrow.names
+    return list(pd.read_csv(path, nrows=0, encoding="utf-8-sig").columns)
+
+def iter_chunks(path, chunk_size):
+    """DataFrame chunks of a CSV or Parquet file."""
+    if _is_parquet(path):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        # round_trip keeps the untouched columns byte-identical when rewritten
+        yield from pd.read_csv(path, chunksize=chunk_size, encoding="utf-8-sig",
+                               low_memory=False, float_precision="round_trip")
+
+class _ChunkWriter:
+    """Appends scored chunks to a CSV (single BOM + header) or Parquet file."""
+
+    def __init__(self, path):
+        self.path = path
+        self._f = None
+        self._pq = None
+
+    def write(self, df):
+        if _is_parquet(self.path):
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self._pq is None:
+                self._pq = pq.ParquetWriter(self.path, table.schema)
+            self._pq.write_table(table.cast(self._pq.schema))
+        else:
+            header = self._f is None
+            if header:
+                self._f = open(self.path, "w", encoding="utf-8-sig", newline="")
+            df.to_csv(self._f, header=header, index=False)
+
+    def close(self):
+        if self._pq is not None:
+            self._pq.close()
+        if self._f is not None:
+            self._f.close()
+
+
+# ---------- Prediction ----------
+def _is_tree_model(model):
+    return hasattr(model, "get_booster") or hasattr(model, "booster_")
+
+def set_model_threads(model, n_jobs):
+    """Give XGBoost / LightGBM all requested threads for prediction."""
+    if hasattr(model, "get_booster"):
+        model.get_booster().set_param({"nthread": n_jobs})
+    elif hasattr(model, "booster_") and hasattr(model, "set_params"):
+        model.set_params(n_jobs=n_jobs)
+
+def predict_scores(model, X, n_jobs=1, features=None):
+    """P(default) for a float32 matrix; non-tree models split rows over threads."""
+    if features is not None and not _is_tree_model(model) and hasattr(model, "feature_names_in_"):
+        X = pd.DataFrame(X, columns=features)
+    if _is_tree_model(model) or n_jobs <= 1 or len(X) < 2 * n_jobs:
+        return model.predict_proba(X)[:, 1]
+    blocks = np.array_split(np.arange(len(X)), n_jobs)
+    take = (lambda b: X.iloc[b]) if isinstance(X, pd.DataFrame) else (lambda b: X[b])
+    with ThreadPoolExecutor(n_jobs) as ex:
+        parts = list(ex.map(lambda b: model.predict_proba(take(b))[:, 1], blocks))
+    return np.concatenate(parts)
+
+
+# ---------- Engine ----------
+class ScoringEngine:
+    """Scores batch files with one pinned model version held warm in the model pool."""
+
+    def __init__(self, models=None, model="xgb", model_version="v1.0", chunk_size=50000,
+                 n_jobs=-1, allow_missing=False, score_col="score", exclude_cols=("label", "score"),
+                 pool_size=3):
+        self.models = dict(models or DEFAULT_MODELS)
+        self.model = model
+        self.model_version = str(model_version)
+        self.chunk_size = max(1, int(chunk_size))
+        self.n_jobs = _n_jobs(n_jobs)
+        self.allow_missing = bool(allow_missing)
+        self.score_col = score_col
+        self.exclude_cols = list(exclude_cols)
+        self.pool = get_model_pool(pool_size)
+
+    @classmethod
+    def from_config(cls, cfg_path=CFG_PATH):
+        cfg = load_scoring_config(cfg_path)
+        return cls(
+            models=cfg["models"], model=cfg["model"], model_version=cfg["model_version"],
+            chunk_size=cfg["chunk_size"], n_jobs=cfg["n_jobs"],
+            allow_missing=cfg["allow_missing"], score_col=cfg["score_col"],
+            exclude_cols=cfg["exclude_cols"], pool_size=cfg["pool_size"],
+        )
+
+    def available(self, name=None):
+        path = self.models.get(name or self.model)
+        return bool(path) and artifact_exists(path, self.model_version)
+
+    def load(self, name=None):
+        """(model, key, features) for the pinned version."""
+        name = name or self.model
+        if name not in self.models:
+            raise KeyError(f"unknown model '{name}' (configured: {list(self.models)})")
+        model, key = self.pool.get(name, self.models[name], self.model_version)
+        set_model_threads(model, self.n_jobs)
+        return model, key, model_feature_names(model)
+
+    def validate(self, columns, name=None):
+        """Schema check of input columns against the model; raises on missing features."""
+        model, key, features = self.load(name)
+        if features is None:
+            return {"n_features": None, "missing": [], "extra": []}
+        schema = check_schema(columns, features, self.exclude_cols)
+        if schema["missing"]:
+            msg = (f"input is missing {len(schema['missing'])} of {len(features)} model features "
+                   f"for {key.rsplit(':', 1)[0]}, e.g. {schema['missing'][:5]}")
+            if not self.allow_missing:
+                raise ValueError(msg)
+            print(f"[WARN] {msg} (scored as NaN)")
+        return schema
+
+    def score_frame(self, df, name=None):
+        """Score an in-memory frame; returns a float array."""
+        model, _, features = self.load(name)
+        X, names = feature_matrix(df, features, self.exclude_cols)
+        return predict_scores(model, X, self.n_jobs, names)
+
+    def score_file(self, input_path, output_path=None, name=None):
+        """
+        Score `input_path` chunk by chunk and write it with the score column to
+        `output_path` (default: in place). Returns a run summary dict.
+        """
+        name = name or self.model
+        output_path = output_path or input_path
+        model, key, features = self.load(name)
+        schema = self.validate(read_columns(input_path), name)
+
+        tmp = f"{output_path}.tmp{os.path.splitext(output_path)[1]}"
+        writer = _ChunkWriter(tmp)
+        t0 = time.perf_counter()
+        rows = chunks = 0
+        try:
+            for chunk in iter_chunks(input_path, self.chunk_size):
+                X, names = feature_matrix(chunk, features, self.exclude_cols)
+                chunk[self.score_col] = predict_scores(model, X, self.n_jobs, names)
+                writer.write(chunk)
+                rows += len(chunk)
+                chunks += 1
+        except Exception:
+            writer.close()
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        writer.close()
+        os.replace(tmp, output_path)
+
+        secs = time.perf_counter() - t0
+        return {
+            "model": name,
+            "model_version": self.model_version,
+            "model_key": key,
+            "input": input_path,
+            "output": output_path,
+            "rows": rows,
+            "chunks": chunks,
+            "seconds": round(secs, 3),
+            "rows_per_sec": round(rows / secs, 1) if secs > 0 else None,
+            "n_jobs": self.n_jobs,
+            "schema_missing": len(schema["missing"]),
+            "schema_extra": len(schema["extra"]),
+        }
+
+
+def score_batch(input_path=None, output_path=None, cfg_path=CFG_PATH):
+    """Score a batch file with the configured model (None if the artifact is missing)."""
+    cfg = load_scoring_config(cfg_path)
+    engine = ScoringEngine.from_config(cfg_path)
+    if not engine.available():
+        print(f"[WARN] scoring skipped: model '{engine.model}' "
+              f"({resolve_model_path(engine.models.get(engine.model, ''), engine.model_version)}) not found")
+        return None
+    out = engine.score_file(input_path or cfg["input"], output_path or cfg["output"])
+    print(f"[OK] scored {out['rows']:,} rows with {out['model']}@{out['model_version']} "
+          f"in {out['seconds']}s ({out['rows_per_sec']:,} rows/sec) → {out['output']}")
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--input", default=None, help="CSV or Parquet (default: scoring.input)")
+    ap.add_argument("--output", default=None, help="default: scoring.output or in place")
+    args = ap.parse_args()
+    score_batch(args.input, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""
+Segment-level drift: PSI for every feature x segment in one bincount pass.
+
+Portfolio PSI can hide drift that is severe inside one segment (e.g.
+fico_mid only among RENT borrowers, or grades E-G). Segments come from
+one-hot groups (`grade_*`, `home_ownership_*`; the all-zero row is the
+dropped base level) or plain categorical columns (fairness groups).
+
+Per feature, every row gets a bin index on the reference edges and, per
+segment group, a global segment code; `code * n_bins + bin` over all
+groups is counted with a single np.bincount and reshaped to a
+segment x bin matrix, so PSI for all segments is one vectorised step.
+Segments with fewer than `min_count` rows (batch or reference) are
+suppressed.
+
+The reference holds the same segment x bin counts for the training data:
+
+    python -m smartloan_agent.segment_drift --build_reference --csv X_train_1.csv
+"""
+import os, json, pickle, argparse
+
+import numpy as np
+import pandas as pd
+import yaml
+
+from .drift_engine import REF_PATH, load_reference_stats
+from .drift_metrics import bin_index, psi_from_counts
+
+CFG_PATH = "monitor/config.yaml"
+DEFAULT_SEG_REF_PATH = "monitor/reference_segments.pkl"
+DEFAULT_GROUPS = {
+    "grade": {"prefix": "grade_", "base": "A", "merge": {"E-G": ["E", "F", "G"]}},
+    "home_ownership": {"prefix": "home_ownership_", "base": "OTHER"},
+}
+
+
+def load_segment_config(cfg_path=CFG_PATH):
+    """`segment_drift:` section of config.yaml with defaults."""
+    cfg = {}
+    if os.path.exists(cfg_path):
+        with open(cfg_path, "r", encoding="utf-8") as f:
+            cfg = yaml.safe_load(f) or {}
+    out = {
+        "enabled": True,
+        "groups": DEFAULT_GROUPS,
+        "columns": [],
+        "min_count": 50,
+        "top_n": 10,
+        "reference_path": DEFAULT_SEG_REF_PATH,
+    }
+    out.update(cfg.get("segment_drift") or {})
+    return out
+
+
+# ---------- Segments ----------
+def segment_codes(df, name, spec):
+    """
+    (codes, labels) for one segment group. One-hot groups: code 0 is the
+    base level (no column set). `merge` maps a new label to member levels.
+    Returns (None, None) if the batch has none of the group's columns.
+    """
+    if isinstance(spec, dict) and spec.get("prefix"):
+        cols = [c for c in df.columns if c.startswith(spec["prefix"])]
+        if not cols:
+            return None, None
+        levels = [spec.get("base", "base")] + [c[len(spec["prefix"]):] for c in cols]
+        X = df[cols].apply(pd.to_numeric, errors="coerce").fillna(0).to_numpy() > 0
+        # first set column (1-based) per row, 0 when none is set
+        codes = np.where(X.any(axis=1), X.argmax(axis=1) + 1, 0)
+    else:
+        col = spec.get("column", name) if isinstance(spec, dict) else name
+        if col not in df.columns:
+            return None, None
+        cat = pd.Categorical(df[col].astype(str))
+        codes, levels = cat.codes.astype(np.int64), list(cat.categories)
+
+    merge = (spec or {}).get("merge") if isinstance(spec, dict) else None
+    if merge:
+        labels = []
+        lookup = np.empty(len(levels), dtype=np.int64)
+        member_of = {m: new for new, members in merge.items() for m in members}
+        for i, lvl in enumerate(levels):
+            lab = member_of.get(lvl, lvl)
+            if lab not in labels:
+                labels.append(lab)
+            lookup[i] = labels.index(lab)
+        return lookup[codes], labels
+    return codes, levels
+
+def all_segments(df, seg_cfg):
+    """[(group, labels, codes)] for every configured group present in the batch."""
+    specs = dict(seg_cfg.get("groups") or {})
+    for col in seg_cfg.get("columns") or []:
+        specs.setdefault(col, {"column": col})
+    out = []
+    for name, spec in specs.items():
+        codes, labels = segment_codes(df, name, spec)
+        if codes is not None:
+            out.append((name, labels, codes))
+    return out
+
+
+# ---------- Counting ----------
+def segment_bin_counts(df, feature, edges, segments):
+    """
+    Segment x bin counts of one feature for all segment groups with a single
+    bincount. Returns {group: int array [n_segments, n_bins]}.
+    """
+    nb = len(edges) - 1
+    b = bin_index(df[feature], edges)
+    ok = b >= 0
+    keys, offsets, off = [], {}, 0
+    for name, labels, codes in segments:
+        keys.append((off + codes[ok]) * nb + b[ok])
+        offsets[name] = (off, len(labels))
+        off += len(labels)
+    counts = np.bincount(np.concatenate(keys), minlength=off * nb).reshape(off, nb)
+    return {name: counts[o:o + k] for name, (o, k) in offsets.items()}
+
+
+# ---------- Reference ----------
+def build_segment_reference(df, ref_stats, seg_cfg):
+    """Segment x bin counts of the reference data on the reference bin edges."""
+    segments = all_segments(df, seg_cfg)
+    out = {"groups": {name: labels for name, labels, _ in segments}, "features": {}}
+    for feat, st in ref_stats.items():
+        if feat in df.columns and st.get("bins") is not None:
+            counts = segment_bin_counts(df, feat, st["bins"], segments)
+            out["features"][feat] = {g: c.tolist() for g, c in counts.items()}
+    return out
+
+def load_segment_reference(path=DEFAULT_SEG_REF_PATH):
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+# ---------- Drift ----------
+def segment_drift_table(df_new, ref_stats, seg_ref, seg_cfg):
+    """
+    One row per (feature, group, segment) with enough rows on both sides:
+    feature, group, segment, psi, n_new, n_ref (sorted by psi desc).
+    """
+    min_count = int(seg_cfg.get("min_count", 50))
+    segments = [s for s in all_segments(df_new, seg_cfg) if s[0] in seg_ref["groups"]]
+    frames = []
+    for feat, ref_counts in seg_ref["features"].items():
+        if feat not in df_new.columns or feat not in ref_stats:
+            continue
+        new_counts = segment_bin_counts(df_new, feat, ref_stats[feat]["bins"], segments)
+        for name, labels, _ in segments:
+            ref_labels = seg_ref["groups"][name]
+            new = new_counts[name]
+            # align batch segments to the reference's segment order
+            ref = np.zeros_like(new)
+            rc = np.asarray(ref_counts[name])
+            pos = {lab: i for i, lab in enumerate(ref_labels)}
+            idx = np.array([pos.get(lab, -1) for lab in labels])
+            ref[idx >= 0] = rc[idx[idx >= 0]]
+            n_new, n_ref = new.sum(axis=1), ref.sum(axis=1)
+            keep = (n_new >= min_count) & (n_ref >= min_count)
+            if not keep.any():
+                continue
+            frames.append(pd.DataFrame({
+                "feature": feat,
+                "group": name,
+                "segment": np.asarray(labels, dtype=object)[keep],
+                "psi": psi_from_counts(new[keep], ref[keep]),
+                "n_new": n_new[keep],
+                "n_ref": n_ref[keep],
+            }))
+    if not frames:
+        return pd.DataFrame(columns=["feature", "group", "segment", "psi", "n_new", "n_ref"])
+    return pd.concat(frames, ignore_index=True).sort_values("psi", ascending=False).reset_index(drop=True)
+
+def summarize_segment_drift(seg_df, top_n=10):
+    """Batch-level fields: worst feature-segment pair and top-N JSON."""
+    out = {"seg_psi_max_value": None, "seg_psi_max_feature": None, "seg_psi_max_segment": None,
+           "top_segment_drift_json": "[]"}
+    if seg_df is None or seg_df.empty:
+        return out
+    top = seg_df.head(top_n)
+    r = top.iloc[0]
+    out.update({
+        "seg_psi_max_value": float(r["psi"]),
+        "seg_psi_max_feature": r["feature"],
+        "seg_psi_max_segment": f"{r['group']}={r['segment']}",
+        "top_segment_drift_json": json.dumps([
+            {"feature": f, "segment": f"{g}={s}", "psi": round(float(p), 4), "n": int(n)}
+            for f, g, s, p, n in top[["feature", "group", "segment", "psi", "n_new"]].itertuples(index=False)
+        ], ensure_ascii=False),
+    })
+    return out
+
+def segment_drift(df_new, ref_stats, seg_cfg):
+    """(table, summary) for one batch, or (None, None) without a segment reference."""
+    seg_ref = load_segment_reference(seg_cfg["reference_path"])
+    if seg_ref is None:
+        print(f"[WARN] segment drift skipped: no reference at {seg_cfg['reference_path']} "
+              f"(build it with: python -m smartloan_agent.segment_drift --build_reference)")
+        return None, None
+    table = segment_drift_table(df_new, ref_stats, seg_ref, seg_cfg)
+    return table, summarize_segment_drift(table, int(seg_cfg.get("top_n", 10)))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--build_reference", action="store_true")
+    ap.add_argument("--csv", default="X_train_1.csv", help="reference dataset")
+    args = ap.parse_args()
+    if not args.build_reference:
+        ap.print_help()
+        return
+    seg_cfg = load_segment_config()
+    ref = build_segment_reference(pd.read_csv(args.csv), load_reference_stats(REF_PATH), seg_cfg)
+    with open(seg_cfg["reference_path"], "wb") as f:
+        pickle.dump(ref, f)
+    print(f"[OK] segment reference ({len(ref['features'])} features, "
+          f"groups: {', '.join(ref['groups'])}) → {seg_cfg['reference_path']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,451 @@
+"""
+On-demand SHAP engine for the monitored models.
+
+- Models (config `models:`) come from the shared model pool, keyed by
+  (name, model_version, file mtime); their explainers are cached alongside
+- Logistic regression: closed-form linear SHAP in log-odds space,
+  phi = coef * (x - training background mean), fully vectorised
+- XGBoost / LightGBM: exact TreeSHAP via the libraries' native contribution
+  output, computed in row chunks with all cores
+- Anything else falls back to shap.Explainer (slow; bounded sample recommended)
+- Results are cached by (batch hash, model version, sample) in memory and as
+  .npz files under `explain.cache_dir`; the least recently used files beyond
+  `explain.cache_max_files` or older than `explain.cache_ttl_days` are pruned
+
+    res = explain_batch(df, model_name="xgb", sample_size=2000)
+    bar = mean_abs_shap(res)          # feature, mean_abs_shap, share
+    swarm = beeswarm_frame(res, 10)   # long format for a beeswarm chart
+"""
+import os, re, time, hashlib, threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+import yaml
+
+from .model_pool import get_model_pool, artifact_exists, model_key
+
+CFG_PATH = "monitor/config.yaml"
+DEFAULT_CACHE_DIR = "monitor/cache/shap"
+DEFAULT_MODELS = {"lr": "models/lr_model.joblib", "xgb": "models/xgb_model.joblib"}
+MEMORY_CACHE_SIZE = 8   # explained batches kept in memory
+
+
+# ---------- Config ----------
+def load_explain_config(cfg_path=CFG_PATH):
+    """`explain:` section merged with `models:` and `model_version` from config.yaml."""
+    cfg = {}
+    if os.path.exists(cfg_path):
+        with open(cfg_path, "r", encoding="utf-8") as f:
+            cfg = yaml.safe_load(f) or {}
+    labels = cfg.get("labels") or {}
+    out = dict(cfg.get("explain") or {})
+    out["models"] = dict(cfg.get("models") or DEFAULT_MODELS)
+    out["model_version"] = str(cfg.get("model_version", "v1.0"))
+    out["exclude_cols"] = [labels.get("y_col", "label"), labels.get("p_col", "score")]
+    return out
+
+
+@dataclass
+class ShapResult:
+    """SHAP values for one (batch, model): values[i, j] is row i, feature j (log-odds)."""
+    model_name: str
+    model_version: str
+    feature_names: list
+    values: np.ndarray          # float32 [n_rows, n_features]
+    base_value: float
+    data: np.ndarray            # float32 feature values of the explained rows
+    row_index: np.ndarray       # positions of the explained rows in the batch
+    batch_rows: int
+    meta: dict = field(default_factory=dict)
+
+
+# ---------- Feature Matrix ----------
+def model_feature_names(model):
+    """Feature names the model was trained with (None if unknown)."""
+    names = getattr(model, "feature_names_in_", None)
+    if names is None and hasattr(model, "get_booster"):
+        names = model.get_booster().feature_names
+    if names is None and hasattr(model, "steps"):
+        names = getattr(model.steps[0][1], "feature_names_in_", None)
+    return list(names) if names is not None else None
+
+def safe_feature_name(name):
+    return re.sub(r"[\[\]<]", "_", str(name))
+
+def feature_matrix(df, features=None, exclude=()):
+    """
+    Batch frame -> float32 matrix aligned to `features` (model order).
+    Booleans become 0/1; columns the batch lacks are filled with NaN and reported.
+    """
+    if features is None:
+        features = [c for c in df.columns if c not in set(exclude)]
+    # XGBoost rejects '[', ']' and '<' in names, so models may carry sanitised names
+    clean = {safe_feature_name(c): c for c in df.columns}
+    cols = [c if c in df.columns else clean.get(c, c) for c in features]
+    missing = [c for c in cols if c not in df.columns]
+    if missing:
+        print(f"[WARN] batch is missing {len(missing)} model feature(s), e.g. {missing[:3]}")
+    X = df.reindex(columns=cols)
+    X = X.apply(pd.to_numeric, errors="coerce") if (X.dtypes == object).any() else X
+    return X.to_numpy(dtype=np.float32, na_value=np.nan), list(features)
+
+def batch_hash(df):
+    """Content hash of a batch frame (row order and column names included)."""
+    h = hashlib.sha256()
+    h.update("\x1f".join(map(str, df.columns)).encode("utf-8"))
+    h.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return h.hexdigest()[:24]
+
+
+# ---------- Explainers ----------
+def _split_pipeline(model):
+    """sklearn Pipeline -> (preprocessing steps, final estimator)."""
+    if hasattr(model, "steps"):
+        return model[:-1], model.steps[-1][1]
+    return None, model
+
+class MissingBackground(ValueError):
+    """No training reference to centre attributions on."""
+
+class LinearShap:
+    """
+    Closed-form SHAP for (pipelines ending in) a binary linear classifier.
+    Attributions are relative to the training mean, taken from (in order)
+    `background` rows, a `background_mean_` array stored on the model (in the
+    estimator's input space) or a final centring scaler. Without one the
+    explainer is not built: centring on the batch itself would hide mean
+    shifts from attribution drift.
+    """
+
+    kind = "linear"
+
+    def __init__(self, model, background=None):
+        self.pre, est = _split_pipeline(model)
+        self.names = getattr(self.pre, "feature_names_in_", None)
+        self.coef = np.asarray(est.coef_, dtype=np.float64).reshape(-1)
+        self.intercept = float(np.ravel(est.intercept_)[0])
+        stored = getattr(model, "background_mean_", getattr(est, "background_mean_", None))
+        scaler = self.pre[-1] if self.pre is not None else None
+        if background is not None and len(background):
+            self.mean = np.nanmean(self._transform(background), axis=0)
+        elif stored is not None:
+            self.mean = np.asarray(stored, dtype=np.float64).reshape(-1)
+            if self.mean.size != self.coef.size:
+                raise ValueError("background_mean_ does not match the model's features")
+        elif getattr(scaler, "mean_", None) is not None and getattr(scaler, "with_mean", True):
+            self.mean = np.zeros(self.coef.size)  # standardised inputs: training mean is 0
+        else:
+            raise MissingBackground(
+                "linear SHAP needs a training background mean: set explain.background_csv "
+                "or store background_mean_ with the model"
+            )
+
+    def _transform(self, X):
+        if self.pre is not None:
+            Z = self.pre.transform(pd.DataFrame(X, columns=self.names) if self.names is not None else X)
+        else:
+            Z = X
+        Z = np.asarray(Z, dtype=np.float64)
+        if Z.shape[1] != self.coef.size:
+            raise ValueError("linear SHAP needs a 1:1 feature transform before the estimator")
+        return Z
+
+    def shap_values(self, X, chunk_size=None, n_jobs=None):
+        Z = self._transform(X)
+        phi = (np.nan_to_num(Z - self.mean)) * self.coef
+        base = float(self.intercept + self.mean @ self.coef)
+        return phi.astype(np.float32), base
+
+class TreeShap:
+    """Exact TreeSHAP through XGBoost / LightGBM native contributions, chunked."""
+
+    kind = "tree"
+
+    def __init__(self, model, n_jobs=-1):
+        self.model = model
+        self.lib = "lightgbm" if type(model).__module__.startswith("lightgbm") else "xgboost"
+        self.n_jobs = os.cpu_count() if (n_jobs is None or n_jobs < 1) else int(n_jobs)
+        if self.lib == "xgboost":
+            self.booster = model.get_booster() if hasattr(model, "get_booster") else model
+            self.booster.set_param({"nthread": self.n_jobs})
+
+    def _contribs(self, X):
+        if self.lib == "xgboost":
+            import xgboost as xgb
+            dm = xgb.DMatrix(X, feature_names=self.booster.feature_names, missing=np.nan,
+                             nthread=self.n_jobs)
+            return self.booster.predict(dm, pred_contribs=True)
+        return self.model.predict(X, pred_contrib=True, num_threads=self.n_jobs)
+
+    def shap_values(self, X, chunk_size=5000, n_jobs=None):
+        # chunks bound peak memory; each chunk uses all n_jobs threads
+        out, base = np.empty((len(X), X.shape[1]), dtype=np.float32), 0.0
+        for s in range(0, len(X), int(chunk_size)):
+            c = self._contribs(X[s:s + chunk_size])
+            out[s:s + len(c)] = c[:, :-1]
+            base = float(c[0, -1]) if len(c) else base
+        return out, base
+
+class GenericShap:
+    """Fallback: model-agnostic shap.Explainer on predicted probability."""
+
+    kind = "generic"
+
+    def __init__(self, model, background):
+        import shap
+        fn = lambda A: model.predict_proba(A)[:, 1]
+        self.explainer = shap.Explainer(fn, np.nan_to_num(background[:200]))
+
+    def shap_values(self, X, chunk_size=None, n_jobs=None):
+        ex = self.explainer(np.nan_to_num(X))
+        return np.asarray(ex.values, dtype=np.float32), float(np.ravel(ex.base_values)[0])
+
+def make_explainer(model, background=None, n_jobs=-1):
+    """Pick the fastest exact explainer for this model type."""
+    pre, est = _split_pipeline(model)
+    mod = type(est).__module__
+    if hasattr(est, "coef_") and np.asarray(est.coef_).ndim == 2 and len(est.coef_) == 1:
+        try:
+            return LinearShap(model, background)
+        except MissingBackground as e:
+            print(f"[WARN] {e}")
+            raise
+        except ValueError as e:
+            print(f"[WARN] linear SHAP unavailable ({e}); using generic explainer")
+    elif pre is None and (mod.startswith("xgboost") or mod.startswith("lightgbm")):
+        return TreeShap(model, n_jobs)
+    if background is None:
+        raise ValueError("generic SHAP needs background data")
+    return GenericShap(model, background)
+
+
+# ---------- Engine ----------
+class ShapEngine:
+    """
+    Loads models once (per file mtime + model_version), caches explainers and
+    explained batches. Thread-safe; one instance per process is enough.
+    """
+
+    def __init__(self, models=None, model_version="v1.0", cache_dir=DEFAULT_CACHE_DIR,
+                 sample_size=2000, chunk_size=5000, n_jobs=-1, background_csv=None,
+                 background_size=500, exclude_cols=("label", "score"),
+                 cache_max_files=64, cache_ttl_days=30):
+        self.models = dict(models or DEFAULT_MODELS)
+        self.model_version = str(model_version)
+        self.cache_dir = cache_dir
+        self.cache_max_files = int(cache_max_files or 0)   # 0 = no count cap
+        self.cache_ttl_s = float(cache_ttl_days) * 86400 if cache_ttl_days else None
+        self.sample_size = sample_size
+        self.chunk_size = int(chunk_size)
+        self.n_jobs = int(n_jobs)
+        self.background_csv = background_csv
+        self.background_size = int(background_size)
+        self.exclude_cols = list(exclude_cols)
+        self._lock = threading.Lock()
+        self._loaded = {}               # name -> (key, model, explainer)
+        self._results = OrderedDict()   # cache key -> ShapResult
+
+    @classmethod
+    def from_config(cls, cfg_path=CFG_PATH):
+        cfg = load_explain_config(cfg_path)
+        return cls(
+            models=cfg["models"],
+            model_version=cfg["model_version"],
+            cache_dir=cfg.get("cache_dir", DEFAULT_CACHE_DIR),
+            sample_size=cfg.get("sample_size", 2000),
+            chunk_size=cfg.get("chunk_size", 5000),
+            n_jobs=cfg.get("n_jobs", -1),
+            background_csv=cfg.get("background_csv"),
+            background_size=cfg.get("background_size", 500),
+            exclude_cols=cfg["exclude_cols"],
+            cache_max_files=cfg.get("cache_max_files", 64),
+            cache_ttl_days=cfg.get("cache_ttl_days", 30),
+        )
+
+    def available_models(self):
+        return [n for n, p in self.models.items() if p and artifact_exists(p, self.model_version)]
+
+    def version_key(self, name):
+        """Identity of a model artifact: name, version and file mtime."""
+        return model_key(name, self.models[name], self.model_version)
+
+    def load(self, name):
+        """(model, explainer, version_key); loaded once until the artifact changes."""
+        if name not in self.models:
+            raise KeyError(f"unknown model '{name}' (configured: {list(self.models)})")
+        model, key = get_model_pool().get(name, self.models[name], self.model_version)
+        with self._lock:
+            hit = self._loaded.get(name)
+            if hit and hit[0] == key:
+                return hit[1], hit[2], key
+        explainer = make_explainer(model, self._background(model), self.n_jobs)
+        with self._lock:
+            self._loaded[name] = (key, model, explainer)
+        print(f"[OK] loaded {name} ({type(model).__name__}) and {explainer.kind} explainer")
+        return model, explainer, key
+
+    def _background(self, model):
+        if not (self.background_csv and os.path.exists(self.background_csv)):
+            return None
+        bg = pd.read_csv(self.background_csv, nrows=max(self.background_size, 1))
+        X, _ = feature_matrix(bg, model_feature_names(model), self.exclude_cols)
+        return X
+
+    def explain(self, df, model_name="xgb", sample_size="config", seed=0, cache=True):
+        """
+        SHAP values for a batch frame. `sample_size`: int for a random sample
+        of rows, None for the full batch, "config" for `explain.sample_size`.
+        `cache=False` bypasses the result cache (no lookup, no .npz, no memory
+        copy), for one-off full-batch runs whose caller persists the result.
+        """
+        model, explainer, vkey = self.load(model_name)
+        n = self.sample_size if sample_size == "config" else sample_size
+        n = None if (n is None or int(n) <= 0 or int(n) >= len(df)) else int(n)
+
+        key = f"{batch_hash(df)}-{vkey}-{n or 'full'}-{seed}"
+        key = hashlib.sha1(key.encode("utf-8")).hexdigest()[:24]
+        cached = self._get_cached(key) if cache else None
+        if cached is not None:
+            return cached
+
+        rows = np.arange(len(df))
+        if n is not None:
+            rows = np.sort(np.random.default_rng(seed).choice(len(df), size=n, replace=False))
+        X, names = feature_matrix(df.iloc[rows], model_feature_names(model), self.exclude_cols)
+        values, base = explainer.shap_values(X, chunk_size=self.chunk_size, n_jobs=self.n_jobs)
+
+        res = ShapResult(
+            model_name=model_name, model_version=vkey, feature_names=names,
+            values=values, base_value=base, data=X, row_index=rows,
+            batch_rows=len(df), meta={"explainer": explainer.kind, "cache_key": key},
+        )
+        if cache:
+            self._put_cached(key, res)
+        return res
+
+    # ---------- Result cache ----------
+    def _cache_path(self, key):
+        return os.path.join(self.cache_dir, f"shap_{key}.npz")
+
+    def _get_cached(self, key):
+        with self._lock:
+            if key in self._results:
+                self._results.move_to_end(key)
+                return self._results[key]
+        path = self._cache_path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            z = np.load(path, allow_pickle=False)
+            res = ShapResult(
+                model_name=str(z["model_name"]), model_version=str(z["model_version"]),
+                feature_names=[str(x) for x in z["feature_names"]], values=z["values"],
+                base_value=float(z["base_value"]), data=z["data"], row_index=z["row_index"],
+                batch_rows=int(z["batch_rows"]),
+                meta={"explainer": str(z["explainer"]), "cache_key": key, "cached": True},
+            )
+        except Exception as e:
+            print(f"[WARN] unreadable SHAP cache {path}: {e}")
+            return None
+        try:
+            os.utime(path)   # mtime = last use, so pruning drops the least recently used
+        except OSError:
+            pass
+        self._remember(key, res)
+        return res
+
+    def _put_cached(self, key, res):
+        self._remember(key, res)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            np.savez(
+                self._cache_path(key), model_name=res.model_name,
+                model_version=res.model_version, feature_names=np.array(res.feature_names),
+                values=res.values, base_value=res.base_value, data=res.data,
+                row_index=res.row_index, batch_rows=res.batch_rows,
+                explainer=res.meta.get("explainer", ""),
+            )
+        except OSError as e:
+            print(f"[WARN] could not write SHAP cache: {e}")
+            return
+        self._prune_cache()
+
+    def _prune_cache(self):
+        """Drop cached .npz results past the TTL, then the oldest beyond cache_max_files."""
+        try:
+            files = sorted(
+                (e.stat().st_mtime, e.path) for e in os.scandir(self.cache_dir)
+                if e.name.startswith("shap_") and e.name.endswith(".npz")
+            )
+        except OSError:
+            return
+        cutoff = time.time() - self.cache_ttl_s if self.cache_ttl_s is not None else None
+        excess = len(files) - self.cache_max_files if self.cache_max_files else 0
+        for i, (mtime, path) in enumerate(files):
+            if i < excess or (cutoff is not None and mtime < cutoff):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _remember(self, key, res):
+        with self._lock:
+            self._results[key] = res
+            self._results.move_to_end(key)
+            while len(self._results) > MEMORY_CACHE_SIZE:
+                self._results.popitem(last=False)
+
+
+# ---------- Summaries ----------
+def mean_abs_shap(res):
+    """Per-feature mean |SHAP| and share of total attribution (sorted desc)."""
+    m = np.abs(res.values).mean(axis=0) if len(res.values) else np.zeros(len(res.feature_names))
+    total = float(m.sum())
+    out = pd.DataFrame({
+        "feature": res.feature_names,
+        "mean_abs_shap": m.astype(float),
+        "share": (m / total) if total > 0 else np.zeros_like(m, dtype=float),
+    })
+    return out.sort_values("mean_abs_shap", ascending=False).reset_index(drop=True)
+
+def beeswarm_frame(res, top_n=10, max_points=2000, seed=0):
+    """
+    Long-format frame for a beeswarm chart of the top-N features:
+    feature, shap, value, value_pct (0-1 rank within the feature, for colour).
+    """
+    top = mean_abs_shap(res).head(top_n)["feature"].tolist()
+    idx = np.arange(len(res.values))
+    if len(idx) > max_points:
+        idx = np.sort(np.random.default_rng(seed).choice(idx, size=max_points, replace=False))
+    cols = [res.feature_names.index(f) for f in top]
+    parts = []
+    for f, j in zip(top, cols):
+        v = res.data[idx, j].astype(float)
+        parts.append(pd.DataFrame({
+            "feature": f,
+            "shap": res.values[idx, j].astype(float),
+            "value": v,
+            "value_pct": pd.Series(v).rank(pct=True).to_numpy(),
+        }))
+    return pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(
+        columns=["feature", "shap", "value", "value_pct"]
+    )
+
+
+# ---------- Shared Instance ----------
+_shared, _shared_lock = None, threading.Lock()
+
+def get_shap_engine(cfg_path=CFG_PATH):
+    """Process-wide engine (models and explainers loaded once)."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = ShapEngine.from_config(cfg_path)
+        return _shared
+
+def explain_batch(df, model_name="xgb", sample_size="config", seed=0, cfg_path=CFG_PATH, cache=True):
+    return get_shap_engine(cfg_path).explain(
+        df, model_name, sample_size=sample_size, seed=seed, cache=cache
+    )
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Make smartloan_agent importable when pytest runs from any directory
+sys.path.insert(0, str(Path(__file__).parent.parent))
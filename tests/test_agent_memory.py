@@ -0,0 +1,22 @@
+from langchain_core.messages import AIMessage, HumanMessage
+
+from smartloan_agent.agent_memory import SUMMARY_HEADER, SUMMARY_ID, TokenBudgetMemory
+
+
+def _turns(n):
+    msgs = []
+    for i in range(n):
+        msgs += [HumanMessage(content=f"question {i} " + "about drift " * 20),
+                 AIMessage(content=f"answer {i} " + "fico_mid PSI alert " * 20)]
+    return msgs
+
+
+def test_summary_kept_when_recent_budget_equals_max():
+    memory = TokenBudgetMemory(max_tokens=400, recent_tokens=400)
+    assert memory.recent_tokens < memory.max_tokens
+
+    out = memory.compact(_turns(8))
+    assert out[0].id == SUMMARY_ID
+    assert out[0].content.startswith(SUMMARY_HEADER)
+    assert "Q: question" in out[0].content            # older turns still noted
+    assert memory.count(out) <= memory.max_tokens
@@ -0,0 +1,44 @@
+from langchain_core.tools import StructuredTool
+
+from smartloan_agent import agent_core
+from smartloan_agent.agent_core import GovernanceAgent
+from smartloan_agent.agent_fake_llm import SCRIPTS, ScriptedChatModel
+from smartloan_agent.agent_memory import SUMMARY_HEADER
+
+WEEKLY_TOOLS = ["get_current_metrics", "check_drift_metrics",
+                "run_fairness_audit", "generate_compliance_report"]
+
+
+def _canned_tool(name):
+    # Same name as the real tool, but no monitor/ data needed
+    def run(**kwargs):
+        return f'{{"tool": "{name}", "status": "OK", "detail": "{"x" * 200}"}}'
+    return StructuredTool.from_function(run, name=name, description=name)
+
+
+def test_stream_after_compaction_emits_only_current_turn(tmp_path, monkeypatch):
+    for name in WEEKLY_TOOLS:
+        monkeypatch.setattr(agent_core, name, _canned_tool(name))
+    agent = GovernanceAgent(
+        llm=ScriptedChatModel(script=SCRIPTS["weekly_audit"]),
+        fast_path=False,
+        memory_path=str(tmp_path / "memory.sqlite"),
+        max_history_tokens=600,
+    )
+
+    for turn in range(4):
+        events = list(agent.stream("Run the weekly audit.", session_id="audit"))
+        calls = [e["name"] for e in events if e["type"] == "tool_call"]
+        results = [e for e in events if e["type"] == "tool_result"]
+        answer = "".join(e["content"] for e in events if e["type"] == "token")
+
+        assert not [e for e in events if e["type"] == "error"]
+        assert sorted(calls) == sorted(WEEKLY_TOOLS), f"turn {turn}: {calls}"
+        assert len(results) == len(WEEKLY_TOOLS)
+        assert SUMMARY_HEADER not in answer
+        assert answer.strip() == SCRIPTS["weekly_audit"][-1]["content"]
+        assert events[-1]["content"].strip() == SCRIPTS["weekly_audit"][-1]["content"]
+
+    # the thread really was compacted, so the hook ran during these turns
+    state = agent.agent.get_state({"configurable": {"thread_id": "audit"}})
+    assert SUMMARY_HEADER in str(state.values["messages"][0].content)
@@ -0,0 +1,47 @@
+import numpy as np
+
+from smartloan_agent.drift_metrics import (
+    ColumnView, DEFAULT_THRESHOLDS, metric_level, wasserstein_metric,
+)
+
+
+def _ref(x, n_bins=20, n_quantiles=101):
+    bins = np.histogram_bin_edges(x, bins=n_bins)
+    counts, _ = np.histogram(x, bins=bins)
+    q = lambda p: float(np.quantile(x, p))
+    return {
+        "min": float(x.min()), "max": float(x.max()),
+        "p01": q(.01), "p05": q(.05), "p25": q(.25), "p50": q(.5),
+        "p75": q(.75), "p95": q(.95), "p99": q(.99),
+        "quantiles": np.quantile(x, np.linspace(0, 1, n_quantiles)).tolist(),
+        "bins": bins.tolist(), "counts": counts.tolist(),
+    }
+
+
+def _level(values, ref):
+    return metric_level(wasserstein_metric(ColumnView(values, ref)), DEFAULT_THRESHOLDS["wasserstein"])
+
+
+def test_single_outlier_does_not_change_wasserstein_level():
+    rng = np.random.default_rng(0)
+    train = rng.lognormal(0.0, 0.5, 5000)
+    batch = rng.lognormal(0.0, 0.5, 3000)
+    ref = _ref(train)
+    base = _level(batch, ref)
+    assert base == "OK"
+
+    # one extreme row in the batch ...
+    assert _level(np.r_[batch, 1e4], ref) == base
+    # ... or in the reference (its max sits at u = 1 of the quantile grid)
+    assert _level(batch, _ref(np.r_[train, 1e4])) == base
+
+    # the p01..p99 fallback (no stored grid) behaves the same way
+    fallback = {k: v for k, v in ref.items() if k != "quantiles"}
+    assert _level(np.r_[batch, 1e4], fallback) == _level(batch, fallback)
+
+
+def test_wasserstein_still_sees_a_shift():
+    rng = np.random.default_rng(1)
+    ref = _ref(rng.normal(0, 1, 5000))
+    assert _level(rng.normal(0, 1, 3000), ref) == "OK"
+    assert _level(rng.normal(0.5, 1, 3000), ref) == "ALERT"
@@ -0,0 +1,87 @@
+import os
+import sqlite3
+
+from smartloan_agent.report_index import ReportIndex
+
+
+def _write(path, text):
+    path.write_text(text, encoding="utf-8")
+    # make the rewrite visible to the (mtime_ns, size) change check
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+
+
+def _reports(tmp_path):
+    d = tmp_path / "reports"
+    d.mkdir()
+    for i in range(4):
+        _write(d / f"compliance_report_2025090{i + 1}_1200.md",
+               f"Report {i}: fico_mid drift ALERT, PSI above threshold. filler text {i}")
+    return d
+
+
+def test_readd_same_path_then_search(tmp_path):
+    d = _reports(tmp_path)
+    idx = ReportIndex(path=str(tmp_path / "index.sqlite"), dirs=[str(d)])
+    idx.sync()
+    newest = d / "compliance_report_20250904_1200.md"
+    for text in ("fico_mid drift rewritten", "fico_mid drift rewritten again, drift"):
+        _write(newest, text)
+        assert idx.add_file(str(newest))
+
+    ids, tfs = idx._postings("drift")
+    live = ids[idx._live[ids]]
+    assert len(live) == len(set(live.tolist())) == 4        # one posting per live doc
+    assert idx._live[ids].sum() <= len(idx)
+
+    hits = idx.search("fico_mid drift", top_k=10)
+    assert len(hits) == 4
+    assert all(h["score"] > 0 for h in hits)
+
+
+def test_remove_then_add_does_not_inherit_postings(tmp_path):
+    d = _reports(tmp_path)
+    idx = ReportIndex(path=str(tmp_path / "index.sqlite"), dirs=[str(d)])
+    idx.sync()
+    newest = d / "compliance_report_20250904_1200.md"
+    idx.remove(str(newest))
+    other = d / "llm_summary_20250905_120000.md"
+    _write(other, "executive summary without the search terms")
+    idx.add_file(str(other))
+
+    assert idx.search("fico_mid", kind="llm_summary") == []
+    assert len(idx.search("fico_mid drift", top_k=10)) == 3
+
+
+def test_legacy_index_is_rebuilt(tmp_path):
+    path = tmp_path / "index.sqlite"
+    con = sqlite3.connect(path)
+    con.execute("CREATE TABLE docs (id INTEGER PRIMARY KEY, path TEXT UNIQUE NOT NULL, kind TEXT NOT NULL,"
+                " created TEXT NOT NULL, mtime_ns INTEGER NOT NULL, size INTEGER NOT NULL,"
+                " length INTEGER NOT NULL)")
+    con.execute("INSERT INTO docs VALUES (1, 'x.md', 'other', '2025-09-01 00:00:00', 0, 0, 1)")
+    con.commit()
+    con.close()
+
+    d = _reports(tmp_path)
+    idx = ReportIndex(path=str(path), dirs=[str(d)])
+    assert len(idx) == 0
+    assert idx.sync()["added"] == 4
+
+
+def test_search_sees_docs_indexed_by_another_instance(tmp_path):
+    d = _reports(tmp_path)
+    path = str(tmp_path / "index.sqlite")
+    a = ReportIndex(path=path, dirs=[str(d)])
+    b = ReportIndex(path=path, dirs=[str(d)])
+    a.sync()
+    assert len(a.search("fico_mid drift", top_k=10)) == 4
+
+    new = d / "compliance_report_20250905_1200.md"
+    _write(new, "Report 5: log_annual_inc drift ALERT")
+    assert b.add_file(str(new))
+
+    hits = a.search("log_annual_inc drift", top_k=10)
+    assert hits[0]["path"] == os.path.normpath(str(new))
+    assert len(a.search("drift", top_k=10)) == len(a) == 5
+    assert a.sync() == {"added": 0, "removed": 0}
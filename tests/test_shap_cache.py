@@ -0,0 +1,40 @@
+import os
+import time
+
+import numpy as np
+
+from smartloan_agent.shap_engine import ShapEngine, ShapResult
+
+
+def _result(i):
+    return ShapResult(
+        model_name="lr", model_version="v1", feature_names=["a", "b"],
+        values=np.full((3, 2), i, dtype=np.float32), base_value=0.0,
+        data=np.zeros((3, 2), dtype=np.float32), row_index=np.arange(3), batch_rows=3,
+        meta={"explainer": "linear"},
+    )
+
+
+def _cached_keys(cache_dir):
+    return sorted(f[len("shap_"):-len(".npz")] for f in os.listdir(cache_dir))
+
+
+def test_npz_cache_keeps_most_recently_used(tmp_path):
+    engine = ShapEngine(cache_dir=str(tmp_path), cache_max_files=3, cache_ttl_days=None)
+    for i in range(3):
+        engine._put_cached(f"k{i}", _result(i))
+        os.utime(engine._cache_path(f"k{i}"), (i, i))   # k0 oldest
+
+    engine._results.clear()
+    assert engine._get_cached("k0") is not None      # disk hit refreshes k0
+    engine._put_cached("k3", _result(3))
+    assert _cached_keys(tmp_path) == ["k0", "k2", "k3"]
+
+
+def test_npz_cache_drops_expired_results(tmp_path):
+    engine = ShapEngine(cache_dir=str(tmp_path), cache_max_files=0, cache_ttl_days=1)
+    engine._put_cached("old", _result(0))
+    stale = time.time() - 2 * 86400
+    os.utime(engine._cache_path("old"), (stale, stale))
+    engine._put_cached("new", _result(1))
+    assert _cached_keys(tmp_path) == ["new"]